@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Button } from '@/components/ui/button.jsx'
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card.jsx'
 import { Badge } from '@/components/ui/badge.jsx'
@@ -25,6 +25,15 @@ import dynamodbIcon from './assets/dynamodb-icon.png'
 
 const API_BASE_URL = 'http://localhost:5000/api'
 
+// Latency budget for a services request; cells still scanning are reported as partial
+const SCAN_DEADLINE_MS = 8000
+
+// Resources per page; filtering and paging happen on the server
+const PAGE_SIZE = 100
+
+// Milliseconds to wait after the last keystroke before searching
+const SEARCH_DELAY_MS = 300
+
 // Service icon mapping
 const serviceIcons = {
   'EC2': ec2Icon,
@@ -57,14 +66,22 @@ const serviceColors = {
 
 function App() {
   const [services, setServices] = useState([])
+  const [totalCount, setTotalCount] = useState(0)
+  const [nextCursor, setNextCursor] = useState(null)
   const [regions, setRegions] = useState([])
   const [loading, setLoading] = useState(false)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState(null)
   const [searchTerm, setSearchTerm] = useState('')
+  const [searchQuery, setSearchQuery] = useState('')
   const [selectedRegion, setSelectedRegion] = useState('all')
   const [selectedService, setSelectedService] = useState('all')
   const [summary, setSummary] = useState({})
   const [lastUpdated, setLastUpdated] = useState(null)
+  const [incompleteCells, setIncompleteCells] = useState({ stale: [], missing: [] })
+  const [ready, setReady] = useState(false)
+  // Only the latest request's page is shown, even if an earlier one answers last
+  const requestId = useRef(0)
 
   const getServiceIcon = (serviceType) => {
     return serviceIcons[serviceType] || null
@@ -93,27 +110,80 @@ function App() {
     }
   }
 
+  const fetchSummary = async () => {
+    try {
+      const response = await fetch(`${API_BASE_URL}/services/summary`)
+      if (!response.ok) throw new Error('Failed to fetch summary')
+      const data = await response.json()
+      const totals = {}
+      for (const { service_counts } of Object.values(data.region_summary || {})) {
+        for (const [serviceType, count] of Object.entries(service_counts)) {
+          totals[serviceType] = (totals[serviceType] || 0) + count
+        }
+      }
+      setSummary(totals)
+    } catch (err) {
+      console.error('Error fetching summary:', err)
+    }
+  }
+
+  // Fetch one page of resources matching the filters, after cursor when loading more
+  const fetchPage = async (cursor = null) => {
+    const params = new URLSearchParams({ paginate: 'true', limit: PAGE_SIZE, deadline_ms: SCAN_DEADLINE_MS })
+    if (searchQuery) params.set('q', searchQuery)
+    if (selectedRegion !== 'all') params.set('regions', selectedRegion)
+    if (selectedService !== 'all') params.set('services', selectedService)
+    if (cursor) params.set('cursor', cursor)
+    const response = await fetch(`${API_BASE_URL}/services?${params}`)
+    if (!response.ok) {
+      const errorData = await response.json()
+      throw new Error(errorData.error || 'Failed to fetch services')
+    }
+    return response.json()
+  }
+
   const fetchServices = async () => {
+    const id = ++requestId.current
     setLoading(true)
     setError(null)
     try {
-      const response = await fetch(`${API_BASE_URL}/services`)
-      if (!response.ok) {
-        const errorData = await response.json()
-        throw new Error(errorData.error || 'Failed to fetch services')
-      }
-      const data = await response.json()
+      const data = await fetchPage()
+      if (id !== requestId.current) return
       setServices(data.resources || [])
-      setSummary(data.service_summary || {})
+      setTotalCount(data.total_count || 0)
+      setNextCursor(data.next_cursor || null)
+      setIncompleteCells({ stale: data.cache?.stale_cells || [], missing: data.cache?.missing_cells || [] })
       setLastUpdated(new Date().toLocaleString())
     } catch (err) {
+      if (id !== requestId.current) return
       setError(err.message)
       console.error('Error fetching services:', err)
     } finally {
-      setLoading(false)
+      if (id === requestId.current) setLoading(false)
     }
   }
 
+  const loadMore = async () => {
+    const id = requestId.current
+    setLoadingMore(true)
+    try {
+      const data = await fetchPage(nextCursor)
+      if (id !== requestId.current) return
+      setServices(previous => [...previous, ...(data.resources || [])])
+      setNextCursor(data.next_cursor || null)
+    } catch (err) {
+      setError(err.message)
+      console.error('Error fetching services:', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  const refresh = async () => {
+    await fetchServices()
+    await fetchSummary()
+  }
+
   const checkHealth = async () => {
     try {
       const response = await fetch(`${API_BASE_URL}/health`)
@@ -131,21 +201,25 @@ function App() {
       if (isHealthy) {
         await fetchRegions()
         await fetchServices()
+        await fetchSummary()
+        setReady(true)
       }
     }
     initializeApp()
   }, [])
 
-  const filteredServices = services.filter(service => {
-    const matchesSearch = service.name?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                         service.resource_id?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                         service.service_type?.toLowerCase().includes(searchTerm.toLowerCase())
-    const matchesRegion = selectedRegion === 'all' || service.region === selectedRegion
-    const matchesService = selectedService === 'all' || service.service_type === selectedService
-    return matchesSearch && matchesRegion && matchesService
-  })
+  useEffect(() => {
+    const timer = setTimeout(() => setSearchQuery(searchTerm.trim()), SEARCH_DELAY_MS)
+    return () => clearTimeout(timer)
+  }, [searchTerm])
+
+  // Filters are applied by the server, so each change fetches the first matching page
+  useEffect(() => {
+    if (ready) fetchServices()
+  }, [searchQuery, selectedRegion, selectedService])
 
-  const uniqueServiceTypes = [...new Set(services.map(s => s.service_type))].sort()
+  const serviceTypes = Object.keys(serviceIcons).sort()
+  const filtered = searchQuery !== '' || selectedRegion !== 'all' || selectedService !== 'all'
 
   return (
     <div className="min-h-screen bg-gradient-to-br from-blue-50 via-white to-purple-50 dark:from-gray-900 dark:via-gray-800 dark:to-gray-900">
@@ -166,7 +240,7 @@ function App() {
                 Last updated: {lastUpdated}
               </span>
             )}
-            <Button onClick={fetchServices} disabled={loading} className="bg-green-600 hover:bg-green-700 text-white">
+            <Button onClick={refresh} disabled={loading} className="bg-green-600 hover:bg-green-700 text-white">
               {loading ? (
                 <Loader2 className="h-4 w-4 animate-spin mr-2" />
               ) : (
@@ -185,6 +259,17 @@ function App() {
           </Alert>
         )}
 
+        {/* Partial Results Alert */}
+        {(incompleteCells.stale.length > 0 || incompleteCells.missing.length > 0) && (
+          <Alert>
+            <AlertCircle className="h-4 w-4" />
+            <AlertDescription>
+              Showing partial results: {incompleteCells.missing.length} region/service scans did not finish in time
+              and {incompleteCells.stale.length} are from an earlier scan. Refresh to load them once they complete.
+            </AlertDescription>
+          </Alert>
+        )}
+
         {/* Summary Cards */}
         {Object.keys(summary).length > 0 && (
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-5 gap-4">
@@ -252,7 +337,7 @@ function App() {
                   </SelectTrigger>
                   <SelectContent>
                     <SelectItem value="all">All Services</SelectItem>
-                    {uniqueServiceTypes.map(service => (
+                    {serviceTypes.map(service => (
                       <SelectItem key={service} value={service}>{service}</SelectItem>
                     ))}
                   </SelectContent>
@@ -279,12 +364,12 @@ function App() {
         <Card className="border-2">
           <CardHeader>
             <CardTitle className="text-xl">
-              AWS Resources ({filteredServices.length})
+              AWS Resources ({totalCount})
             </CardTitle>
             <CardDescription>
-              {filteredServices.length === services.length 
-                ? `Showing all ${services.length} resources`
-                : `Showing ${filteredServices.length} of ${services.length} resources`
+              {services.length === totalCount
+                ? `Showing all ${totalCount} ${filtered ? 'matching ' : ''}resources`
+                : `Showing ${services.length} of ${totalCount} ${filtered ? 'matching ' : ''}resources`
               }
             </CardDescription>
           </CardHeader>
@@ -294,9 +379,9 @@ function App() {
                 <Loader2 className="h-8 w-8 animate-spin mr-2" />
                 <span>Scanning AWS resources...</span>
               </div>
-            ) : filteredServices.length === 0 ? (
+            ) : services.length === 0 ? (
               <div className="text-center py-8 text-muted-foreground">
-                {services.length === 0 ? 'No AWS resources found' : 'No resources match your filters'}
+                {filtered ? 'No resources match your filters' : 'No AWS resources found'}
               </div>
             ) : (
               <div className="overflow-x-auto">
@@ -313,7 +398,7 @@ function App() {
                     </TableRow>
                   </TableHeader>
                   <TableBody>
-                    {filteredServices.map((service, index) => (
+                    {services.map((service, index) => (
                       <TableRow key={index} className="hover:bg-gray-50 dark:hover:bg-gray-800">
                         <TableCell>
                           <div className="flex items-center gap-2">
@@ -367,6 +452,14 @@ function App() {
                     ))}
                   </TableBody>
                 </Table>
+                {nextCursor && (
+                  <div className="flex justify-center pt-4">
+                    <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+                      {loadingMore && <Loader2 className="h-4 w-4 animate-spin mr-2" />}
+                      Load more
+                    </Button>
+                  </div>
+                )}
               </div>
             )}
           </CardContent>
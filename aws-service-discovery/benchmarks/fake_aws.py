@@ -0,0 +1,371 @@
+"""In-process fake AWS endpoint serving a synthetic account to pooled boto3 clients
+
+Every client built by the client pool gets botocore event handlers that answer
+API calls from generated data instead of the network, in the same way
+botocore's Stubber does, so the scanners, paginators, detail calls and metrics
+all run unchanged. Per-call latency and throttling errors can be injected.
+"""
+import collections
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import botocore.session
+from botocore.awsrequest import AWSResponse
+
+DEFAULT_REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1', 'ca-west-1',
+    'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-central-1', 'eu-central-2', 'eu-north-1',
+    'eu-south-1', 'eu-south-2', 'ap-south-1', 'ap-south-2', 'ap-northeast-1', 'ap-northeast-2',
+    'ap-northeast-3', 'ap-southeast-1', 'ap-southeast-2', 'ap-southeast-3', 'ap-southeast-4', 'ap-east-1',
+    'sa-east-1', 'me-south-1', 'me-central-1', 'af-south-1', 'il-central-1', 'mx-central-1'
+]
+
+CREATED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+class SyntheticAccount:
+    """A generated AWS account answering the API calls the scanners make
+
+    resources_per_cell resources are generated for every (region, service)
+    cell; S3 gets that many buckets per region. latency_ms (plus up to
+    jitter_ms) is slept on every call and throttle_rate is the probability a
+    call fails with a Throttling error. With quota, each (service, region)
+    endpoint allows that many calls per second, in bursts of as many, and
+    throttles calls beyond it like AWS API quotas do.
+    """
+
+    def __init__(self, region_count=30, resources_per_cell=50, latency_ms=0, jitter_ms=0, throttle_rate=0.0, quota=0, seed=0):
+        self.regions = (DEFAULT_REGIONS * (region_count // len(DEFAULT_REGIONS) + 1))[:region_count]
+        self.resources_per_cell = resources_per_cell
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.quota = quota
+        self._quota_tokens = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._paginators = {}
+        self._listings = {}
+        self.calls = collections.Counter()
+        self.throttles = collections.Counter()
+
+    def install(self, client_pool):
+        """Serve every client the pool builds from now on from this account
+
+        Returns a function that uninstalls it again, dropping the clients it served.
+        """
+        client_pool.clear()
+        client_pool.add_client_hook(self.attach)
+
+        def uninstall():
+            client_pool.remove_client_hook(self.attach)
+            client_pool.clear()
+        return uninstall
+
+    def attach(self, client):
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name or 'us-east-1'
+
+        def capture_params(params, model, context, **kwargs):
+            context['fake_params'] = dict(params)
+
+        def respond(model, context, **kwargs):
+            # Answering in before-call skips botocore's HTTP layer and its retries, so throttled
+            # attempts are retried here the way standard retry mode would, with the same events
+            max_attempts = client.meta.config.retries.get('total_max_attempts', 1)
+            operation = f"{client.meta.service_model.service_id.hyphenize()}.{model.name}"
+            for attempt in range(1, max_attempts + 1):
+                client.meta.events.emit(f"before-send.{operation}", request=None)
+                http_response, parsed = self.handle(service, region, model.name, context.get('fake_params', {}))
+                parsed['ResponseMetadata']['RetryAttempts'] = attempt - 1
+                client.meta.events.emit(f"response-received.{operation}", exception=None, parsed_response=parsed, context=context, response_dict=None)
+                if parsed.get('Error', {}).get('Code') != 'Throttling' or attempt == max_attempts:
+                    return http_response, parsed
+                time.sleep(self._random.random() * min(20, 2 ** (attempt - 1)))
+
+        client.meta.events.register('before-parameter-build', capture_params)
+        client.meta.events.register('before-call', respond)
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.throttles.clear()
+
+    def handle(self, service, region, operation, params):
+        with self._lock:
+            self.calls[(service, operation)] += 1
+            delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+            throttled = self.throttle_rate and self._random.random() < self.throttle_rate
+            if self.quota and not throttled:
+                throttled = not self._take_quota(service, region)
+            if throttled:
+                self.throttles[(service, operation)] += 1
+        if delay:
+            time.sleep(delay / 1000.0)
+
+        if throttled:
+            error = {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+            return AWSResponse(None, 400, {}, None), error
+
+        handler = getattr(self, f'_{service}_{operation}', None)
+        if handler is None:
+            error = {'Error': {'Code': 'UnsupportedOperation', 'Message': operation}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+            return AWSResponse(None, 400, {}, None), error
+
+        parsed = handler(region, params)
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': 200, 'RetryAttempts': 0}
+        return AWSResponse(None, 200, {}, None), parsed
+
+    def _take_quota(self, service, region):
+        now = time.monotonic()
+        tokens, updated = self._quota_tokens.get((service, region), (self.quota, now))
+        tokens = min(self.quota, tokens + (now - updated) * self.quota)
+        allowed = tokens >= 1
+        self._quota_tokens[(service, region)] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def _page(self, service, operation, items, params, name_of=None):
+        """Slice items into the page the paginator asked for and add the next token"""
+        config = self._paginators.get((service, operation))
+        if config is None:
+            config = botocore.session.get_session().get_paginator_model(service).get_paginator(operation)
+            self._paginators[(service, operation)] = config
+
+        input_token, output_token = config['input_token'], config['output_token']
+        limit = params.get(config.get('limit_key')) or 100
+        token = params.get(input_token)
+        if token is None:
+            start = 0
+        elif name_of is not None:
+            start = [name_of(item) for item in items].index(token) + 1
+        else:
+            start = int(token)
+
+        page = items[start:start + limit]
+        response = {config['result_key']: page}
+        if start + limit < len(items):
+            response[output_token] = name_of(page[-1]) if name_of is not None else str(start + limit)
+        return response
+
+    def _names(self, prefix, region):
+        return [f'{prefix}-{region}-{i:06d}' for i in range(self.resources_per_cell)]
+
+    def _tags(self, i):
+        return [
+            {'Key': 'Name', 'Value': f'app-{i % 97}'},
+            {'Key': 'env', 'Value': ('prod', 'staging', 'dev')[i % 3]},
+            {'Key': 'team', 'Value': f'team-{i % 11}'}
+        ]
+
+    def _stack_tags(self, region, i):
+        """Every other resource belongs to one of eight stacks"""
+        return [{'Key': 'aws:cloudformation:stack-name', 'Value': f'stack-{region}-{i % 8:06d}'}] if i % 2 == 0 else []
+
+    def _ec2_DescribeRegions(self, region, params):
+        return {'Regions': [{'RegionName': name, 'OptInStatus': 'opt-in-not-required'} for name in self.regions]}
+
+    def _ec2_DescribeInstances(self, region, params):
+        reservations = [{
+            'ReservationId': f'r-{i:08x}',
+            'Instances': [{
+                'InstanceId': f'i-{region}-{i:06d}',
+                'InstanceType': ('t3.micro', 'm5.large', 'c6g.xlarge')[i % 3],
+                'State': {'Name': ('running', 'stopped')[i % 4 == 0]},
+                'Placement': {'AvailabilityZone': f'{region}{"abc"[i % 3]}'},
+                'LaunchTime': CREATED,
+                'VpcId': f'vpc-{region}-{i % 4:06d}',
+                'SubnetId': f'subnet-{region}-{i % 16:06d}',
+                'Tags': self._tags(i) + self._stack_tags(region, i)
+            }]
+        } for i in range(self.resources_per_cell)]
+        return self._page('ec2', 'DescribeInstances', reservations, params)
+
+    def _ec2_DescribeVpcs(self, region, params):
+        vpcs = [{
+            'VpcId': f'vpc-{region}-{i:06d}',
+            'State': 'available',
+            'CidrBlock': f'10.{i % 256}.0.0/16',
+            'IsDefault': i == 0,
+            'Tags': self._tags(i) + self._stack_tags(region, i)
+        } for i in range(self.resources_per_cell)]
+        return self._page('ec2', 'DescribeVpcs', vpcs, params)
+
+    def _rds_DescribeDBInstances(self, region, params):
+        instances = [{
+            'DBInstanceIdentifier': name,
+            'DBInstanceStatus': 'available',
+            'AvailabilityZone': f'{region}a',
+            'DBInstanceClass': 'db.t3.medium',
+            'Engine': ('postgres', 'mysql')[i % 2],
+            'DBSubnetGroup': {'DBSubnetGroupName': 'default', 'VpcId': f'vpc-{region}-{i % 4:06d}'},
+            'InstanceCreateTime': CREATED
+        } for i, name in enumerate(self._names('db', region))]
+        return self._page('rds', 'DescribeDBInstances', instances, params)
+
+    def _lambda_ListFunctions(self, region, params):
+        functions = [{
+            'FunctionName': name,
+            'Runtime': ('python3.12', 'nodejs20.x')[i % 2],
+            'MemorySize': 128 * (1 + i % 4),
+            'LastModified': '2024-01-01T00:00:00.000+0000',
+            'VpcConfig': {'VpcId': f'vpc-{region}-{i % 4:06d}' if i % 2 else '', 'SubnetIds': []}
+        } for i, name in enumerate(self._names('fn', region))]
+        return self._page('lambda', 'ListFunctions', functions, params)
+
+    def _s3_ListBuckets(self, region, params):
+        buckets = [
+            {'Name': name, 'CreationDate': CREATED, 'BucketRegion': bucket_region}
+            for bucket_region in self.regions
+            for name in self._names('bucket', bucket_region)
+        ]
+        return self._page('s3', 'ListBuckets', buckets, params)
+
+    def _s3_GetBucketLocation(self, region, params):
+        bucket_region = params['Bucket'].split('-', 1)[1].rsplit('-', 1)[0]
+        return {'LocationConstraint': None if bucket_region == 'us-east-1' else bucket_region}
+
+    def _elbv2_DescribeLoadBalancers(self, region, params):
+        load_balancers = [{
+            'LoadBalancerName': f'lb-{i:06d}',
+            'LoadBalancerArn': f'arn:aws:elasticloadbalancing:{region}:123456789012:loadbalancer/app/lb-{i:06d}/{i:016x}',
+            'Type': ('application', 'network')[i % 2],
+            'State': {'Code': 'active'},
+            'Scheme': 'internet-facing',
+            'VpcId': f'vpc-{region}-{i % 4:06d}',
+            'AvailabilityZones': [{'ZoneName': f'{region}a'}, {'ZoneName': f'{region}b'}],
+            'CreatedTime': CREATED
+        } for i in range(self.resources_per_cell)]
+        return self._page('elbv2', 'DescribeLoadBalancers', load_balancers, params)
+
+    def _cloudformation_DescribeStacks(self, region, params):
+        stacks = [{
+            'StackName': name,
+            'StackStatus': 'CREATE_COMPLETE',
+            'CreationTime': CREATED,
+            'Description': 'Synthetic stack',
+            'Tags': self._tags(i)
+        } for i, name in enumerate(self._names('stack', region))]
+        return self._page('cloudformation', 'DescribeStacks', stacks, params)
+
+    def _ecs_ListClusters(self, region, params):
+        arns = [f'arn:aws:ecs:{region}:123456789012:cluster/{name}' for name in self._names('cluster', region)]
+        return self._page('ecs', 'ListClusters', arns, params)
+
+    def _ecs_DescribeClusters(self, region, params):
+        return {'clusters': [{
+            'clusterName': arn.rsplit('/', 1)[1],
+            'clusterArn': arn,
+            'status': 'ACTIVE',
+            'runningTasksCount': 3,
+            'pendingTasksCount': 0,
+            'activeServicesCount': 1
+        } for arn in params['clusters']]}
+
+    def _sns_ListTopics(self, region, params):
+        topics = [{'TopicArn': f'arn:aws:sns:{region}:123456789012:{name}'} for name in self._names('topic', region)]
+        return self._page('sns', 'ListTopics', topics, params)
+
+    def _sns_GetTopicAttributes(self, region, params):
+        return {'Attributes': {'TopicArn': params['TopicArn'], 'SubscriptionsConfirmed': '2', 'SubscriptionsPending': '0', 'DisplayName': ''}}
+
+    def _sqs_ListQueues(self, region, params):
+        urls = [f'https://sqs.{region}.amazonaws.com/123456789012/{name}' for name in self._names('queue', region)]
+        return self._page('sqs', 'ListQueues', urls, params)
+
+    def _sqs_GetQueueAttributes(self, region, params):
+        return {'Attributes': {'ApproximateNumberOfMessages': '0', 'ApproximateNumberOfMessagesNotVisible': '0', 'CreatedTimestamp': '1704067200'}}
+
+    def _dynamodb_ListTables(self, region, params):
+        return self._page('dynamodb', 'ListTables', self._names('table', region), params, name_of=lambda name: name)
+
+    def _dynamodb_DescribeTable(self, region, params):
+        return {'Table': {
+            'TableName': params['TableName'],
+            'TableStatus': 'ACTIVE',
+            'ItemCount': 1000,
+            'TableSizeBytes': 65536,
+            'BillingModeSummary': {'BillingMode': 'PAY_PER_REQUEST'},
+            'CreationDateTime': CREATED
+        }}
+
+    def _inventory_items(self, region):
+        """Yield (resourceType, resourceId, resourceName, arn, configuration) for every regional resource"""
+        account = '123456789012'
+        for i in range(self.resources_per_cell):
+            yield 'AWS::EC2::Instance', f'i-{region}-{i:06d}', None, f'arn:aws:ec2:{region}:{account}:instance/i-{region}-{i:06d}', {
+                'instanceType': 't3.micro', 'state': {'name': 'running'}, 'placement': {'availabilityZone': f'{region}a'},
+                'vpcId': f'vpc-{region}-{i % 4:06d}', 'subnetId': f'subnet-{region}-{i % 16:06d}'
+            }
+            yield 'AWS::EC2::VPC', f'vpc-{region}-{i:06d}', None, f'arn:aws:ec2:{region}:{account}:vpc/vpc-{region}-{i:06d}', {
+                'state': 'available', 'cidrBlock': f'10.{i % 256}.0.0/16', 'isDefault': i == 0
+            }
+            name = f'db-{region}-{i:06d}'
+            yield 'AWS::RDS::DBInstance', f'db-{i:016x}', name, f'arn:aws:rds:{region}:{account}:db:{name}', {
+                'dBInstanceStatus': 'available', 'dBInstanceClass': 'db.t3.medium', 'engine': 'postgres',
+                'dBSubnetGroup': {'dBSubnetGroupName': 'default', 'vpcId': f'vpc-{region}-{i % 4:06d}'}
+            }
+            name = f'fn-{region}-{i:06d}'
+            yield 'AWS::Lambda::Function', name, name, f'arn:aws:lambda:{region}:{account}:function:{name}', {'runtime': 'python3.12', 'memorySize': 128}
+            name = f'lb-{i:06d}'
+            yield 'AWS::ElasticLoadBalancingV2::LoadBalancer', name, name, f'arn:aws:elasticloadbalancing:{region}:{account}:loadbalancer/app/{name}/{i:016x}', {
+                'type': 'application', 'state': {'code': 'active'}, 'scheme': 'internet-facing', 'vpcId': f'vpc-{region}-{i % 4:06d}'
+            }
+            name = f'stack-{region}-{i:06d}'
+            yield 'AWS::CloudFormation::Stack', name, name, f'arn:aws:cloudformation:{region}:{account}:stack/{name}/{i:08x}', {'stackStatus': 'CREATE_COMPLETE'}
+            name = f'cluster-{region}-{i:06d}'
+            yield 'AWS::ECS::Cluster', name, name, f'arn:aws:ecs:{region}:{account}:cluster/{name}', {'status': 'ACTIVE'}
+            name = f'topic-{region}-{i:06d}'
+            yield 'AWS::SNS::Topic', name, name, f'arn:aws:sns:{region}:{account}:{name}', {}
+            name = f'queue-{region}-{i:06d}'
+            yield 'AWS::SQS::Queue', name, name, f'arn:aws:sqs:{region}:{account}:{name}', {}
+            name = f'table-{region}-{i:06d}'
+            yield 'AWS::DynamoDB::Table', name, name, f'arn:aws:dynamodb:{region}:{account}:table/{name}', {'tableStatus': 'ACTIVE', 'itemCount': 1000}
+
+    def _resourcegroupstaggingapi_GetResources(self, region, params):
+        # A filter is 'service' or 'service:type', matched against the ARN's service and resource
+        filters = [(resource_type.split(':', 1) + [''])[:2] for resource_type in params.get('ResourceTypeFilters', [])]
+
+        def matches(arn):
+            service, resource = arn.split(':', 5)[2::3]
+            return not filters or any(service == prefix and resource.startswith(kind) for prefix, kind in filters)
+        mappings = [
+            {'ResourceARN': arn, 'Tags': self._tags(i)}
+            for i, (_, _, _, arn, _) in enumerate(self._inventory_items(region))
+            if matches(arn)
+        ]
+        return self._page('resourcegroupstaggingapi', 'GetResources', mappings, params)
+
+    def _config_SelectAggregateResourceConfig(self, region, params):
+        # Serialised once per query, since every page of it slices the same result set
+        expression = params['Expression']
+        results = self._listings.get(expression)
+        if results is None:
+            results = self._listings[expression] = [
+                json.dumps({
+                    'resourceId': resource_id,
+                    'resourceName': resource_name,
+                    'resourceType': resource_type,
+                    'awsRegion': item_region,
+                    'arn': arn,
+                    'tags': [{'key': tag['Key'], 'value': tag['Value']} for tag in self._tags(i)],
+                    'configuration': configuration
+                })
+                for item_region in self.regions if repr(item_region) in expression
+                for i, (resource_type, resource_id, resource_name, arn, configuration) in enumerate(self._inventory_items(item_region))
+            ]
+        return self._page('config', 'SelectAggregateResourceConfig', results, params)
+
+    def _sts_GetCallerIdentity(self, region, params):
+        return {'Account': '123456789012', 'Arn': 'arn:aws:iam::123456789012:user/benchmark', 'UserId': 'AIDABENCHMARK'}
+
+    def _sts_AssumeRole(self, region, params):
+        return {
+            'Credentials': {
+                'AccessKeyId': 'ASIABENCHMARK',
+                'SecretAccessKey': 'benchmark',
+                'SessionToken': 'benchmark',
+                'Expiration': datetime.now(timezone.utc) + timedelta(seconds=params.get('DurationSeconds', 3600))
+            },
+            'AssumedRoleUser': {'AssumedRoleId': f"AROABENCHMARK:{params['RoleSessionName']}", 'Arn': params['RoleArn']}
+        }
@@ -0,0 +1,102 @@
+"""Memory benchmark of the cached inventory: plain resource dicts against ResourceTable
+
+    python benchmarks/memory.py --regions 30 --resources-per-cell 1500
+
+Scans one region of a synthetic account with every scanner, then loads a
+copy of each cell per region from JSON, as the index does from snapshots.
+Reports traced memory for holding the inventory as lists of dicts and as
+ResourceTables, and the time to build, iterate and serialise each. Nothing
+talks to AWS.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from src.discovery.clients import client_pool
+from src.discovery.compact import ResourceTable
+from src.discovery.registry import SERVICE_SPECS, scan_service
+from benchmarks.fake_aws import SyntheticAccount
+
+def scan_templates(account):
+    """Scan the account's first region with every scanner, returning {service_type: JSON}"""
+    region = account.regions[0]
+    return region, {
+        service_type: json.dumps(list(scan_service(spec, region)), default=str)
+        for service_type, spec in SERVICE_SPECS.items()
+    }
+
+def load_cells(template_region, templates, regions):
+    """Parse one copy of every template per region, as fresh objects like a snapshot load"""
+    for index in range(regions):
+        region = f"{template_region}-{index:03d}"
+        for service_type, template in templates.items():
+            yield json.loads(template.replace(template_region, region))
+
+def measure(name, build, template_region, templates, regions):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    cells = [build(resources) for resources in load_cells(template_region, templates, regions)]
+    build_seconds = time.perf_counter() - started
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    count = sum(len(resources) for resources in cells)
+    started = time.perf_counter()
+    for resources in cells:
+        for resource in resources:
+            pass
+    iterate_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for resources in cells:
+        json.dumps(list(resources), default=str)
+    serialise_seconds = time.perf_counter() - started
+
+    return {
+        'representation': name,
+        'resources': count,
+        'memory_mb': round(current / 1024 / 1024, 1),
+        'bytes_per_resource': round(current / max(count, 1)),
+        'build_s': round(build_seconds, 2),
+        'iterate_s': round(iterate_seconds, 2),
+        'serialise_s': round(serialise_seconds, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--regions', type=int, default=30)
+    parser.add_argument('--resources-per-cell', type=int, default=1500)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    account = SyntheticAccount(region_count=1, resources_per_cell=args.resources_per_cell)
+    account.install(client_pool)
+    template_region, templates = scan_templates(account)
+
+    results = [
+        measure('dicts', lambda resources: resources, template_region, templates, args.regions),
+        measure('ResourceTable', ResourceTable, template_region, templates, args.regions)
+    ]
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'results': results}, indent=2))
+        return
+
+    print(f"{args.regions} regions x {len(templates)} services x {args.resources_per_cell} resources per cell")
+    print(f"{'representation':<16}{'resources':>11}{'MB':>9}{'B/resource':>12}{'build s':>9}{'iterate s':>11}{'serialise s':>13}")
+    for result in results:
+        print(f"{result['representation']:<16}{result['resources']:>11}{result['memory_mb']:>9.1f}{result['bytes_per_resource']:>12}"
+              f"{result['build_s']:>9.2f}{result['iterate_s']:>11.2f}{result['serialise_s']:>13.2f}")
+
+if __name__ == '__main__':
+    main()
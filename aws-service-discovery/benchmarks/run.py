@@ -0,0 +1,187 @@
+"""Offline benchmark of the discovery endpoints against a synthetic AWS account
+
+    python benchmarks/run.py --regions 30 --resources-per-cell 100 --latency-ms 20
+
+Reports end-to-end latency, per-scanner latency, peak traced memory and API
+call counts for /api/services, /api/services/<region> and
+/api/services/summary, both cold (forced rescan) and warm (served from
+snapshots), plus a repeated and a ?format=columnar /api/services request.
+The summary never waits for scans, so 'summary cold' only queues its rescan.
+With --accounts, every account is a role assumed from the same synthetic
+data and scanned on --account-processes worker processes; API calls made in
+worker processes are not counted. Nothing talks to AWS.
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from flask import Flask
+from src.models.snapshot import enable_wal, init_database
+from src.models.user import db
+from src.routes.aws_services import aws_bp, shutdown_scheduler
+from src.discovery.accounts import account_scanner
+from src.discovery.clients import client_pool
+from src.discovery.details import detail_fetcher
+from src.discovery.metrics import metrics
+from src.discovery.ratelimit import rate_limiters
+from benchmarks.fake_aws import SyntheticAccount
+
+def create_app(database_path, args):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{database_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SCAN_CACHE_TTL'] = 3600
+    app.config['SCAN_MAX_WORKERS'] = args.max_workers
+    app.config['SCAN_SERVICE_CONCURRENCY'] = args.service_concurrency
+    app.config['SCAN_DETAIL_WORKERS'] = args.detail_workers
+    app.config['DISCOVERY_ENGINE'] = args.engine
+    app.config['CONFIG_AGGREGATOR_NAME'] = 'benchmark'
+    app.config['AWS_ACCOUNT_ROLE_ARNS'] = ','.join(f"arn:aws:iam::{100000000000 + i}:role/discovery" for i in range(args.accounts))
+    app.config['SCAN_ACCOUNT_PROCESSES'] = args.account_processes
+    app.config['AWS_RATE_LIMIT'] = args.rate_limit
+    rate_limiters.init_app(app)
+    app.register_blueprint(aws_bp, url_prefix='/api')
+    db.init_app(app)
+    client_pool.init_app(app)
+    detail_fetcher.init_app(app)
+    account_scanner.init_app(app)
+    with app.app_context():
+        enable_wal(db.engine)
+        init_database()
+    return app
+
+def install_fake_account(options):
+    """Serve a worker process's clients from a synthetic account built with options"""
+    SyntheticAccount(**options).install(client_pool)
+
+def scan_latency_totals():
+    """Return {service: (scan count, total seconds)} from the scan duration histogram"""
+    totals = {}
+    for (service, region), series in metrics.scan_duration.series().items():
+        count, seconds = totals.get(service, (0, 0.0))
+        totals[service] = (count + series['count'], seconds + series['sum'])
+    return totals
+
+def run_scenario(client, account, name, url, measure_memory, headers=None):
+    account.reset_counters()
+    before = scan_latency_totals()
+    if measure_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(url, headers=headers)
+    body = response.get_data()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    if measure_memory:
+        tracemalloc.stop()
+
+    per_scanner = {}
+    for service, (count, seconds) in scan_latency_totals().items():
+        previous_count, previous_seconds = before.get(service, (0, 0.0))
+        if count > previous_count:
+            per_scanner[service] = round((seconds - previous_seconds) / (count - previous_count) * 1000, 2)
+
+    return {
+        'scenario': name,
+        'url': url,
+        'status': response.status_code,
+        'elapsed_ms': round(elapsed * 1000, 2),
+        'response_bytes': len(body),
+        'content_encoding': response.headers.get('Content-Encoding'),
+        'peak_memory_mb': round(peak / 1024 / 1024, 2) if peak is not None else None,
+        'api_calls': sum(account.calls.values()),
+        'throttles': sum(account.throttles.values()),
+        'mean_scan_ms_by_service': per_scanner
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--regions', type=int, default=30)
+    parser.add_argument('--resources-per-cell', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--quota', type=float, default=0, help='calls per second each fake endpoint allows before throttling')
+    parser.add_argument('--rate-limit', type=float, default=10, help='starting adaptive rate limit per endpoint (0 disables it)')
+    parser.add_argument('--max-workers', type=int, default=32)
+    parser.add_argument('--service-concurrency', type=int, default=8)
+    parser.add_argument('--detail-workers', type=int, default=16)
+    parser.add_argument('--engine', choices=('scanners', 'tagging', 'config'), default='scanners')
+    parser.add_argument('--accounts', type=int, default=0, help='scan this many assumed-role accounts instead of one')
+    parser.add_argument('--account-processes', type=int, default=os.cpu_count() or 1, help='worker processes for --accounts (0 for threads)')
+    parser.add_argument('--accept-encoding', default='', help="Accept-Encoding header to send, e.g. 'gzip'")
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, which slows scans down')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='show scanner error output')
+    args = parser.parse_args()
+
+    options = {
+        'region_count': args.regions,
+        'resources_per_cell': args.resources_per_cell,
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'throttle_rate': args.throttle_rate,
+        'quota': args.quota
+    }
+    account = SyntheticAccount(**options)
+    account.install(client_pool)
+    account_scanner.setup = functools.partial(install_fake_account, options)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'), args)
+        client = app.test_client()
+        region = account.regions[0]
+        scenarios = [
+            ('services cold', '/api/services?refresh=true'),
+            ('services warm', '/api/services'),
+            ('services repeat', '/api/services'),
+            ('columnar warm', '/api/services?format=columnar'),
+            ('region cold', f'/api/services/{region}?refresh=true'),
+            ('region warm', f'/api/services/{region}'),
+            ('summary cold', '/api/services/summary?refresh=true'),
+            ('summary warm', '/api/services/summary')
+        ]
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            headers = {'Accept-Encoding': args.accept_encoding} if args.accept_encoding else None
+            results = [run_scenario(client, account, name, url, not args.no_memory, headers) for name, url in scenarios]
+        # Let stale-while-revalidate refreshes still queued finish before their workers go away
+        shutdown_scheduler()
+        account_scanner.shutdown()
+        limits = rate_limiters.stats()
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'results': results, 'rate_limits': limits}, indent=2))
+        return
+
+    if args.accounts:
+        print(f"{args.accounts} accounts on {args.account_processes} processes")
+    print(f"{args.regions} regions x {args.resources_per_cell} resources per cell, "
+          f"{args.latency_ms}ms latency, {args.throttle_rate:.0%} throttled, {args.engine} engine")
+    print(f"{'scenario':<16}{'status':>7}{'ms':>11}{'bytes':>12}{'peak MB':>9}{'calls':>8}{'throttles':>10}")
+    for result in results:
+        peak = f"{result['peak_memory_mb']:.1f}" if result['peak_memory_mb'] is not None else '-'
+        print(f"{result['scenario']:<16}{result['status']:>7}{result['elapsed_ms']:>11.1f}{result['response_bytes']:>12}"
+              f"{peak:>9}{result['api_calls']:>8}{result['throttles']:>10}")
+    if limits:
+        rates = sorted(limit['rate'] for limit in limits)
+        print(f"rate limits: {len(limits)} endpoints, median {rates[len(rates) // 2]:.1f}/s, "
+              f"{sum(limit['decreases'] for limit in limits)} decreases, {sum(limit['wait_seconds'] for limit in limits):.1f}s waited")
+    print('mean scan ms by service (cold services scan):')
+    for service, ms in sorted(results[0]['mean_scan_ms_by_service'].items()):
+        print(f"  {service:<16}{ms:>10.2f}")
+
+if __name__ == '__main__':
+    main()
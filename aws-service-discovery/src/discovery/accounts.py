@@ -0,0 +1,142 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+from src.discovery.clients import client_pool, client_settings
+from src.discovery.details import detail_fetcher
+from src.discovery.pruning import blocked_error_code
+from src.discovery.ratelimit import rate_limiters
+from src.discovery.registry import SERVICE_SPECS, scan_service
+
+logger = logging.getLogger(__name__)
+
+def parse_role_arns(value):
+    """Parse comma-separated IAM role ARNs into a list of (account_id, role_arn)"""
+    accounts = []
+    for role_arn in (value or '').split(','):
+        role_arn = role_arn.strip()
+        if not role_arn:
+            continue
+        parts = role_arn.split(':')
+        if len(parts) != 6 or parts[2] != 'iam' or not parts[4].isdigit():
+            raise ValueError(f"Invalid role ARN: {role_arn}")
+        accounts.append((parts[4], role_arn))
+    return accounts
+
+def cell_scope(account_id, region):
+    """The region part of a cell key: the region itself, or 'account_id:region' in multi-account mode"""
+    return f"{account_id}:{region}" if account_id else region
+
+def split_scope(scope):
+    """Split the region part of a cell key into (account_id or None, region)"""
+    account_id, _, region = scope.rpartition(':')
+    return account_id or None, region
+
+def scan_account_cells(account_id, role_arn, cells, threads):
+    """Scan one account's cells on a thread pool, in whichever process runs this
+
+    Returns ({cell: resources}, [(scope, error_code)] for blocked regions).
+    Every resource is tagged with account_id. Cells whose scan fails are
+    left out of the results.
+    """
+    def scan(cell):
+        _, region = split_scope(cell[0])
+        resources = list(scan_service(SERVICE_SPECS[cell[1]], region, role_arn))
+        for resource in resources:
+            resource['account_id'] = account_id
+        return resources
+
+    results = {}
+    blocked = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='account') as executor:
+        futures = {executor.submit(scan, cell): cell for cell in cells}
+        for future in concurrent.futures.as_completed(futures):
+            cell = futures[future]
+            try:
+                results[cell] = future.result()
+            except Exception as e:
+                code = blocked_error_code(e)
+                if code is not None:
+                    blocked.add((cell[0], code))
+                logger.warning("Error scanning %s in %s: %s", cell[1], cell[0], e)
+    return results, sorted(blocked)
+
+def init_worker(settings, setup):
+    """Configure the shared clients and detail fetcher of a freshly started worker process"""
+    client_pool.configure(**settings['client_config'])
+    rate_limiters.configure(**settings['rate_limit'])
+    client_pool.role_session_name = settings['role_session_name']
+    client_pool.role_external_id = settings['role_external_id']
+    client_pool.role_duration = settings['role_duration']
+    detail_fetcher.configure(**settings['detail'])
+    if setup is not None:
+        setup()
+
+class AccountScanner:
+    """Scans whole accounts across a pool of processes, each fanning out over regions and services on threads
+
+    Each account's cells go to one worker process as a single task, so
+    parsing and building resources for many accounts runs on as many cores
+    as there are processes instead of contending for one GIL. Workers keep
+    their boto3 clients and assumed-role credentials between tasks. With
+    processes set to 0, accounts are scanned on threads in this process.
+    setup, if given, is a picklable callable run in every new worker.
+    """
+
+    def __init__(self, processes=0, threads=16, setup=None):
+        self.processes = processes
+        self.threads = threads
+        self.setup = setup
+        self.accounts = []
+        self.settings = {
+            'client_config': {},
+            'rate_limit': dict(rate_limiters.settings),
+            'role_session_name': 'aws-service-discovery',
+            'role_external_id': None,
+            'role_duration': 3600,
+            'detail': dict(detail_fetcher.settings)
+        }
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def init_app(self, app):
+        self.accounts = parse_role_arns(app.config.get('AWS_ACCOUNT_ROLE_ARNS'))
+        self.processes = app.config.get('SCAN_ACCOUNT_PROCESSES', os.cpu_count() or 1)
+        self.threads = app.config.get('SCAN_ACCOUNT_THREADS', 16)
+        self.settings = {
+            'client_config': client_settings(app.config),
+            # rate_limiters.init_app runs first, so workers start from the same limiter settings
+            'rate_limit': dict(rate_limiters.settings),
+            'role_session_name': app.config.get('AWS_ROLE_SESSION_NAME', 'aws-service-discovery'),
+            'role_external_id': app.config.get('AWS_ROLE_EXTERNAL_ID') or None,
+            'role_duration': app.config.get('AWS_ROLE_DURATION', 3600),
+            # detail_fetcher.init_app runs first too, so workers fetch details with the same settings
+            'detail': dict(detail_fetcher.settings)
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers start clean instead of inheriting the server's threads and locks
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker,
+                    initargs=(self.settings, self.setup)
+                )
+            return self._executor
+
+    def scan(self, account_id, role_arn, cells):
+        """Scan cells of one account, returning ({cell: resources}, blocked scopes)"""
+        if not self.processes:
+            return scan_account_cells(account_id, role_arn, cells, self.threads)
+        return self._get_executor().submit(scan_account_cells, account_id, role_arn, list(cells), self.threads).result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+account_scanner = AccountScanner()
@@ -0,0 +1,39 @@
+import threading
+from src.models.snapshot import state_counts
+
+class CountAggregates:
+    """Resource counts by (region, state) for each cell, versioned by snapshot ID
+
+    Counts are recorded as each refreshed cell is saved, or read from the
+    counts stored with its snapshot, so summaries add up a few numbers per
+    cell instead of walking the resources.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cells = {}
+
+    def get(self, cell, version):
+        """Return a cell's {(region, state): count} if it is recorded for that snapshot version"""
+        entry = self._cells.get(cell)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, cell, version, counts):
+        with self._lock:
+            self._cells[cell] = (version, counts)
+
+    def counts_for(self, cell, version, resources):
+        """Return a cell's counts, counting the given resources if that version is not recorded yet"""
+        counts = self.get(cell, version)
+        if counts is None:
+            counts = state_counts(resources)
+            self.put(cell, version, counts)
+        return counts
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+
+count_aggregates = CountAggregates()
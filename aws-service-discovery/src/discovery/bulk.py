@@ -0,0 +1,225 @@
+import json
+from src.discovery.clients import client_pool
+from src.discovery.registry import SERVICE_SPECS, scan_service
+
+# Service types each engine discovers in bulk; the others keep their own scanners.
+# The Tagging API only has the ARNs and tags of tagged resources, so the
+# 'tagging' engine adds tags to scanners that do not list them. Config items
+# have no VPC for Lambda functions.
+ENGINE_SERVICE_TYPES = {
+    'tagging': ('SNS', 'SQS', 'DynamoDB'),
+    'config': ('EC2', 'VPC', 'RDS', 'ELB', 'CloudFormation', 'ECS', 'SNS', 'SQS', 'DynamoDB')
+}
+
+# tag:GetResources ResourceTypeFilters per service type
+TAGGING_RESOURCE_TYPES = {
+    'EC2': 'ec2:instance',
+    'VPC': 'ec2:vpc',
+    'RDS': 'rds:db',
+    'Lambda': 'lambda:function',
+    'ELB': 'elasticloadbalancing:loadbalancer',
+    'CloudFormation': 'cloudformation:stack',
+    'ECS': 'ecs:cluster',
+    'SNS': 'sns',
+    'SQS': 'sqs',
+    'DynamoDB': 'dynamodb:table'
+}
+
+CONFIG_RESOURCE_TYPES = {
+    'AWS::EC2::Instance': 'EC2',
+    'AWS::EC2::VPC': 'VPC',
+    'AWS::RDS::DBInstance': 'RDS',
+    'AWS::Lambda::Function': 'Lambda',
+    'AWS::ElasticLoadBalancingV2::LoadBalancer': 'ELB',
+    'AWS::CloudFormation::Stack': 'CloudFormation',
+    'AWS::ECS::Cluster': 'ECS',
+    'AWS::SNS::Topic': 'SNS',
+    'AWS::SQS::Queue': 'SQS',
+    'AWS::DynamoDB::Table': 'DynamoDB'
+}
+
+LOAD_BALANCER_TYPES = {'app': 'Application', 'net': 'Network', 'gwy': 'Gateway'}
+
+def tag_name(tags, default):
+    for tag in tags or []:
+        if tag.get('Key') == 'Name':
+            return tag.get('Value')
+    return default
+
+def base_resource(service_type, resource_id, name, state, region, tags, arn, source, resource_type=None):
+    return {
+        'service_type': service_type,
+        'resource_type': resource_type or SERVICE_SPECS[service_type].resource_type,
+        'resource_id': resource_id,
+        'name': name,
+        'state': state,
+        'region': region,
+        'availability_zone': 'N/A',
+        'arn': arn,
+        'discovered_by': source,
+        'tags': tags or []
+    }
+
+def parse_arn(arn):
+    """Map a resource ARN to (service_type, resource_id, resource_type), or None if not scanned"""
+    parts = arn.split(':', 5)
+    if len(parts) != 6:
+        return None
+    service, resource = parts[2], parts[5]
+
+    if service == 'ec2' and resource.startswith('instance/'):
+        return 'EC2', resource.split('/', 1)[1], None
+    if service == 'ec2' and resource.startswith('vpc/'):
+        return 'VPC', resource.split('/', 1)[1], None
+    if service == 'rds' and resource.startswith('db:'):
+        return 'RDS', resource.split(':', 1)[1], None
+    if service == 'lambda' and resource.startswith('function:'):
+        return 'Lambda', resource.split(':')[1], None
+    if service == 'elasticloadbalancing' and resource.startswith('loadbalancer/'):
+        segments = resource.split('/')
+        if len(segments) == 4 and segments[1] in LOAD_BALANCER_TYPES:
+            return 'ELB', segments[2], f"{LOAD_BALANCER_TYPES[segments[1]]} Load Balancer"
+        return None
+    if service == 'cloudformation' and resource.startswith('stack/'):
+        return 'CloudFormation', resource.split('/')[1], None
+    if service == 'ecs' and resource.startswith('cluster/'):
+        return 'ECS', resource.split('/', 1)[1], None
+    if service == 'sns' and ':' not in resource:
+        return 'SNS', resource, None
+    if service == 'sqs':
+        return 'SQS', resource, None
+    if service == 'dynamodb' and resource.startswith('table/') and resource.count('/') == 1:
+        return 'DynamoDB', resource.split('/', 1)[1], None
+    return None
+
+def region_tags(region, service_types):
+    """Return {(service_type, resource_id): tags} for a region's tagged resources from paginated tag:GetResources calls"""
+    tags = {}
+    tagging = client_pool.get_client('resourcegroupstaggingapi', region)
+    paginator = tagging.get_paginator('get_resources')
+    resource_types = [TAGGING_RESOURCE_TYPES[service_type] for service_type in service_types]
+    for page in paginator.paginate(ResourceTypeFilters=resource_types, PaginationConfig={'PageSize': 100}):
+        for mapping in page['ResourceTagMappingList']:
+            parsed = parse_arn(mapping['ResourceARN'])
+            if parsed is not None and parsed[0] in service_types:
+                tags[parsed[:2]] = mapping.get('Tags', [])
+    return tags
+
+def discover_region_by_tags(region, service_types=ENGINE_SERVICE_TYPES['tagging']):
+    """Build resources for a region from its scanners' listings, with tags from tag:GetResources
+
+    The Tagging API only returns resources that carry (or once carried) tags,
+    so every resource is still listed by its scanner, whose detail calls
+    (deferred by SCAN_LIST_ONLY) fill in the fields ARNs and tags lack.
+    Returns {service_type: [resources]} with an entry for every requested type.
+    """
+    tags = region_tags(region, service_types)
+    results = {}
+    for service_type in service_types:
+        resources = list(scan_service(SERVICE_SPECS[service_type], region))
+        for resource in resources:
+            resource['tags'] = tags.get((service_type, resource['resource_id']), resource['tags'])
+        results[service_type] = resources
+    return results
+
+def config_fields(service_type, configuration):
+    """Pull the per-service fields the scanners report out of a Config configuration item"""
+    c = configuration or {}
+    if service_type == 'EC2':
+        return {
+            'state': c.get('state', {}).get('name', 'N/A'),
+            'availability_zone': c.get('placement', {}).get('availabilityZone', 'N/A'),
+            'instance_type': c.get('instanceType', 'N/A'),
+            'launch_time': c.get('launchTime', 'N/A'),
+            'vpc_id': c.get('vpcId', 'N/A'),
+            'subnet_id': c.get('subnetId', 'N/A')
+        }
+    if service_type == 'VPC':
+        return {'state': c.get('state', 'N/A'), 'cidr_block': c.get('cidrBlock', 'N/A'), 'is_default': c.get('isDefault', False)}
+    if service_type == 'RDS':
+        return {
+            'state': c.get('dBInstanceStatus', 'N/A'),
+            'availability_zone': c.get('availabilityZone', 'N/A'),
+            'instance_type': c.get('dBInstanceClass', 'N/A'),
+            'engine': c.get('engine', 'N/A'),
+            'vpc_id': (c.get('dBSubnetGroup') or {}).get('vpcId', 'N/A'),
+            'created_time': c.get('instanceCreateTime', 'N/A')
+        }
+    if service_type == 'Lambda':
+        return {
+            'state': c.get('state', 'N/A'),
+            'runtime': c.get('runtime', 'N/A'),
+            'memory_size': c.get('memorySize', 'N/A'),
+            'last_modified': c.get('lastModified', 'N/A')
+        }
+    if service_type == 'ELB':
+        return {
+            'state': c.get('state', {}).get('code', 'N/A'),
+            'availability_zone': ', '.join(az.get('zoneName', '') for az in c.get('availabilityZones', [])),
+            'scheme': c.get('scheme', 'N/A'),
+            'vpc_id': c.get('vpcId', 'N/A'),
+            'created_time': c.get('createdTime', 'N/A')
+        }
+    if service_type == 'CloudFormation':
+        return {'state': c.get('stackStatus', 'N/A'), 'template_description': c.get('description', 'N/A')}
+    if service_type == 'ECS':
+        return {'state': c.get('status', 'ACTIVE')}
+    if service_type in ('SNS', 'SQS'):
+        return {'state': 'Active'}
+    if service_type == 'DynamoDB':
+        return {
+            'state': c.get('tableStatus', 'N/A'),
+            'item_count': c.get('itemCount', 0),
+            'table_size_bytes': c.get('tableSizeBytes', 0),
+            'billing_mode': c.get('billingModeSummary', {}).get('billingMode', 'N/A')
+        }
+    return {}
+
+def discover_by_config(aggregator_name, regions, service_types=ENGINE_SERVICE_TYPES['config'], home_region='us-east-1'):
+    """Build resources for many regions from one paginated SelectAggregateResourceConfig query
+
+    Returns {(region, service_type): [resources]} with an entry for every
+    requested cell, so empty cells are recorded as scanned.
+    """
+    config_types = [config_type for config_type, service_type in CONFIG_RESOURCE_TYPES.items() if service_type in service_types]
+    regions = set(regions)
+    results = {(region, service_type): [] for region in regions for service_type in service_types}
+
+    expression = (
+        "SELECT resourceId, resourceName, resourceType, awsRegion, arn, tags, configuration "
+        f"WHERE resourceType IN ({', '.join(repr(config_type) for config_type in config_types)}) "
+        f"AND awsRegion IN ({', '.join(repr(region) for region in sorted(regions))})"
+    )
+    config = client_pool.get_client('config', home_region)
+    paginator = config.get_paginator('select_aggregate_resource_config')
+    pages = paginator.paginate(
+        Expression=expression,
+        ConfigurationAggregatorName=aggregator_name,
+        PaginationConfig={'PageSize': 100}
+    )
+    for page in pages:
+        for raw in page['Results']:
+            item = json.loads(raw)
+            region = item.get('awsRegion')
+            service_type = CONFIG_RESOURCE_TYPES.get(item.get('resourceType'))
+            if region not in regions or service_type not in service_types:
+                continue
+
+            configuration = item.get('configuration')
+            if isinstance(configuration, str):
+                configuration = json.loads(configuration)
+            tags = [{'Key': tag.get('key'), 'Value': tag.get('value')} for tag in item.get('tags', [])]
+            resource_id = item.get('resourceName') or item.get('resourceId')
+            if service_type in ('EC2', 'VPC'):
+                resource_id = item.get('resourceId')
+            resource_type = None
+            if service_type == 'ELB':
+                resource_type = f"{(configuration or {}).get('type', 'application').title()} Load Balancer"
+
+            resource = base_resource(
+                service_type, resource_id, tag_name(tags, item.get('resourceName') or resource_id), 'N/A',
+                region, tags, item.get('arn'), 'config', resource_type
+            )
+            resource.update(config_fields(service_type, configuration))
+            results[(region, service_type)].append(resource)
+    return results
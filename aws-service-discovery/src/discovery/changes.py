@@ -0,0 +1,29 @@
+from src.models.snapshot import content_hash
+
+def resource_key(resource):
+    return str(resource.get('resource_id', ''))
+
+def resource_hashes(resources):
+    """Map each resource's ID to the content hash of the resource"""
+    return {resource_key(resource): content_hash(resource) for resource in resources}
+
+def diff_resources(old_resources, new_resources, new_hashes=None):
+    """Compare two versions of a cell's resources by ID and content hash
+
+    Returns (added, removed, modified): the added and modified resources as
+    they are now, and the removed ones as they were.
+    """
+    old_hashes = resource_hashes(old_resources)
+    if new_hashes is None:
+        new_hashes = resource_hashes(new_resources)
+
+    added = []
+    modified = []
+    for resource in new_resources:
+        key = resource_key(resource)
+        if key not in old_hashes:
+            added.append(resource)
+        elif old_hashes[key] != new_hashes[key]:
+            modified.append(resource)
+    removed = [resource for resource in old_resources if resource_key(resource) not in new_hashes]
+    return added, removed, modified
@@ -0,0 +1,183 @@
+import threading
+from src.discovery.metrics import metrics
+from src.discovery.ratelimit import rate_limiters
+
+# Client settings used when the app config does not set them, and the config key of each
+CLIENT_DEFAULTS = {
+    'max_pool_connections': 25,
+    'connect_timeout': 3,
+    'read_timeout': 10,
+    'max_attempts': 3,
+    'retry_mode': 'standard'
+}
+CLIENT_CONFIG_KEYS = {
+    'max_pool_connections': 'AWS_MAX_POOL_CONNECTIONS',
+    'connect_timeout': 'AWS_CONNECT_TIMEOUT',
+    'read_timeout': 'AWS_READ_TIMEOUT',
+    'max_attempts': 'AWS_MAX_ATTEMPTS',
+    'retry_mode': 'AWS_RETRY_MODE'
+}
+
+def client_settings(config):
+    """Client settings from an app config, falling back to CLIENT_DEFAULTS"""
+    return {name: config.get(key, CLIENT_DEFAULTS[name]) for name, key in CLIENT_CONFIG_KEYS.items()}
+
+def no_credentials_error():
+    """botocore's NoCredentialsError, for except clauses, which only evaluate it once an exception is raised"""
+    from botocore.exceptions import NoCredentialsError
+    return NoCredentialsError
+
+class AssumeRoleCredentialProvider:
+    """botocore credential provider of a role session, whose credentials come from refresh and are refreshed before they expire"""
+    METHOD = 'sts-assume-role'
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+
+    def load(self):
+        from botocore.credentials import DeferredRefreshableCredentials
+        return DeferredRefreshableCredentials(refresh_using=self.refresh, method=self.METHOD)
+
+class ClientPool:
+    """Thread-safe cache of boto3 clients keyed by (service, region, credentials or role)
+
+    Building a client loads service models and endpoint data, so each client is
+    built once and shared by every scan thread. botocore clients are safe to use
+    across threads, and reusing them keeps their HTTP connections alive between
+    scans. Clients for an IAM role share one session per role whose
+    credentials come from AssumeRole and are refreshed before they expire.
+    boto3 is only imported when the first session is built, so processes
+    that never call AWS do not load it.
+    """
+
+    def __init__(self, **settings):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._role_sessions = {}
+        self._clients = {}
+        self._client_hooks = []
+        self.role_session_name = 'aws-service-discovery'
+        self.role_external_id = None
+        self.role_duration = 3600
+        self.configure(**settings)
+
+    def init_app(self, app):
+        self.configure(**client_settings(app.config))
+        self.role_session_name = app.config.get('AWS_ROLE_SESSION_NAME', 'aws-service-discovery')
+        self.role_external_id = app.config.get('AWS_ROLE_EXTERNAL_ID') or None
+        self.role_duration = app.config.get('AWS_ROLE_DURATION', 3600)
+
+    def configure(self, **settings):
+        """Set the botocore config for new clients and drop the cached ones
+
+        settings override CLIENT_DEFAULTS. Short connect and read timeouts
+        and a small retry budget bound how long one unresponsive endpoint
+        can hold a scan thread; 'adaptive' retry mode also rate limits the
+        client after throttling errors.
+        """
+        settings = dict(CLIENT_DEFAULTS, **settings)
+        settings = {
+            'max_pool_connections': settings['max_pool_connections'],
+            'connect_timeout': settings['connect_timeout'],
+            'read_timeout': settings['read_timeout'],
+            'tcp_keepalive': True,
+            'retries': {'max_attempts': settings['max_attempts'], 'mode': settings['retry_mode']}
+        }
+        with self._lock:
+            self.settings = settings
+            self._config = None
+            self._clients.clear()
+
+    @property
+    def config(self):
+        """botocore Config built from the current settings on first use"""
+        config = self._config
+        if config is None:
+            from botocore.config import Config
+            config = self._config = Config(**self.settings)
+        return config
+
+    def _credentials_key(self, credentials):
+        if not credentials:
+            return None
+        return (
+            credentials.get('aws_access_key_id'),
+            credentials.get('aws_secret_access_key'),
+            credentials.get('aws_session_token')
+        )
+
+    def get_session(self, credentials=None):
+        """Get the shared boto3 session for a set of credentials (None for the default chain)"""
+        key = self._credentials_key(credentials)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                import boto3
+                # boto3.Session() is not thread-safe, so sessions are only built under the lock
+                session = boto3.Session(**(credentials or {}))
+                self._sessions[key] = session
+            return session
+
+    def get_role_session(self, role_arn):
+        """Get the shared boto3 session for an IAM role, assuming it on first use and again before expiry"""
+        with self._lock:
+            session = self._role_sessions.get(role_arn)
+            if session is None:
+                import boto3
+                import botocore.session
+                from botocore.credentials import CredentialResolver
+                # The role's provider replaces the default credential chain of this session only
+                botocore_session = botocore.session.get_session()
+                provider = AssumeRoleCredentialProvider(lambda: self._assume_role(role_arn))
+                botocore_session.register_component('credential_provider', CredentialResolver([provider]))
+                session = boto3.Session(botocore_session=botocore_session)
+                self._role_sessions[role_arn] = session
+            return session
+
+    def _assume_role(self, role_arn):
+        params = {'RoleArn': role_arn, 'RoleSessionName': self.role_session_name, 'DurationSeconds': self.role_duration}
+        if self.role_external_id:
+            params['ExternalId'] = self.role_external_id
+        credentials = self.get_client('sts', 'us-east-1').assume_role(**params)['Credentials']
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat()
+        }
+
+    def get_client(self, service_name, region_name=None, credentials=None, role_arn=None):
+        """Get a cached client for a service, region and optional explicit credentials or IAM role"""
+        key = (service_name, region_name, self._credentials_key(credentials), role_arn)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        session = self.get_role_session(role_arn) if role_arn else self.get_session(credentials)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = session.client(service_name, region_name=region_name, config=self.config)
+                # Limiter first, so the latency metrics do not include waiting for a token
+                rate_limiters.instrument_client(client, role_arn)
+                metrics.instrument_client(client)
+                for hook in self._client_hooks:
+                    hook(client)
+                self._clients[key] = client
+            return client
+
+    def add_client_hook(self, hook):
+        """Call hook(client) on every client built from now on, e.g. to attach event handlers"""
+        self._client_hooks.append(hook)
+
+    def remove_client_hook(self, hook):
+        """Stop calling a hook added with add_client_hook on new clients"""
+        self._client_hooks.remove(hook)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._sessions.clear()
+            self._role_sessions.clear()
+
+client_pool = ClientPool()
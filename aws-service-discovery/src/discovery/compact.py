@@ -0,0 +1,65 @@
+from collections.abc import Sequence
+
+class ResourceTable(Sequence):
+    """Compact, read-only sequence of resource dicts
+
+    Each resource is held as a tuple of values plus a reference to its
+    field layout, the tuple of its keys in order, which resources from the
+    same scanner share. Repeated strings such as regions, states and 'N/A'
+    are stored once per table, and each distinct tags list is stored once
+    and shared by every resource carrying it. Items are rebuilt as plain
+    dicts when read, so they serialise exactly like the resources passed
+    in; the shared tags lists must not be modified.
+    """
+
+    __slots__ = ('_layouts', '_rows')
+
+    def __init__(self, resources):
+        strings = {}
+        layouts = {}
+        tag_sets = {}
+        intern = strings.setdefault
+        self._layouts = []
+        self._rows = []
+        for resource in resources:
+            layout = tuple(resource)
+            self._layouts.append(layouts.setdefault(layout, layout))
+            values = []
+            for key, value in resource.items():
+                if isinstance(value, str):
+                    value = intern(value, value)
+                elif key == 'tags' and isinstance(value, list):
+                    value = share_tags(value, strings, tag_sets)
+                values.append(value)
+            self._rows.append(tuple(values))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [dict(zip(layout, row)) for layout, row in zip(self._layouts[position], self._rows[position])]
+        return dict(zip(self._layouts[position], self._rows[position]))
+
+    def __iter__(self):
+        for layout, row in zip(self._layouts, self._rows):
+            yield dict(zip(layout, row))
+
+    def __repr__(self):
+        return f"ResourceTable({len(self)} resources, {len(set(map(id, self._layouts)))} layouts)"
+
+def share_tags(tags, strings, tag_sets):
+    """Return the table's shared copy of a tags list, adding it if this set of tags is new"""
+    try:
+        key = tuple(tuple(tag.items()) for tag in tags)
+        shared = tag_sets.get(key)
+    except (AttributeError, TypeError):
+        # Not a list of tag dicts with hashable values; keep it as it is
+        return tags
+    if shared is None:
+        shared = tag_sets[key] = [
+            {strings.setdefault(name, name): strings.setdefault(value, value) if isinstance(value, str) else value
+             for name, value in tag.items()}
+            for tag in tags
+        ]
+    return shared
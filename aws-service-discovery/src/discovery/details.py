@@ -0,0 +1,93 @@
+import collections
+import concurrent.futures
+import threading
+import time
+from src.discovery.metrics import metrics
+
+class DetailFetcher:
+    """Bounded concurrent runner and long-lived cache for per-resource detail calls
+
+    Scanners such as SNS, SQS and DynamoDB make one detail call per listed
+    resource. Those calls go through a shared pool so they overlap instead of
+    running one after another, and values that rarely change (bucket regions,
+    table billing modes) are cached for cache_ttl seconds across scans. The
+    cache keeps at most cache_size entries, evicting the least recently
+    used, so resources that come and go do not grow it without bound.
+    """
+
+    def __init__(self, max_workers=16, cache_ttl=86400, list_only=False, cache_size=100000):
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+        self.list_only = list_only
+        self.cache_size = cache_size
+        self._executor = None
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+
+    def init_app(self, app):
+        self.configure(
+            max_workers=app.config.get('SCAN_DETAIL_WORKERS', 16),
+            cache_ttl=app.config.get('SCAN_DETAIL_CACHE_TTL', 86400),
+            list_only=app.config.get('SCAN_LIST_ONLY', False),
+            cache_size=app.config.get('SCAN_DETAIL_CACHE_SIZE', 100000)
+        )
+
+    def configure(self, max_workers=16, cache_ttl=86400, list_only=False, cache_size=100000):
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+        self.list_only = list_only
+        self.cache_size = cache_size
+
+    @property
+    def settings(self):
+        """The arguments of configure() this fetcher runs with"""
+        return {'max_workers': self.max_workers, 'cache_ttl': self.cache_ttl, 'list_only': self.list_only, 'cache_size': self.cache_size}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='detail')
+            return self._executor
+
+    def map(self, fn, items):
+        """Yield fn(item) for each item in order, running at most max_workers calls at once"""
+        executor = self._get_executor()
+        window = collections.deque()
+        for item in items:
+            window.append(executor.submit(fn, item))
+            if len(window) >= self.max_workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+    def get_cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return value
+
+    def set_cached(self, key, value):
+        with self._lock:
+            self._cache[key] = (value, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cached(self, key, fn):
+        """Return the cached value for key, calling fn to fill it when missing or expired"""
+        value = self.get_cached(key)
+        if value is not None:
+            metrics.cache_hit('detail')
+            return value
+        metrics.cache_miss('detail')
+        value = fn()
+        self.set_cached(key, value)
+        return value
+
+detail_fetcher = DetailFetcher()
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+
+# Columns every export starts with; the exported services' own fields follow
+BASE_COLUMNS = ('service_type', 'resource_type', 'resource_id', 'name', 'region', 'availability_zone', 'state')
+# Fields set by bulk discovery and deferred detail scans rather than by a spec
+EXTRA_COLUMNS = ('arn', 'discovered_by', 'details_deferred')
+TAG_PREFIX = 'tag:'
+# Encoded output is handed on in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+
+def parse_tag_columns(value):
+    """Split a comma-separated list of tag keys, keeping their order"""
+    keys = []
+    for key in (value or '').split(','):
+        key = key.strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def export_columns(specs, tag_keys, account_column=False):
+    """Columns of an export of the given services: base columns, spec fields, then one 'tag:<key>' column per tag key"""
+    columns = (['account_id'] if account_column else []) + list(BASE_COLUMNS)
+    for spec in specs:
+        for name in list(spec.fields) + list(spec.detail_fields):
+            if name != 'tags' and name not in columns:
+                columns.append(name)
+    columns.extend(column for column in EXTRA_COLUMNS if column not in columns)
+    columns.extend(TAG_PREFIX + key for key in tag_keys)
+    return columns
+
+def flatten_tags(resource, tag_keys):
+    """Copy a resource with each requested tag's value under 'tag:<key>' (None when the tag is not set)"""
+    values = {}
+    for tag in resource.get('tags') or []:
+        values[tag.get('Key', tag.get('key'))] = tag.get('Value', tag.get('value'))
+    row = dict(resource)
+    for key in tag_keys:
+        row[TAG_PREFIX + key] = values.get(key)
+    return row
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    return value
+
+def encode_csv(rows, columns, chunk_bytes=CHUNK_BYTES):
+    """Encode rows as CSV with a header, yielding chunks of about chunk_bytes
+
+    Only the given columns are written; nested values are written as JSON.
+    Rows are consumed one at a time, so memory stays bounded by the chunk
+    size however many rows there are.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([csv_value(row.get(column)) for column in columns])
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def encode_ndjson(rows, chunk_bytes=CHUNK_BYTES):
+    """Encode rows as one JSON object per line, yielding chunks of about chunk_bytes"""
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, default=str) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    if lines:
+        yield ''.join(lines)
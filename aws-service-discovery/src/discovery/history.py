@@ -0,0 +1,68 @@
+import threading
+import time
+from src.models.history import compact_history, last_series, record_counts
+from src.models.user import db
+
+def series_key(region, state):
+    return (str(region or ''), str(state))
+
+class HistoryRecorder:
+    """Records the resource counts of every completed scan as time series, and compacts them by retention
+
+    Each scanned cell appends its (region, state) counts as samples and
+    folds them into hourly, daily and weekly rollups. A series the cell's
+    previous scan had but this one lacks is recorded once as 0, so the
+    series shows the drop instead of just ending. Samples and rollups older
+    than their retention in days are deleted at most once per
+    compact_interval seconds; a retention of 0 keeps them.
+    """
+
+    def __init__(self, retention_days=None, compact_interval=3600):
+        self.retention_days = retention_days or {'raw': 2, 'hour': 35, 'day': 400, 'week': 0}
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._series = {}
+        self._compacted_at = 0.0
+
+    def init_app(self, app):
+        self.retention_days = {
+            'raw': app.config.get('HISTORY_RAW_DAYS', 2),
+            'hour': app.config.get('HISTORY_HOURLY_DAYS', 35),
+            'day': app.config.get('HISTORY_DAILY_DAYS', 400),
+            'week': app.config.get('HISTORY_WEEKLY_DAYS', 0)
+        }
+
+    def record(self, cell_counts):
+        """Record each cell's {(region, state): count} from a completed scan; call within an app context"""
+        if not cell_counts:
+            return
+        try:
+            with self._lock:
+                unknown = [cell for cell in cell_counts if cell not in self._series]
+            previous = last_series(unknown) if unknown else {}
+
+            samples = {}
+            with self._lock:
+                for cell, counts in cell_counts.items():
+                    counts = {series_key(region, state): count for (region, state), count in counts.items()}
+                    before = self._series.get(cell, previous.get(cell, set()))
+                    for key in before - set(counts):
+                        counts[key] = 0
+                    samples[cell] = counts
+                    self._series[cell] = {key for key, count in counts.items() if count}
+            record_counts(samples)
+
+            now = time.time()
+            if now - self._compacted_at >= self.compact_interval:
+                self._compacted_at = now
+                compact_history(self.retention_days)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error recording history: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._compacted_at = 0.0
+
+history_recorder = HistoryRecorder()
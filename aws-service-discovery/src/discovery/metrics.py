@@ -0,0 +1,185 @@
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+THROTTLE_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'SlowDown',
+    'PriorRequestNotComplete'
+}
+
+def format_labels(labelnames, labels):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, labels):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+class Gauge(Counter):
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f'# TYPE {self.name} gauge'
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, *labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def series(self):
+        """Return a copy of {labels: {'buckets', 'sum', 'count'}}"""
+        with self._lock:
+            return {labels: dict(series, buckets=list(series['buckets'])) for labels, series in self._series.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        labelnames = self.labelnames + ('le',)
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{format_labels(labelnames, labels + (bound,))} {count}')
+                lines.append(f'{self.name}_bucket{format_labels(labelnames, labels + ("+Inf",))} {series["count"]}')
+                lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {series["sum"]}')
+                lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} {series["count"]}')
+        return lines
+
+class ScanMetrics:
+    """Process-wide counters and histograms for scans, AWS API calls and caches"""
+
+    def __init__(self):
+        self.scan_duration = Histogram('scan_duration_seconds', 'Time to scan one (service, region) cell', ('service', 'region'))
+        self.scan_resources = Counter('scan_resources_total', 'Resources returned by scans', ('service', 'region'))
+        self.scan_errors = Counter('scan_errors_total', 'Cell scans that raised an error', ('service', 'region'))
+        self.api_duration = Histogram('aws_api_call_duration_seconds', 'AWS API call latency including retries', ('service', 'region'))
+        self.api_calls = Counter('aws_api_calls_total', 'AWS API calls made', ('service', 'region', 'operation'))
+        self.api_errors = Counter('aws_api_errors_total', 'AWS API calls that failed', ('service', 'region', 'operation', 'code'))
+        self.api_retries = Counter('aws_api_retries_total', 'AWS API call retry attempts', ('service', 'region', 'operation'))
+        self.api_throttles = Counter('aws_api_throttles_total', 'AWS API responses that were throttled', ('service', 'region', 'operation'))
+        self.cache_requests = Counter('cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+        self.scheduler_tasks = Gauge('scan_scheduler_tasks', 'Scan tasks in the scheduler by service and state', ('service', 'state'))
+        self.pruned = Gauge('scan_pruned', 'Cells backed off for being empty and regions skipped as blocked', ('kind',))
+        self.refresher_cells = Gauge('scan_refresher_cells', 'Cells tracked by the background refresher and how many are due', ('state',))
+        self.rate_limit = Gauge('aws_rate_limit_per_second', 'Current adaptive rate limit per AWS API endpoint', ('service', 'region', 'account'))
+        self.rate_limit_wait = Gauge('aws_rate_limit_wait_seconds', 'Total seconds calls have waited for the rate limiter', ('service', 'region', 'account'))
+        self._collectors = []
+
+    def observe_scan(self, service_type, region, seconds, resource_count):
+        self.scan_duration.observe(service_type, region, value=seconds)
+        self.scan_resources.inc(service_type, region, amount=resource_count)
+
+    def cache_hit(self, cache):
+        self.cache_requests.inc(cache, 'hit')
+
+    def cache_miss(self, cache):
+        self.cache_requests.inc(cache, 'miss')
+
+    def add_collector(self, collector):
+        """Register a callable run before each render, e.g. to refresh gauges"""
+        self._collectors.append(collector)
+
+    def instrument_client(self, client):
+        """Record call counts, latency, retries, throttles and errors for every call a client makes"""
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name or 'global'
+
+        def before_call(model, context, **kwargs):
+            context['metrics_operation'] = model.name
+            context['metrics_started'] = time.perf_counter()
+            context['metrics_throttles'] = 0
+
+        def response_received(parsed_response, context, **kwargs):
+            # Emitted once per HTTP attempt, so throttles that are retried still count
+            error_code = (parsed_response or {}).get('Error', {}).get('Code')
+            if error_code in THROTTLE_ERROR_CODES:
+                context['metrics_throttles'] = context.get('metrics_throttles', 0) + 1
+                self.api_throttles.inc(service, region, context.get('metrics_operation', 'unknown'))
+
+        def after_call(http_response, parsed, model, context, **kwargs):
+            operation = model.name
+            self.api_calls.inc(service, region, operation)
+            started = context.get('metrics_started')
+            if started is not None:
+                self.api_duration.observe(service, region, value=time.perf_counter() - started)
+
+            retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            if retries:
+                self.api_retries.inc(service, region, operation, amount=retries)
+
+            if http_response.status_code >= 300:
+                error_code = (parsed or {}).get('Error', {}).get('Code', str(http_response.status_code))
+                self.api_errors.inc(service, region, operation, error_code)
+                if error_code in THROTTLE_ERROR_CODES and not context.get('metrics_throttles'):
+                    self.api_throttles.inc(service, region, operation)
+
+        def after_call_error(exception, context, **kwargs):
+            self.api_errors.inc(service, region, context.get('metrics_operation', 'unknown'), type(exception).__name__)
+
+        client.meta.events.register('before-call', before_call)
+        client.meta.events.register('response-received', response_received)
+        client.meta.events.register('after-call', after_call)
+        client.meta.events.register('after-call-error', after_call_error)
+        return client
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in (
+            self.scan_duration, self.scan_resources, self.scan_errors,
+            self.api_duration, self.api_calls, self.api_errors, self.api_retries, self.api_throttles,
+            self.cache_requests, self.scheduler_tasks, self.pruned, self.refresher_cells,
+            self.rate_limit, self.rate_limit_wait
+        ):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = ScanMetrics()
@@ -0,0 +1,123 @@
+import threading
+import time
+
+# Errors AWS returns for calls to regions the account has not opted in to
+BLOCKED_REGION_ERROR_CODES = {'OptInRequired'}
+
+# describe_regions opt-in statuses of regions the account can call
+ENABLED_OPT_IN_STATUSES = {'opt-in-not-required', 'opted-in'}
+
+def error_code(exception, codes):
+    # Only ever called with an exception in hand, by which time botocore is loaded
+    from botocore.exceptions import ClientError
+    if isinstance(exception, ClientError):
+        code = exception.response.get('Error', {}).get('Code')
+        if code in codes:
+            return code
+    return None
+
+def blocked_error_code(exception):
+    """Return the error code if an exception means the region is blocked for this account, else None"""
+    return error_code(exception, BLOCKED_REGION_ERROR_CODES)
+
+def is_empty(resources):
+    """A cell counts as empty when it holds nothing but AWS defaults such as the default VPC"""
+    return all(resource.get('is_default') for resource in resources)
+
+class RegionPruner:
+    """Keeps scans away from regions and cells that are blocked or keep coming back empty
+
+    The region list from describe_regions is cached for regions_ttl seconds.
+    Regions whose opt-in status blocks access are left out of it, and so are
+    regions whose calls fail with an opt-in error, for blocked_ttl seconds.
+    Credential errors block nothing. A cell found empty on n consecutive scans may be served from
+    its snapshot for 2**(n - 1) times the cache TTL, up to max_empty_age
+    seconds, so empty cells are probed exponentially less often.
+    """
+
+    def __init__(self, regions_ttl=3600, blocked_ttl=3600, max_empty_age=86400):
+        self.regions_ttl = regions_ttl
+        self.blocked_ttl = blocked_ttl
+        self.max_empty_age = max_empty_age
+        self._lock = threading.Lock()
+        self._regions = None
+        self._regions_expire_at = 0.0
+        self._blocked = {}
+        self._empty_streaks = {}
+
+    def init_app(self, app):
+        self.regions_ttl = app.config.get('SCAN_REGIONS_TTL', 3600)
+        self.blocked_ttl = app.config.get('SCAN_BLOCKED_REGION_TTL', 3600)
+        self.max_empty_age = app.config.get('SCAN_EMPTY_MAX_AGE', 86400)
+
+    def get_regions(self, fetch):
+        """Return the cached enabled regions minus blocked ones, calling fetch() when the cache expires
+
+        fetch returns describe_regions' Regions list. If it fails, the last
+        known list is kept for another TTL.
+        """
+        now = time.monotonic()
+        with self._lock:
+            regions = self._regions if now < self._regions_expire_at else None
+        if regions is None:
+            try:
+                regions = [
+                    region['RegionName'] for region in fetch()
+                    if region.get('OptInStatus', 'opt-in-not-required') in ENABLED_OPT_IN_STATUSES
+                ]
+            except Exception as e:
+                with self._lock:
+                    if self._regions is None:
+                        raise
+                    print(f"Error refreshing regions, using cached list: {str(e)}")
+                    regions = self._regions
+            with self._lock:
+                self._regions = regions
+                self._regions_expire_at = now + self.regions_ttl
+        blocked = self.blocked_regions()
+        return [region for region in regions if region not in blocked]
+
+    def block_region(self, region, code):
+        with self._lock:
+            if region not in self._blocked:
+                print(f"Skipping region {region} for {self.blocked_ttl}s: {code}")
+            self._blocked[region] = time.monotonic() + self.blocked_ttl
+
+    def blocked_regions(self):
+        now = time.monotonic()
+        with self._lock:
+            for region, expires_at in list(self._blocked.items()):
+                if expires_at <= now:
+                    del self._blocked[region]
+            return set(self._blocked)
+
+    def observe(self, cell, resources):
+        """Record a completed scan of a cell"""
+        with self._lock:
+            if is_empty(resources):
+                self._empty_streaks[cell] = self._empty_streaks.get(cell, 0) + 1
+            else:
+                self._empty_streaks.pop(cell, None)
+
+    def max_age(self, cell, max_age):
+        """Seconds a cell's snapshot may be served, stretched for cells that keep coming back empty"""
+        if max_age <= 0:
+            return max_age
+        with self._lock:
+            streak = self._empty_streaks.get(cell, 0)
+        if streak < 2:
+            return max_age
+        return max(max_age, min(max_age * 2 ** (streak - 1), self.max_empty_age))
+
+    def stats(self):
+        with self._lock:
+            return {'empty_cells': len(self._empty_streaks), 'blocked_regions': len(self._blocked)}
+
+    def clear(self):
+        with self._lock:
+            self._regions = None
+            self._regions_expire_at = 0.0
+            self._blocked.clear()
+            self._empty_streaks.clear()
+
+pruner = RegionPruner()
@@ -0,0 +1,201 @@
+import base64
+import bisect
+import collections
+import json
+import threading
+from src.discovery.changes import resource_hashes
+from src.discovery.compact import ResourceTable
+
+# Resource filters of paginated queries and exports, on top of ?services= and ?regions=
+FILTER_PARAMS = ('states', 'tag_key', 'tag_value', 'q')
+# Paging parameters, only taken with ?paginate=true
+PAGE_PARAMS = ('cursor', 'limit')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def split_param(value):
+    """Split a comma-separated query parameter into a set, or None when absent"""
+    if not value:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()} or None
+
+def wants_page(args):
+    """Whether a request asks for a paginated query response with ?paginate=true"""
+    return args.get('paginate', '').lower() in ('1', 'true', 'yes')
+
+def has_filters(args):
+    return any(param in args for param in FILTER_PARAMS)
+
+def parse_query(args):
+    """Build a query dict from request args: ?services=, ?regions=, the FILTER_PARAMS and the PAGE_PARAMS"""
+    limit = args.get('limit', type=int) or DEFAULT_PAGE_SIZE
+    states = split_param(args.get('states'))
+    return {
+        'services': split_param(args.get('services')),
+        'regions': split_param(args.get('regions')),
+        'states': {state.lower() for state in states} if states else None,
+        'tag_key': args.get('tag_key') or None,
+        'tag_value': args.get('tag_value') or None,
+        'text': (args.get('q') or '').strip().lower() or None,
+        'cursor': args.get('cursor') or None,
+        'limit': max(1, min(limit, MAX_PAGE_SIZE))
+    }
+
+def encode_cursor(cell, resource_id):
+    raw = json.dumps([cell[0], cell[1], resource_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor into ((region, service_type), resource_id)"""
+    try:
+        region, service_type, resource_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return (region, service_type), resource_id
+
+class CellIndex:
+    """Resources of one (region, service_type) snapshot, sorted by ID, with lookup indexes
+
+    The resources are held in a compact ResourceTable.
+    """
+
+    def __init__(self, version, resources):
+        self.version = version
+        resources = sorted(resources, key=lambda resource: str(resource.get('resource_id', '')))
+        self.resources = ResourceTable(resources)
+        self.ids = [str(resource.get('resource_id', '')) for resource in resources]
+        self.by_region = collections.defaultdict(list)
+        self.by_state = collections.defaultdict(list)
+        self.by_tag_key = collections.defaultdict(list)
+        self.by_tag_value = collections.defaultdict(list)
+        self.by_tag = collections.defaultdict(list)
+        self.search_text = []
+        self._hashes = None
+
+        for position, resource in enumerate(resources):
+            self.by_region[resource.get('region')].append(position)
+            self.by_state[str(resource.get('state', '')).lower()].append(position)
+            for tag in resource.get('tags') or []:
+                key, value = tag.get('Key', tag.get('key')), tag.get('Value', tag.get('value'))
+                self.by_tag_key[key].append(position)
+                self.by_tag_value[value].append(position)
+                self.by_tag[(key, value)].append(position)
+            self.search_text.append('\n'.join([
+                str(resource.get('name', '')),
+                str(resource.get('resource_id', '')),
+                str(resource.get('service_type', ''))
+            ]).lower())
+
+    def content_hashes(self):
+        """Map each resource ID to the content hash of the resource, computed on first use"""
+        if self._hashes is None:
+            self._hashes = resource_hashes(self.resources)
+        return self._hashes
+
+    def match(self, query):
+        """Return the sorted positions of resources matching the query"""
+        candidates = None
+
+        def narrow(positions):
+            nonlocal candidates
+            positions = set(positions)
+            candidates = positions if candidates is None else candidates & positions
+
+        if query['regions']:
+            narrow(position for region in query['regions'] for position in self.by_region.get(region, ()))
+        if query['states']:
+            narrow(position for state in query['states'] for position in self.by_state.get(state, ()))
+        if query['tag_key'] and query['tag_value']:
+            narrow(self.by_tag.get((query['tag_key'], query['tag_value']), ()))
+        elif query['tag_key']:
+            narrow(self.by_tag_key.get(query['tag_key'], ()))
+        elif query['tag_value']:
+            narrow(self.by_tag_value.get(query['tag_value'], ()))
+
+        positions = sorted(candidates) if candidates is not None else range(len(self.resources))
+        if query['text']:
+            positions = [position for position in positions if query['text'] in self.search_text[position]]
+        return list(positions)
+
+class InventoryIndex:
+    """In-memory, per-cell indexed copy of the latest snapshots
+
+    Cells are keyed by (region, service_type) and versioned by snapshot ID, so a
+    snapshot is parsed and indexed once and then served from memory until a
+    newer snapshot replaces it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cells = {}
+
+    def get_resources(self, cell, version):
+        """Return a cell's resources if the index holds that snapshot version"""
+        cell_index = self._cells.get(cell)
+        if cell_index is None or cell_index.version != version:
+            return None
+        return cell_index.resources
+
+    def find(self, cell, resource_id):
+        """Return the resource with resource_id from the cell's indexed snapshot, or None"""
+        cell_index = self._cells.get(cell)
+        if cell_index is None:
+            return None
+        position = bisect.bisect_left(cell_index.ids, resource_id)
+        if position == len(cell_index.ids) or cell_index.ids[position] != resource_id:
+            return None
+        return cell_index.resources[position]
+
+    def select(self, cell, query):
+        """Yield the resources of the cell's indexed snapshot matching a query's filters, ignoring its cursor and limit"""
+        cell_index = self._cells.get(cell)
+        if cell_index is None or (query['services'] and cell[1] not in query['services']):
+            return
+        for position in cell_index.match(query):
+            yield cell_index.resources[position]
+
+    def get_hashes(self, cell, version):
+        """Return a cell's per-resource content hashes if the index holds that snapshot version"""
+        cell_index = self._cells.get(cell)
+        if cell_index is None or cell_index.version != version:
+            return None
+        return cell_index.content_hashes()
+
+    def load(self, cell, version, resources):
+        cell_index = CellIndex(version, resources)
+        with self._lock:
+            self._cells[cell] = cell_index
+        return cell_index.resources
+
+    def query(self, cells, query):
+        """Run a query over the given cells, returning (page, next_cursor, total_matches)"""
+        after_cell, after_id = decode_cursor(query['cursor']) if query['cursor'] else (None, None)
+        with self._lock:
+            cell_indexes = [(cell, self._cells[cell]) for cell in sorted(cells) if cell in self._cells]
+
+        page = []
+        last = None
+        next_cursor = None
+        total = 0
+        for cell, cell_index in cell_indexes:
+            if query['services'] and cell[1] not in query['services']:
+                continue
+
+            positions = cell_index.match(query)
+            total += len(positions)
+            if next_cursor is not None or (after_cell is not None and cell < after_cell):
+                continue
+            if cell == after_cell:
+                start = bisect.bisect_right(cell_index.ids, after_id)
+                positions = positions[bisect.bisect_left(positions, start):]
+
+            room = query['limit'] - len(page)
+            if room > 0 and positions:
+                page.extend(cell_index.resources[position] for position in positions[:room])
+                last = (cell, cell_index.ids[positions[:room][-1]])
+            if len(positions) > room:
+                next_cursor = encode_cursor(*last)
+
+        return page, next_cursor, total
+
+inventory_index = InventoryIndex()
@@ -0,0 +1,215 @@
+import threading
+import time
+from src.discovery.metrics import THROTTLE_ERROR_CODES
+
+def throttle_error_code(exception):
+    """Return the error code if an exception is an AWS throttling error, else None"""
+    from botocore.exceptions import ClientError
+    if isinstance(exception, ClientError):
+        code = exception.response.get('Error', {}).get('Code')
+        if code in THROTTLE_ERROR_CODES:
+            return code
+    return None
+
+class TokenBucket:
+    """Allows rate acquisitions per second on average, in bursts of at most burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def reserve(self):
+        """Take a token, returning the seconds to wait before it may be used
+
+        Tokens can go negative, so concurrent callers queue behind each other
+        in the order they reserved instead of all retrying at once.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+class AdaptiveRateLimiter(TokenBucket):
+    """Token bucket for one AWS API endpoint whose rate adapts to throttling (AIMD)
+
+    Until the first throttle, each successful call raises the rate by one
+    call per second, doubling it about every second (a slow start, as in
+    TCP), so an endpoint quickly finds its quota. After that, each success
+    raises the rate by increase / rate, about increase per second of steady
+    traffic. The rate stays within min_rate and max_rate. A throttled
+    response multiplies the rate by decrease and drops any saved-up burst.
+    Responses to calls made before the last decrease were sent at the old
+    rate, so throttles within cooldown seconds of it do not cut again.
+    """
+
+    def __init__(self, rate, burst, min_rate, max_rate, increase, decrease, cooldown=1.0):
+        super().__init__(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._decreased = 0.0
+        self.slow_start = True
+        self.successes = 0
+        self.throttles = 0
+        self.decreases = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        """Wait for a token"""
+        wait = self.reserve()
+        if wait > 0:
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += wait
+            time.sleep(wait)
+
+    def succeeded(self):
+        with self._lock:
+            self.successes += 1
+            self._refill()
+            step = 1.0 if self.slow_start else self.increase / self.rate
+            self.rate = min(self.max_rate, self.rate + step)
+
+    def throttled(self):
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self._decreased < self.cooldown:
+                return
+            self._decreased = now
+            self.decreases += 1
+            self.slow_start = False
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self):
+        with self._lock:
+            self._refill()
+            return {
+                'rate': round(self.rate, 3),
+                'slow_start': self.slow_start,
+                'tokens': round(self._tokens, 3),
+                'successes': self.successes,
+                'throttles': self.throttles,
+                'decreases': self.decreases,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3)
+            }
+
+class RateLimiters:
+    """One AdaptiveRateLimiter per (service, region) endpoint, applied to every call of the pooled clients
+
+    Every HTTP attempt, including botocore's retries, waits for a token
+    before it is sent. Throttled responses,
+    including attempts botocore retries, slow the endpoint down, and
+    successes speed it up, so each endpoint settles near the highest rate
+    its quota sustains. Clients for an IAM role get their own limiters,
+    since quotas are per account. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate=10.0, burst=10, min_rate=0.5, max_rate=100.0, increase=1.0, decrease=0.5):
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self.configure(rate, burst, min_rate, max_rate, increase, decrease)
+
+    def init_app(self, app):
+        self.configure(
+            rate=app.config.get('AWS_RATE_LIMIT', 10.0),
+            burst=app.config.get('AWS_RATE_LIMIT_BURST', 10),
+            min_rate=app.config.get('AWS_RATE_LIMIT_MIN', 0.5),
+            max_rate=app.config.get('AWS_RATE_LIMIT_MAX', 100.0),
+            increase=app.config.get('AWS_RATE_LIMIT_INCREASE', 1.0),
+            decrease=app.config.get('AWS_RATE_LIMIT_DECREASE', 0.5)
+        )
+
+    def configure(self, rate=10.0, burst=10, min_rate=0.5, max_rate=100.0, increase=1.0, decrease=0.5):
+        """Set the starting rate and AIMD parameters for new limiters and drop the existing ones"""
+        with self._lock:
+            self.settings = {
+                'rate': rate,
+                'burst': burst,
+                'min_rate': min_rate,
+                'max_rate': max_rate,
+                'increase': increase,
+                'decrease': decrease
+            }
+            self._limiters.clear()
+
+    def get(self, service, region, role_arn=None):
+        """Get the limiter of an endpoint, creating it at the starting rate"""
+        key = (service, region, role_arn)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = AdaptiveRateLimiter(**self.settings)
+            return limiter
+
+    def instrument_client(self, client, role_arn=None):
+        """Make every call a client makes wait for its endpoint's limiter and report throttles to it"""
+        if not self.settings['rate']:
+            return client
+        limiter = self.get(client.meta.service_model.service_name, client.meta.region_name or 'global', role_arn)
+
+        def before_call(context, **kwargs):
+            context['rate_limit_throttled'] = False
+
+        def before_send(**kwargs):
+            # Emitted once per HTTP attempt, so retries after a throttle wait for a token too
+            limiter.acquire()
+
+        def response_received(parsed_response, context, **kwargs):
+            # Emitted once per HTTP attempt, so throttles that botocore retries slow the endpoint down too
+            if (parsed_response or {}).get('Error', {}).get('Code') in THROTTLE_ERROR_CODES:
+                context['rate_limit_throttled'] = True
+                limiter.throttled()
+
+        def after_call(http_response, parsed, context, **kwargs):
+            if http_response.status_code < 300:
+                limiter.succeeded()
+            elif (parsed or {}).get('Error', {}).get('Code') in THROTTLE_ERROR_CODES and not context.get('rate_limit_throttled'):
+                limiter.throttled()
+
+        client.meta.events.register('before-call', before_call)
+        client.meta.events.register('before-send', before_send)
+        client.meta.events.register('response-received', response_received)
+        client.meta.events.register('after-call', after_call)
+        return client
+
+    def stats(self):
+        """Return a list of every limiter's endpoint and state"""
+        with self._lock:
+            limiters = list(self._limiters.items())
+        entries = []
+        for (service, region, role_arn), limiter in sorted(limiters, key=lambda item: tuple(str(part) for part in item[0])):
+            entry = {'service': service, 'region': region}
+            if role_arn:
+                entry['role_arn'] = role_arn
+            entry.update(limiter.stats())
+            entries.append(entry)
+        return entries
+
+    def clear(self):
+        with self._lock:
+            self._limiters.clear()
+
+rate_limiters = RateLimiters()
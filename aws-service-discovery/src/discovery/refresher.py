@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from src.discovery.pruning import pruner
+from src.discovery.ratelimit import TokenBucket
+
+# How much faster or slower than SCAN_CACHE_TTL a cell may be refreshed
+MIN_INTERVAL_FACTOR = 0.8
+MAX_INTERVAL_FACTOR = 8.0
+
+# Scan seconds at which a cell's refresh interval is doubled for cost
+COST_UNIT_SECONDS = 30.0
+
+# Weight of the newest scan in the change rate and cost moving averages
+EWMA_ALPHA = 0.3
+
+class BackgroundRefresher:
+    """Rescans (region, service) cells in the background before requests find them stale
+
+    Every cell has its own refresh interval. Cells whose content changes on
+    most scans are refreshed slightly ahead of SCAN_CACHE_TTL. Cells that
+    rarely change are refreshed less often, and cells that are slow to scan
+    even less, up to MAX_INTERVAL_FACTOR times the TTL. Cells that keep
+    coming back empty wait as long as the region pruner serves them. Each
+    interval gets random jitter so cells scanned together drift apart.
+    Refresh tasks are started at most rate per second (with bursts of
+    burst), so the refresher never bursts against AWS API quotas.
+    """
+
+    def __init__(self, ttl=300, tick=1.0, rate=2.0, burst=5, jitter=0.2):
+        self.ttl = ttl
+        self.tick = tick
+        self.jitter = jitter
+        self.bucket = TokenBucket(rate, burst)
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SCAN_CACHE_TTL', 300)
+        self.tick = app.config.get('SCAN_REFRESH_TICK', 1.0)
+        self.jitter = app.config.get('SCAN_REFRESH_JITTER', 0.2)
+        self.bucket = TokenBucket(app.config.get('SCAN_REFRESH_RATE', 2.0), app.config.get('SCAN_REFRESH_BURST', 5))
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def interval(self, cell, entry):
+        """Seconds between refreshes of a cell, from its change rate, scan cost and empty streak"""
+        stability = 1.0 - entry['change_rate']
+        factor = MIN_INTERVAL_FACTOR + (MAX_INTERVAL_FACTOR / 2 - MIN_INTERVAL_FACTOR) * stability
+        factor *= 1.0 + min(entry['cost'], COST_UNIT_SECONDS) / COST_UNIT_SECONDS
+        return max(self.ttl * min(factor, MAX_INTERVAL_FACTOR), pruner.max_age(cell, self.ttl))
+
+    def _schedule(self, cell, entry, now):
+        interval = self.interval(cell, entry)
+        entry['next_due'] = now + interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def _entry(self, cell):
+        entry = self._cells.get(cell)
+        if entry is None:
+            # Unknown cells are assumed to change on every scan until observed
+            entry = self._cells[cell] = {'fingerprint': None, 'change_rate': 1.0, 'cost': 0.0, 'last_scanned': None, 'next_due': 0.0}
+        return entry
+
+    def seed(self, cell, scanned_at=None):
+        """Track a cell, due one interval after its last scan (or now if never scanned)"""
+        with self._lock:
+            if cell in self._cells:
+                return
+            entry = self._entry(cell)
+            if scanned_at is not None:
+                entry['last_scanned'] = scanned_at
+                self._schedule(cell, entry, scanned_at)
+
+    def observe(self, cell, fingerprint, seconds):
+        """Record a completed scan of a cell and schedule its next refresh"""
+        now = time.time()
+        with self._lock:
+            entry = self._entry(cell)
+            if entry['fingerprint'] is not None:
+                changed = 1.0 if fingerprint != entry['fingerprint'] else 0.0
+                entry['change_rate'] += EWMA_ALPHA * (changed - entry['change_rate'])
+                entry['cost'] += EWMA_ALPHA * (seconds - entry['cost'])
+            else:
+                entry['cost'] = seconds
+            entry['fingerprint'] = fingerprint
+            entry['last_scanned'] = now
+            self._schedule(cell, entry, now)
+
+    def request(self, cells):
+        """Make cells due now, e.g. when a request served their stale snapshot"""
+        with self._lock:
+            for cell in cells:
+                self._entry(cell)['next_due'] = 0.0
+
+    def due(self):
+        """Cells whose refresh is due, most overdue first"""
+        now = time.time()
+        with self._lock:
+            due = [(entry['next_due'], cell) for cell, entry in self._cells.items() if entry['next_due'] <= now]
+        return [cell for _, cell in sorted(due)]
+
+    def started(self, cells):
+        """Push back the next refresh of cells whose refresh task was just started"""
+        now = time.time()
+        with self._lock:
+            for cell in cells:
+                self._schedule(cell, self._entry(cell), now)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            due = sum(1 for entry in self._cells.values() if entry['next_due'] <= now)
+            return {'running': self.running, 'tracked': len(self._cells), 'due': due}
+
+    def start(self, setup, run_once):
+        """Run setup() once and then run_once() every tick on a daemon thread"""
+        if self.running:
+            return
+
+        def loop():
+            try:
+                setup()
+            except Exception as e:
+                print(f"Error starting background refresh: {str(e)}")
+            while not self._stop.wait(self.tick):
+                try:
+                    run_once()
+                except Exception as e:
+                    print(f"Error in background refresh: {str(e)}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+refresher = BackgroundRefresher()
@@ -0,0 +1,344 @@
+from src.discovery.clients import client_pool
+from src.discovery.details import detail_fetcher
+from src.discovery.ratelimit import throttle_error_code
+
+def field(*path, default='N/A'):
+    """Extract a (nested) key from an API item, falling back to default when missing"""
+    def extract(item):
+        value = item
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return default
+            value = value[key]
+        return value
+    return extract
+
+def timestamp(*path):
+    """Extract a datetime from an API item as an ISO 8601 string"""
+    get = field(*path, default=None)
+    def extract(item):
+        value = get(item)
+        return value.isoformat() if value else 'N/A'
+    return extract
+
+def tag(key, default='N/A'):
+    """Extract the value of a tag from an item's Tags list"""
+    def extract(item):
+        for item_tag in item.get('Tags') or []:
+            if item_tag['Key'] == key:
+                return item_tag['Value']
+        return default
+    return extract
+
+def constant(value):
+    return lambda item: value
+
+def last_segment(key, separator):
+    """Extract the last separator-delimited segment of a key, e.g. a name from an ARN or URL"""
+    return lambda item: item[key].split(separator)[-1]
+
+class ServiceSpec:
+    """Declaration of how to discover one service's resources
+
+    The listing is a paginated call to operation on the service client, with
+    page_size passed to the paginator when the API accepts one. items turns a
+    page into the listed items (by default page[result_key]). batch_detail,
+    when set, replaces each page's items with the result of one batch call,
+    e.g. ECS DescribeClusters. fields build the resource from a listed item.
+
+    detail, when set, is a per-item call returning a dict that detail_fields
+    are extracted from. Detail calls run concurrently on the detail pool and
+    are deferred by SCAN_LIST_ONLY unless deferrable is False. cached_fields
+    are remembered from detail calls and reused while details are deferred.
+
+    links maps fields holding the ID of a related resource to its service
+    type, e.g. {'vpc_id': 'VPC'}; the topology index joins resources on them.
+    """
+
+    def __init__(self, service_type, resource_type, client, operation, result_key=None, page_size=None,
+                 items=None, batch_detail=None, fields=None, detail=None, detail_fields=None,
+                 deferrable=True, cached_fields=(), global_service=False, links=None):
+        self.service_type = service_type
+        self.resource_type = resource_type
+        self.client = client
+        self.operation = operation
+        self.page_size = page_size
+        self.items = items or (lambda page: page.get(result_key, []))
+        self.batch_detail = batch_detail
+        self.fields = fields or {}
+        self.detail = detail
+        self.detail_fields = detail_fields or {}
+        self.deferrable = deferrable
+        self.cached_fields = tuple(cached_fields)
+        self.global_service = global_service
+        self.links = links or {}
+
+    def get_client(self, region, role_arn=None):
+        return client_pool.get_client(self.client, None if self.global_service else region, role_arn=role_arn)
+
+def detail_cache_key(spec, region, resource_id, role_arn=None):
+    return (spec.service_type, role_arn, region, resource_id)
+
+def list_resource(spec, item, region):
+    """Build a resource from a listed item, without its detail fields"""
+    resource = {
+        'service_type': spec.service_type,
+        'resource_type': spec.resource_type,
+        'state': 'N/A',
+        'region': region,
+        'availability_zone': 'N/A',
+        'tags': []
+    }
+    for name, extract in spec.fields.items():
+        resource[name] = extract(item)
+    return resource
+
+def describe_resource(spec, client, item, region, role_arn=None):
+    """Build a resource including its detail fields, or None if the detail call fails"""
+    resource = list_resource(spec, item, region)
+    if spec.detail is None:
+        return resource
+
+    try:
+        detail = spec.detail(client, item)
+    except Exception as e:
+        if throttle_error_code(e) is not None:
+            raise
+        print(f"Error getting {spec.service_type} details for {resource['resource_id']}: {str(e)}")
+        return None
+
+    for name, extract in spec.detail_fields.items():
+        resource[name] = extract(detail)
+    if spec.cached_fields:
+        detail_fetcher.set_cached(detail_cache_key(spec, region, resource['resource_id'], role_arn), {name: resource[name] for name in spec.cached_fields})
+    return resource
+
+def deferred_resource(spec, item, region, role_arn=None):
+    """Build a resource whose detail call is deferred, filling in any cached detail fields"""
+    resource = list_resource(spec, item, region)
+    resource['details_deferred'] = True
+    if spec.cached_fields:
+        resource.update(detail_fetcher.get_cached(detail_cache_key(spec, region, resource['resource_id'], role_arn)) or {})
+    return resource
+
+def scan_service(spec, region, role_arn=None):
+    """Scan one service in a region from its spec, yielding resources page by page
+
+    With role_arn, the scan runs in that role's account. Any error listing
+    a page, including one after earlier pages were yielded, is raised, so
+    the cell keeps its last snapshot instead of saving a partial list.
+    """
+    client = spec.get_client(region, role_arn)
+    pagination_config = {'PageSize': spec.page_size} if spec.page_size else {}
+    paginator = client.get_paginator(spec.operation)
+    for page in paginator.paginate(PaginationConfig=pagination_config):
+        items = spec.items(page)
+        if spec.batch_detail is not None:
+            if not items:
+                continue
+            items = spec.batch_detail(client, items)
+
+        if spec.detail is None:
+            for item in items:
+                yield list_resource(spec, item, region)
+        elif detail_fetcher.list_only and spec.deferrable:
+            for item in items:
+                yield deferred_resource(spec, item, region, role_arn)
+        else:
+            # Make the detail calls concurrently
+            for resource in detail_fetcher.map(lambda item: describe_resource(spec, client, item, region, role_arn), items):
+                if resource is not None:
+                    yield resource
+
+def get_bucket_region(s3, bucket):
+    """Get a bucket's region, caching lookups because it never changes"""
+    # Paginated ListBuckets returns the region; older endpoints need a lookup
+    if bucket.get('BucketRegion'):
+        return bucket['BucketRegion']
+
+    def fetch():
+        location_response = s3.get_bucket_location(Bucket=bucket['Name'])
+        return location_response['LocationConstraint'] or 'us-east-1'
+    try:
+        return detail_fetcher.cached(('S3', 'region', bucket['Name']), fetch)
+    except:
+        return 'unknown'
+
+def describe_sqs_queue(sqs, item):
+    return sqs.get_queue_attributes(QueueUrl=item['QueueUrl'], AttributeNames=['All'])['Attributes']
+
+SERVICE_SPECS = {}
+
+def register(spec):
+    """Add a service to the registry, making it available to scans and ?services="""
+    SERVICE_SPECS[spec.service_type] = spec
+    return spec
+
+register(ServiceSpec(
+    'EC2', 'Instance', 'ec2', 'describe_instances', page_size=1000,
+    items=lambda page: [instance for reservation in page['Reservations'] for instance in reservation['Instances']],
+    fields={
+        'resource_id': field('InstanceId'),
+        'name': tag('Name'),
+        'state': field('State', 'Name'),
+        'availability_zone': field('Placement', 'AvailabilityZone'),
+        'instance_type': field('InstanceType'),
+        'launch_time': timestamp('LaunchTime'),
+        'vpc_id': field('VpcId'),
+        'subnet_id': field('SubnetId'),
+        'tags': field('Tags', default=[])
+    },
+    links={'vpc_id': 'VPC', 'subnet_id': 'Subnet'}
+))
+
+register(ServiceSpec(
+    'RDS', 'DB Instance', 'rds', 'describe_db_instances', 'DBInstances', page_size=100,
+    fields={
+        'resource_id': field('DBInstanceIdentifier'),
+        'name': field('DBInstanceIdentifier'),
+        'state': field('DBInstanceStatus'),
+        'availability_zone': field('AvailabilityZone'),
+        'instance_type': field('DBInstanceClass'),
+        'engine': field('Engine'),
+        'vpc_id': field('DBSubnetGroup', 'VpcId'),
+        'created_time': timestamp('InstanceCreateTime')
+    },
+    links={'vpc_id': 'VPC'}
+))
+
+register(ServiceSpec(
+    'Lambda', 'Function', 'lambda', 'list_functions', 'Functions', page_size=50,
+    fields={
+        'resource_id': field('FunctionName'),
+        'name': field('FunctionName'),
+        'state': field('State'),
+        'runtime': field('Runtime'),
+        'memory_size': field('MemorySize'),
+        'last_modified': field('LastModified'),
+        'vpc_id': lambda function: (function.get('VpcConfig') or {}).get('VpcId') or 'N/A'
+    },
+    links={'vpc_id': 'VPC'}
+))
+
+register(ServiceSpec(
+    'VPC', 'VPC', 'ec2', 'describe_vpcs', 'Vpcs', page_size=1000,
+    fields={
+        'resource_id': field('VpcId'),
+        'name': tag('Name'),
+        'state': field('State'),
+        'cidr_block': field('CidrBlock'),
+        'is_default': field('IsDefault', default=False),
+        'tags': field('Tags', default=[])
+    }
+))
+
+register(ServiceSpec(
+    'ELB', None, 'elbv2', 'describe_load_balancers', 'LoadBalancers', page_size=400,
+    fields={
+        'resource_type': lambda lb: f"{lb['Type'].title()} Load Balancer",
+        'resource_id': field('LoadBalancerName'),
+        'name': field('LoadBalancerName'),
+        'state': field('State', 'Code'),
+        'availability_zone': lambda lb: ', '.join(az['ZoneName'] for az in lb.get('AvailabilityZones', [])),
+        'scheme': field('Scheme'),
+        'vpc_id': field('VpcId'),
+        'created_time': timestamp('CreatedTime')
+    },
+    links={'vpc_id': 'VPC'}
+))
+
+# DescribeStacks has a fixed page size
+register(ServiceSpec(
+    'CloudFormation', 'Stack', 'cloudformation', 'describe_stacks', 'Stacks',
+    fields={
+        'resource_id': field('StackName'),
+        'name': field('StackName'),
+        'state': field('StackStatus'),
+        'creation_time': timestamp('CreationTime'),
+        'template_description': field('Description'),
+        'tags': field('Tags', default=[])
+    }
+))
+
+# Each page of up to 100 cluster ARNs fits in one DescribeClusters call
+register(ServiceSpec(
+    'ECS', 'Cluster', 'ecs', 'list_clusters', 'clusterArns', page_size=100,
+    batch_detail=lambda ecs, arns: ecs.describe_clusters(clusters=arns)['clusters'],
+    fields={
+        'resource_id': field('clusterName'),
+        'name': field('clusterName'),
+        'state': field('status'),
+        'running_tasks': field('runningTasksCount', default=0),
+        'pending_tasks': field('pendingTasksCount', default=0),
+        'active_services': field('activeServicesCount', default=0),
+        'tags': field('tags', default=[])
+    }
+))
+
+# ListTopics has a fixed page size of 100
+register(ServiceSpec(
+    'SNS', 'Topic', 'sns', 'list_topics', 'Topics',
+    fields={
+        'resource_id': last_segment('TopicArn', ':'),
+        'name': last_segment('TopicArn', ':'),
+        'state': constant('Active'),
+        'topic_arn': field('TopicArn')
+    },
+    detail=lambda sns, topic: sns.get_topic_attributes(TopicArn=topic['TopicArn'])['Attributes'],
+    detail_fields={
+        'subscriptions_confirmed': field('SubscriptionsConfirmed', default='0'),
+        'subscriptions_pending': field('SubscriptionsPending', default='0'),
+        'display_name': field('DisplayName')
+    }
+))
+
+register(ServiceSpec(
+    'SQS', 'Queue', 'sqs', 'list_queues', page_size=1000,
+    items=lambda page: [{'QueueUrl': queue_url} for queue_url in page.get('QueueUrls', [])],
+    fields={
+        'resource_id': last_segment('QueueUrl', '/'),
+        'name': last_segment('QueueUrl', '/'),
+        'state': constant('Active'),
+        'queue_url': field('QueueUrl')
+    },
+    detail=describe_sqs_queue,
+    detail_fields={
+        'messages_available': field('ApproximateNumberOfMessages', default='0'),
+        'messages_in_flight': field('ApproximateNumberOfMessagesNotVisible', default='0'),
+        'created_timestamp': field('CreatedTimestamp')
+    }
+))
+
+# Billing mode and creation time rarely change, so list-only scans reuse them
+register(ServiceSpec(
+    'DynamoDB', 'Table', 'dynamodb', 'list_tables', page_size=100,
+    items=lambda page: [{'TableName': table_name} for table_name in page['TableNames']],
+    fields={
+        'resource_id': field('TableName'),
+        'name': field('TableName')
+    },
+    detail=lambda dynamodb, table: dynamodb.describe_table(TableName=table['TableName'])['Table'],
+    detail_fields={
+        'state': field('TableStatus'),
+        'item_count': field('ItemCount', default=0),
+        'table_size_bytes': field('TableSizeBytes', default=0),
+        'billing_mode': field('BillingModeSummary', 'BillingMode'),
+        'created_time': timestamp('CreationDateTime')
+    },
+    cached_fields=('billing_mode', 'created_time')
+))
+
+# S3 is global; each bucket's region comes from ListBuckets or a cached lookup
+register(ServiceSpec(
+    'S3', 'Bucket', 's3', 'list_buckets', 'Buckets', page_size=1000,
+    fields={
+        'resource_id': field('Name'),
+        'name': field('Name'),
+        'state': constant('Active'),
+        'created_date': timestamp('CreationDate')
+    },
+    detail=lambda s3, bucket: {'Region': get_bucket_region(s3, bucket)},
+    detail_fields={'region': field('Region')},
+    deferrable=False,
+    global_service=True
+))
@@ -0,0 +1,90 @@
+import collections
+import concurrent.futures
+import threading
+
+def parse_service_limits(value):
+    """Parse a "EC2=4,SNS=2" style string into a {service_type: limit} dict"""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        service_type, limit = item.split('=', 1)
+        limits[service_type.strip()] = int(limit)
+    return limits
+
+class ScanScheduler:
+    """Runs (region, service) scan tasks on a bounded pool with per-service concurrency caps
+
+    A task only takes a pool thread once its service has a free slot, so a slow
+    or throttled API queues its own work instead of tying up workers that
+    other services could use.
+    """
+
+    def __init__(self, max_workers=32, default_service_limit=8, service_limits=None):
+        self.max_workers = max_workers
+        self.default_service_limit = default_service_limit
+        self.service_limits = dict(service_limits or {})
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scan')
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._running = collections.Counter()
+        self._pending = collections.defaultdict(collections.deque)
+
+    def limit_for(self, service_type):
+        return self.service_limits.get(service_type, self.default_service_limit)
+
+    def submit(self, service_type, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) under the service's concurrency cap and return a Future"""
+        future = concurrent.futures.Future()
+        task = (future, fn, args, kwargs)
+        with self._lock:
+            if self._running[service_type] < self.limit_for(service_type):
+                self._running[service_type] += 1
+            else:
+                self._pending[service_type].append(task)
+                return future
+        self._executor.submit(self._run, service_type, task)
+        return future
+
+    def _run(self, service_type, task):
+        future, fn, args, kwargs = task
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            self._release(service_type)
+
+    def _release(self, service_type):
+        with self._lock:
+            pending = self._pending[service_type]
+            if not pending:
+                self._running[service_type] -= 1
+                if not any(self._running.values()):
+                    self._idle.notify_all()
+                return
+            task = pending.popleft()
+        self._executor.submit(self._run, service_type, task)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'running': dict(self._running),
+                'pending': {service_type: len(tasks) for service_type, tasks in self._pending.items()}
+            }
+
+    def shutdown(self, wait=True):
+        """Stop the pool; with wait, after every queued and running task has finished, else cancelling queued ones"""
+        if wait:
+            with self._idle:
+                self._idle.wait_for(lambda: not any(self._running.values()))
+        else:
+            with self._lock:
+                for tasks in self._pending.values():
+                    for future, _, _, _ in tasks:
+                        future.cancel()
+                    tasks.clear()
+        self._executor.shutdown(wait=wait)
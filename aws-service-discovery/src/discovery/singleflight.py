@@ -0,0 +1,29 @@
+import threading
+
+class SingleFlight:
+    """Coalesces concurrent requests for the same key onto one in-flight Future
+
+    The first caller for a key starts the work; callers that arrive while it is
+    still running get the same Future, and with it the same result or error.
+    The key is forgotten as soon as the work finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def submit(self, key, start):
+        """Return (future, started) where start() is only called if no work is in flight for key"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = start()
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, True
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
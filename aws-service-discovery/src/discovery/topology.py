@@ -0,0 +1,122 @@
+import threading
+from src.discovery.registry import SERVICE_SPECS
+
+# Tag CloudFormation puts on the resources a stack creates
+STACK_TAG = 'aws:cloudformation:stack-name'
+
+MAX_DEPTH = 5
+MAX_NODES = 1000
+
+def node_key(node):
+    """String form of a node, 'service_type/region/resource_id', as used in responses"""
+    (scope, service_type), resource_id = node
+    return f"{service_type}/{scope}/{resource_id}"
+
+def resource_links(cell, resources):
+    """List the edges from a cell's resources to the resources they reference
+
+    Nodes are (cell, resource_id), and each edge is (node, relation, target
+    node), where relation is the link field without its '_id' suffix, or
+    'stack' for the stack named by a resource's CloudFormation tag. Targets
+    are in the same account and region as the resource, so targets that are
+    not inventoried (subnets) are still nodes.
+    """
+    spec = SERVICE_SPECS.get(cell[1])
+    links = spec.links if spec is not None else {}
+    edges = []
+    for resource in resources:
+        node = (cell, str(resource.get('resource_id', '')))
+        for name, target_type in links.items():
+            target = resource.get(name)
+            if target and target != 'N/A':
+                edges.append((node, name[:-3] if name.endswith('_id') else name, ((cell[0], target_type), str(target))))
+        if cell[1] == 'CloudFormation':
+            continue
+        for tag in resource.get('tags') or []:
+            if isinstance(tag, dict) and tag.get('Key') == STACK_TAG and tag.get('Value'):
+                edges.append((node, 'stack', ((cell[0], 'CloudFormation'), tag['Value'])))
+    return edges
+
+class TopologyIndex:
+    """Adjacency index of the links between resources, kept per cell and versioned by snapshot ID
+
+    Each cell's edges are replaced when a new snapshot of it is indexed,
+    so the graph follows the inventory without being rebuilt. Edges are
+    traversed in both directions: from a VPC to its instances, load
+    balancers, databases and functions, from a stack to the resources it
+    owns, and back.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._adjacency = {}
+        self._by_id = {}
+
+    def update(self, cell, version, resources):
+        """Replace a cell's edges with those of a snapshot, unless that version is already indexed"""
+        current = self._cells.get(cell)
+        if current is not None and current[0] == version:
+            return
+        edges = resource_links(cell, resources)
+        with self._lock:
+            previous = self._cells.pop(cell, None)
+            for edge in previous[1] if previous is not None else ():
+                for node in (edge[0], edge[2]):
+                    node_edges = self._adjacency.get(node)
+                    if node_edges is None:
+                        continue
+                    node_edges.discard(edge)
+                    if not node_edges:
+                        del self._adjacency[node]
+                        nodes = self._by_id[node[1]]
+                        nodes.discard(node)
+                        if not nodes:
+                            del self._by_id[node[1]]
+            for edge in edges:
+                for node in (edge[0], edge[2]):
+                    node_edges = self._adjacency.get(node)
+                    if node_edges is None:
+                        node_edges = self._adjacency[node] = set()
+                        self._by_id.setdefault(node[1], set()).add(node)
+                    node_edges.add(edge)
+            self._cells[cell] = (version, edges)
+
+    def nodes_with_id(self, resource_id):
+        """Return the linked nodes whose resource ID is resource_id"""
+        with self._lock:
+            return set(self._by_id.get(resource_id, ()))
+
+    def traverse(self, roots, depth, max_nodes=MAX_NODES):
+        """Walk the graph breadth-first from roots, up to depth hops and max_nodes nodes
+
+        Returns ({node: hops from the nearest root}, edges between visited
+        nodes, truncated).
+        """
+        levels = {root: 0 for root in roots}
+        edges = set()
+        frontier = list(levels)
+        truncated = False
+        with self._lock:
+            for level in range(1, depth + 1):
+                next_frontier = []
+                for node in frontier:
+                    for edge in self._adjacency.get(node, ()):
+                        neighbour = edge[2] if edge[0] == node else edge[0]
+                        if neighbour not in levels:
+                            if len(levels) >= max_nodes:
+                                truncated = True
+                                continue
+                            levels[neighbour] = level
+                            next_frontier.append(neighbour)
+                        edges.add(edge)
+                frontier = next_frontier
+        return levels, edges, truncated
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._adjacency.clear()
+            self._by_id.clear()
+
+topology_index = TopologyIndex()
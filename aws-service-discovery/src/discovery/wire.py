@@ -0,0 +1,136 @@
+import collections
+import struct
+import threading
+import zlib
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+def dictionary_key(value):
+    # Resources read from a ResourceTable share their tags lists, so lists are keyed by identity
+    return id(value) if isinstance(value, (list, dict)) else value
+
+def encode_columnar(resources):
+    """Encode resources column by column, sending each field name once per block
+
+    Returns {'count', 'blocks', 'dictionaries'}. Each run of consecutive
+    resources with the same fields, such as one scanner's output, is a
+    block of {'count', 'fields', 'columns'}, where columns maps each field
+    to one value per resource. Fields with few distinct values, such as
+    region, state or tags, are dictionary-encoded: their columns hold
+    indexes into dictionaries[field], shared by every block.
+    """
+    blocks = []
+    for resource in resources:
+        fields = tuple(resource)
+        if not blocks or blocks[-1]['fields'] != fields:
+            blocks.append({'count': 0, 'fields': fields, 'columns': {field: [] for field in fields}})
+        block = blocks[-1]
+        block['count'] += 1
+        for field, value in resource.items():
+            block['columns'][field].append(value)
+
+    codes = {}
+    dictionaries = {}
+    occurrences = {}
+    for block in blocks:
+        for field, values in block['columns'].items():
+            field_codes = codes.setdefault(field, {})
+            dictionary = dictionaries.setdefault(field, [])
+            occurrences[field] = occurrences.get(field, 0) + len(values)
+            for value in values:
+                key = dictionary_key(value)
+                if key not in field_codes:
+                    field_codes[key] = len(dictionary)
+                    dictionary.append(value)
+
+    dictionaries = {field: dictionary for field, dictionary in dictionaries.items() if len(dictionary) * 2 <= occurrences[field]}
+    for block in blocks:
+        block['fields'] = list(block['fields'])
+        for field in dictionaries:
+            values = block['columns'].get(field)
+            if values is not None:
+                field_codes = codes[field]
+                block['columns'][field] = [field_codes[dictionary_key(value)] for value in values]
+    return {'count': sum(block['count'] for block in blocks), 'blocks': blocks, 'dictionaries': dictionaries}
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'gzip' or None for a request's Accept-Encoding header"""
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+# Header of a gzip member with no file name or time, from an unknown OS
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+def deflater():
+    return zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+def compress_head(data, encoding):
+    """Compress the start of a body for finish_body to complete, returning (head, encoding actually used)
+
+    With gzip, head holds a deflate stream flushed to a byte boundary plus
+    the CRC and length of data, so completing the body only compresses its
+    tail.
+    """
+    if encoding is None or len(data) < MIN_COMPRESS_BYTES:
+        return (data, 0, 0), None
+    compressor = deflater()
+    body = GZIP_HEADER + compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return (body, zlib.crc32(data), len(data)), encoding
+
+def finish_body(head, tail, encoding):
+    """Append tail to a head from compress_head, returning the complete body"""
+    data, crc, size = head
+    if encoding == 'gzip':
+        compressor = deflater()
+        trailer = struct.pack('<II', zlib.crc32(tail, crc), (size + len(tail)) & 0xffffffff)
+        return data + compressor.compress(tail) + compressor.flush() + trailer
+    return data + tail
+
+class PayloadCache:
+    """LRU cache of encoded (and compressed) response body heads, bounded by total size
+
+    Entries are (head, content_encoding) pairs from compress_head. Keys
+    include the response's ETag, which is built from the snapshot IDs it
+    was served from, so an entry is reused until any of those snapshots is
+    replaced.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._size = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('SCAN_PAYLOAD_CACHE_MB', 64) * 1024 * 1024
+
+    def get(self, key):
+        """Return the cached (head, content_encoding) for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, head, encoding):
+        size = len(head[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0][0])
+            self._entries[key] = (head, encoding)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+payload_cache = PayloadCache()
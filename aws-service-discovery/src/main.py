@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 # DON'T CHANGE THIS !!!
@@ -7,8 +8,17 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 from src.models.user import db
+from src.models.snapshot import enable_wal, init_database
 from src.routes.user import user_bp
-from src.routes.aws_services import aws_bp
+from src.routes.aws_services import aws_bp, start_background_refresh
+from src.discovery.accounts import account_scanner
+from src.discovery.clients import CLIENT_DEFAULTS, client_pool
+from src.discovery.ratelimit import rate_limiters
+from src.discovery.details import detail_fetcher
+from src.discovery.history import history_recorder
+from src.discovery.refresher import refresher
+from src.discovery.pruning import pruner
+from src.discovery.wire import payload_cache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,12 +32,120 @@ CORS(app)
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(aws_bp, url_prefix='/api')
 
+# Seconds a (region, service) scan snapshot is served before it is rescanned
+app.config['SCAN_CACHE_TTL'] = int(os.getenv('SCAN_CACHE_TTL', '300'))
+
+# Scan pool size and per-service concurrency caps (e.g. SCAN_SERVICE_LIMITS="EC2=4,SNS=2")
+app.config['SCAN_MAX_WORKERS'] = int(os.getenv('SCAN_MAX_WORKERS', '32'))
+app.config['SCAN_SERVICE_CONCURRENCY'] = int(os.getenv('SCAN_SERVICE_CONCURRENCY', '8'))
+app.config['SCAN_SERVICE_LIMITS'] = os.getenv('SCAN_SERVICE_LIMITS', '')
+
+# Shared boto3 clients: HTTP connection pool size per client, timeouts in
+# seconds and retry budget ('standard' or 'adaptive' retry mode)
+app.config['AWS_MAX_POOL_CONNECTIONS'] = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', CLIENT_DEFAULTS['max_pool_connections']))
+app.config['AWS_CONNECT_TIMEOUT'] = float(os.getenv('AWS_CONNECT_TIMEOUT', CLIENT_DEFAULTS['connect_timeout']))
+app.config['AWS_READ_TIMEOUT'] = float(os.getenv('AWS_READ_TIMEOUT', CLIENT_DEFAULTS['read_timeout']))
+app.config['AWS_MAX_ATTEMPTS'] = int(os.getenv('AWS_MAX_ATTEMPTS', CLIENT_DEFAULTS['max_attempts']))
+app.config['AWS_RETRY_MODE'] = os.getenv('AWS_RETRY_MODE', CLIENT_DEFAULTS['retry_mode'])
+client_pool.init_app(app)
+
+# Adaptive rate limit per (service, region) endpoint: starting calls per second
+# (0 disables limiting), burst, bounds, and the AIMD additive increase per
+# second and multiplicative decrease on throttling
+app.config['AWS_RATE_LIMIT'] = float(os.getenv('AWS_RATE_LIMIT', '10'))
+app.config['AWS_RATE_LIMIT_BURST'] = int(os.getenv('AWS_RATE_LIMIT_BURST', '10'))
+app.config['AWS_RATE_LIMIT_MIN'] = float(os.getenv('AWS_RATE_LIMIT_MIN', '0.5'))
+app.config['AWS_RATE_LIMIT_MAX'] = float(os.getenv('AWS_RATE_LIMIT_MAX', '100'))
+app.config['AWS_RATE_LIMIT_INCREASE'] = float(os.getenv('AWS_RATE_LIMIT_INCREASE', '1'))
+app.config['AWS_RATE_LIMIT_DECREASE'] = float(os.getenv('AWS_RATE_LIMIT_DECREASE', '0.5'))
+rate_limiters.init_app(app)
+
+# Default latency budget for service endpoints in milliseconds (0 for none);
+# ?deadline_ms= overrides it per request
+app.config['SCAN_DEADLINE_MS'] = int(os.getenv('SCAN_DEADLINE_MS', '0'))
+
+# Per-resource detail calls: concurrency, cache lifetime and entry limit for
+# rarely changing values, and list-only mode that defers details to
+# /api/resources/<service>/<id>
+app.config['SCAN_DETAIL_WORKERS'] = int(os.getenv('SCAN_DETAIL_WORKERS', '16'))
+app.config['SCAN_DETAIL_CACHE_TTL'] = int(os.getenv('SCAN_DETAIL_CACHE_TTL', '86400'))
+app.config['SCAN_DETAIL_CACHE_SIZE'] = int(os.getenv('SCAN_DETAIL_CACHE_SIZE', '100000'))
+app.config['SCAN_LIST_ONLY'] = os.getenv('SCAN_LIST_ONLY', 'false').lower() in ('1', 'true', 'yes')
+detail_fetcher.init_app(app)
+
+# Megabytes of encoded and compressed response bodies kept for repeat requests
+app.config['SCAN_PAYLOAD_CACHE_MB'] = int(os.getenv('SCAN_PAYLOAD_CACHE_MB', '64'))
+payload_cache.init_app(app)
+
+# Tag keys exported as their own columns by /api/export and `flask aws export`
+app.config['EXPORT_TAG_COLUMNS'] = os.getenv('EXPORT_TAG_COLUMNS', 'Name')
+
+# Region and cell pruning: seconds the describe_regions list is cached, seconds
+# a region is skipped after an opt-in error, and the longest a cell that
+# keeps coming back empty goes without being rescanned
+app.config['SCAN_REGIONS_TTL'] = int(os.getenv('SCAN_REGIONS_TTL', '3600'))
+app.config['SCAN_BLOCKED_REGION_TTL'] = int(os.getenv('SCAN_BLOCKED_REGION_TTL', '3600'))
+app.config['SCAN_EMPTY_MAX_AGE'] = int(os.getenv('SCAN_EMPTY_MAX_AGE', '86400'))
+pruner.init_app(app)
+
+# Discovery engine: 'scanners' (per-service APIs), 'tagging' (Resource Groups
+# Tagging API per region) or 'config' (AWS Config aggregator across regions).
+# Services the engine cannot cover (see ENGINE_SERVICE_TYPES), and those listed
+# in BULK_FALLBACK_SERVICES, keep using their own scanners.
+app.config['DISCOVERY_ENGINE'] = os.getenv('DISCOVERY_ENGINE', 'scanners')
+app.config['BULK_FALLBACK_SERVICES'] = os.getenv('BULK_FALLBACK_SERVICES', '')
+app.config['CONFIG_AGGREGATOR_NAME'] = os.getenv('CONFIG_AGGREGATOR_NAME')
+app.config['CONFIG_AGGREGATOR_REGION'] = os.getenv('CONFIG_AGGREGATOR_REGION', 'us-east-1')
+if app.config['DISCOVERY_ENGINE'] == 'config' and not app.config['CONFIG_AGGREGATOR_NAME']:
+    raise RuntimeError('DISCOVERY_ENGINE=config requires CONFIG_AGGREGATOR_NAME')
+
+# Multi-account discovery: comma-separated IAM role ARNs to assume, one per
+# account, and the AssumeRole session settings. Each account is scanned as one
+# task on a pool of SCAN_ACCOUNT_PROCESSES worker processes (0 scans on threads
+# in the server), fanning out over SCAN_ACCOUNT_THREADS threads per account.
+app.config['AWS_ACCOUNT_ROLE_ARNS'] = os.getenv('AWS_ACCOUNT_ROLE_ARNS', '')
+app.config['AWS_ROLE_SESSION_NAME'] = os.getenv('AWS_ROLE_SESSION_NAME', 'aws-service-discovery')
+app.config['AWS_ROLE_EXTERNAL_ID'] = os.getenv('AWS_ROLE_EXTERNAL_ID')
+app.config['AWS_ROLE_DURATION'] = int(os.getenv('AWS_ROLE_DURATION', '3600'))
+app.config['SCAN_ACCOUNT_PROCESSES'] = int(os.getenv('SCAN_ACCOUNT_PROCESSES', str(os.cpu_count() or 1)))
+app.config['SCAN_ACCOUNT_THREADS'] = int(os.getenv('SCAN_ACCOUNT_THREADS', '16'))
+account_scanner.init_app(app)
+
 # uncomment if you need to use database
+os.makedirs(os.path.join(os.path.dirname(__file__), 'database'), exist_ok=True)
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
-    db.create_all()
+    enable_wal(db.engine)
+    init_database()
+
+# Days of scan count history kept: raw samples, then hourly, daily and weekly rollups (0 keeps them forever)
+app.config['HISTORY_RAW_DAYS'] = int(os.getenv('HISTORY_RAW_DAYS', '2'))
+app.config['HISTORY_HOURLY_DAYS'] = int(os.getenv('HISTORY_HOURLY_DAYS', '35'))
+app.config['HISTORY_DAILY_DAYS'] = int(os.getenv('HISTORY_DAILY_DAYS', '400'))
+app.config['HISTORY_WEEKLY_DAYS'] = int(os.getenv('HISTORY_WEEKLY_DAYS', '0'))
+history_recorder.init_app(app)
+
+# Seconds a process holds its claim on rescanning a cell, so worker processes
+# sharing the database do not scan the same cells (0 lets each worker rescan)
+app.config['SCAN_LEASE_SECONDS'] = int(os.getenv('SCAN_LEASE_SECONDS', '120'))
+
+# Serve expired snapshots immediately and refresh them in the background, and
+# optionally keep cells fresh with a rate-limited background refresher that
+# looks for due cells every SCAN_REFRESH_TICK seconds
+app.config['SCAN_STALE_WHILE_REVALIDATE'] = os.getenv('SCAN_STALE_WHILE_REVALIDATE', 'true').lower() in ('1', 'true', 'yes')
+app.config['SCAN_BACKGROUND_REFRESH'] = os.getenv('SCAN_BACKGROUND_REFRESH', 'false').lower() in ('1', 'true', 'yes')
+app.config['SCAN_REFRESH_TICK'] = float(os.getenv('SCAN_REFRESH_TICK', '1'))
+app.config['SCAN_REFRESH_RATE'] = float(os.getenv('SCAN_REFRESH_RATE', '2'))
+app.config['SCAN_REFRESH_BURST'] = int(os.getenv('SCAN_REFRESH_BURST', '5'))
+app.config['SCAN_REFRESH_JITTER'] = float(os.getenv('SCAN_REFRESH_JITTER', '0.2'))
+refresher.init_app(app)
+# The debug reloader imports this module in a parent process too; only its child serves requests.
+# Account scanner workers re-import it as well and must not start a refresher of their own.
+is_worker = multiprocessing.parent_process() is not None
+if app.config['SCAN_BACKGROUND_REFRESH'] and not is_worker and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    start_background_refresh(app)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db
+
+GRANULARITIES = ('hour', 'day', 'week')
+
+class CountSample(db.Model):
+    """Resource count of one (region, service_type, state) series from one completed scan of its cell
+
+    Append-only; scope is the cell's region part ('account_id:region' in
+    multi-account mode, 'global' for S3) and region the resources' own region.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(64), nullable=False)
+    service_type = db.Column(db.String(32), nullable=False)
+    region = db.Column(db.String(32), nullable=False)
+    state = db.Column(db.String(64), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_count_sample_cell', 'scope', 'service_type', 'recorded_at'),
+    )
+
+    def __repr__(self):
+        return f'<CountSample {self.scope}/{self.service_type} {self.region}/{self.state}={self.count} @ {self.recorded_at}>'
+
+class CountRollup(db.Model):
+    """Minimum, maximum, sum, number and last of the samples of one series in an hour, day or week"""
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(8), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    scope = db.Column(db.String(64), nullable=False)
+    service_type = db.Column(db.String(32), nullable=False)
+    region = db.Column(db.String(32), nullable=False)
+    state = db.Column(db.String(64), nullable=False)
+    min_count = db.Column(db.Integer, nullable=False)
+    max_count = db.Column(db.Integer, nullable=False)
+    total_count = db.Column(db.Integer, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+    last_count = db.Column(db.Integer, nullable=False)
+    last_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', 'scope', 'service_type', 'region', 'state', name='uq_count_rollup_series'),
+        db.Index('ix_count_rollup_range', 'granularity', 'bucket_start'),
+    )
+
+    def __repr__(self):
+        return f'<CountRollup {self.granularity} {self.bucket_start} {self.scope}/{self.service_type} {self.region}/{self.state}>'
+
+def bucket_start(granularity, at):
+    """Start of the hour, day or week (from Monday) containing at"""
+    if granularity == 'hour':
+        return at.replace(minute=0, second=0, microsecond=0)
+    day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return day
+    return day - timedelta(days=day.weekday())
+
+def last_series(cells):
+    """Return {cell: {(region, state)}} for the series with resources in each cell's most recent recorded scan"""
+    series = {}
+    cell_filter = db.tuple_(CountSample.scope, CountSample.service_type).in_(list(cells))
+    latest = db.session.query(
+        CountSample.scope, CountSample.service_type, func.max(CountSample.recorded_at).label('recorded_at')
+    ).filter(cell_filter).group_by(CountSample.scope, CountSample.service_type).subquery()
+    rows = db.session.query(CountSample.scope, CountSample.service_type, CountSample.region, CountSample.state).join(latest, db.and_(
+        CountSample.scope == latest.c.scope,
+        CountSample.service_type == latest.c.service_type,
+        CountSample.recorded_at == latest.c.recorded_at
+    )).filter(CountSample.count > 0)
+    for scope, service_type, region, state in rows:
+        series.setdefault((scope, service_type), set()).add((region, state))
+    return series
+
+def record_counts(cell_counts, at=None):
+    """Append one sample per series of each cell's {(region, state): count} and fold it into every rollup
+
+    Rollups are updated as samples arrive, so range queries never read
+    samples. Rows are written with executemany on statements compiled once.
+    """
+    at = at or datetime.now()
+    samples = [
+        {'scope': scope, 'service_type': service_type, 'region': str(region or ''), 'state': str(state), 'count': count, 'recorded_at': at}
+        for (scope, service_type), counts in cell_counts.items()
+        for (region, state), count in counts.items()
+    ]
+    if not samples:
+        return
+    db.session.execute(insert(CountSample), samples)
+
+    statement = insert(CountRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=['granularity', 'bucket_start', 'scope', 'service_type', 'region', 'state'],
+        set_={
+            'min_count': func.min(CountRollup.min_count, statement.excluded.min_count),
+            'max_count': func.max(CountRollup.max_count, statement.excluded.max_count),
+            'total_count': CountRollup.total_count + statement.excluded.total_count,
+            'samples': CountRollup.samples + 1,
+            'last_count': statement.excluded.last_count,
+            'last_at': statement.excluded.last_at
+        }
+    )
+    for granularity in GRANULARITIES:
+        start = bucket_start(granularity, at)
+        rollups = [
+            {
+                'granularity': granularity,
+                'bucket_start': start,
+                'scope': sample['scope'],
+                'service_type': sample['service_type'],
+                'region': sample['region'],
+                'state': sample['state'],
+                'min_count': sample['count'],
+                'max_count': sample['count'],
+                'total_count': sample['count'],
+                'samples': 1,
+                'last_count': sample['count'],
+                'last_at': at
+            }
+            for sample in samples
+        ]
+        db.session.execute(statement, rollups)
+    db.session.commit()
+
+def compact_history(retention_days, now=None):
+    """Delete samples and rollups older than their retention in days ({'raw', 'hour', 'day', 'week'}; 0 keeps them)
+
+    Returns the number of rows deleted.
+    """
+    now = now or datetime.now()
+    deleted = 0
+    if retention_days.get('raw'):
+        deleted += CountSample.query.filter(
+            CountSample.recorded_at < now - timedelta(days=retention_days['raw'])
+        ).delete(synchronize_session=False)
+    for granularity in GRANULARITIES:
+        if retention_days.get(granularity):
+            deleted += CountRollup.query.filter(
+                CountRollup.granularity == granularity,
+                CountRollup.bucket_start < bucket_start(granularity, now - timedelta(days=retention_days[granularity]))
+            ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def query_rollups(granularity, start, end, group_by, service_types=None, regions=None, states=None):
+    """Add up the rollups of a granularity with buckets from start's to before end, per group and bucket
+
+    group_by names the series columns kept apart ('scope', 'region',
+    'service_type', 'state'); series differing only in other columns are
+    summed. Yields ((group_by values), bucket_start, last, min, max, mean,
+    samples) ordered by series, then bucket. The last counts and means of
+    merged series add up, but their minima, maxima and sample numbers do
+    not, so those are None for groups of more than one series.
+    """
+    columns = [getattr(CountRollup, column) for column in group_by]
+    query = db.session.query(
+        *columns,
+        CountRollup.bucket_start,
+        func.sum(CountRollup.last_count),
+        func.sum(CountRollup.min_count),
+        func.sum(CountRollup.max_count),
+        func.sum(CountRollup.total_count * 1.0 / CountRollup.samples),
+        func.sum(CountRollup.samples),
+        func.count()
+    ).filter(
+        CountRollup.granularity == granularity,
+        CountRollup.bucket_start >= bucket_start(granularity, start),
+        CountRollup.bucket_start < end
+    )
+    if service_types:
+        query = query.filter(CountRollup.service_type.in_(service_types))
+    if regions:
+        query = query.filter(CountRollup.region.in_(regions))
+    if states:
+        query = query.filter(CountRollup.state.in_(states))
+    count = len(columns)
+    for row in query.group_by(*columns, CountRollup.bucket_start).order_by(*columns, CountRollup.bucket_start):
+        bucket, last, low, high, mean, samples, series = row[count:]
+        if series > 1:
+            low = high = samples = None
+        yield tuple(row[:count]), bucket, last, low, high, mean, samples
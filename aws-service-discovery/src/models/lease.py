@@ -0,0 +1,73 @@
+import os
+import socket
+import time
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db
+
+# SQLite allows a limited number of bound parameters per statement
+BATCH_SIZE = 200
+
+class ScanLease(db.Model):
+    """A claim by one process on rescanning a (region, service_type) cell, until expires_at"""
+    region = db.Column(db.String(64), primary_key=True)
+    service_type = db.Column(db.String(32), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<ScanLease {self.region}/{self.service_type} by {self.owner}>'
+
+def lease_owner():
+    """Identify this process; computed on each call, since workers forked from one parent share the module"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def batches(cells):
+    cells = list(cells)
+    for start in range(0, len(cells), BATCH_SIZE):
+        yield cells[start:start + BATCH_SIZE]
+
+def cell_filter(cells):
+    return db.tuple_(ScanLease.region, ScanLease.service_type).in_(cells)
+
+def acquire_leases(cells, seconds, owner=None):
+    """Claim cells for owner for the next seconds, returning the set of cells it now holds
+
+    A cell is claimed when it has no lease, its lease has expired or owner
+    already holds it; cells leased to another live process are left out.
+    """
+    owner = owner or lease_owner()
+    now = time.time()
+    held = set()
+    for batch in batches(cells):
+        statement = insert(ScanLease).values([
+            {'region': region, 'service_type': service_type, 'owner': owner, 'expires_at': now + seconds}
+            for region, service_type in batch
+        ])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['region', 'service_type'],
+            set_={'owner': statement.excluded.owner, 'expires_at': statement.excluded.expires_at},
+            where=(ScanLease.expires_at < now) | (ScanLease.owner == owner)
+        ))
+        held.update(db.session.query(ScanLease.region, ScanLease.service_type).filter(
+            cell_filter(batch), ScanLease.owner == owner
+        ))
+    db.session.commit()
+    return {tuple(cell) for cell in held}
+
+def release_leases(cells, owner=None):
+    """Drop owner's leases on cells"""
+    owner = owner or lease_owner()
+    for batch in batches(cells):
+        ScanLease.query.filter(cell_filter(batch), ScanLease.owner == owner).delete(synchronize_session=False)
+    db.session.commit()
+
+def leased_cells(cells, owner=None):
+    """Return the cells under an unexpired lease held by a process other than owner"""
+    owner = owner or lease_owner()
+    now = time.time()
+    leased = set()
+    for batch in batches(cells):
+        leased.update(db.session.query(ScanLease.region, ScanLease.service_type).filter(
+            cell_filter(batch), ScanLease.owner != owner, ScanLease.expires_at >= now
+        ))
+    return {tuple(cell) for cell in leased}
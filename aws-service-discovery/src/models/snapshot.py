@@ -0,0 +1,171 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from src.models.user import db
+
+def content_hash(value):
+    """SHA-1 of a JSON-serialisable value, independent of dict key order"""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+def state_counts(resources):
+    """Count resources by (region, state); a global cell's resources count under their own regions"""
+    counts = {}
+    for resource in resources:
+        key = (resource.get('region'), str(resource.get('state', 'N/A')))
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+class ScanSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    region = db.Column(db.String(32), nullable=False, index=True)
+    service_type = db.Column(db.String(32), nullable=False, index=True)
+    resources = db.deferred(db.Column(db.Text, nullable=False, default='[]'))
+    resource_count = db.Column(db.Integer, nullable=False, default=0)
+    content_hash = db.Column(db.String(40))
+    state_counts = db.Column(db.Text)
+    scanned_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+
+    __table_args__ = (
+        db.Index('ix_scan_snapshot_cell', 'region', 'service_type', 'scanned_at'),
+    )
+
+    def __repr__(self):
+        return f'<ScanSnapshot {self.region}/{self.service_type} @ {self.scanned_at}>'
+
+    def get_resources(self):
+        return json.loads(self.resources)
+
+    def get_state_counts(self):
+        """Resource counts by (region, state), or None for snapshots saved before counts were stored"""
+        if self.state_counts is None:
+            return None
+        return {(region, state): count for region, state, count in json.loads(self.state_counts)}
+
+    def age_seconds(self, now=None):
+        now = now or datetime.now()
+        return (now - self.scanned_at).total_seconds()
+
+def latest_snapshots(cells):
+    """Return the most recent snapshot for each (region, service_type) cell"""
+    cells = set(cells)
+    if not cells:
+        return {}
+
+    regions = {region for region, _ in cells}
+    latest_ids = db.session.query(db.func.max(ScanSnapshot.id)).filter(
+        ScanSnapshot.region.in_(regions)
+    ).group_by(ScanSnapshot.region, ScanSnapshot.service_type)
+
+    snapshots = {}
+    for snapshot in ScanSnapshot.query.filter(ScanSnapshot.id.in_(latest_ids)):
+        cell = (snapshot.region, snapshot.service_type)
+        if cell in cells:
+            snapshots[cell] = snapshot
+    return snapshots
+
+def snapshots_as_of(cells, snapshot_id):
+    """Return each cell's newest snapshot with an ID no greater than snapshot_id, where one is still kept"""
+    cells = set(cells)
+    if not cells:
+        return {}
+
+    regions = {region for region, _ in cells}
+    ids = db.session.query(db.func.max(ScanSnapshot.id)).filter(
+        ScanSnapshot.region.in_(regions),
+        ScanSnapshot.id <= snapshot_id
+    ).group_by(ScanSnapshot.region, ScanSnapshot.service_type)
+
+    snapshots = {}
+    for snapshot in ScanSnapshot.query.filter(ScanSnapshot.id.in_(ids)):
+        cell = (snapshot.region, snapshot.service_type)
+        if cell in cells:
+            snapshots[cell] = snapshot
+    return snapshots
+
+def save_snapshots(cell_resources, keep=5):
+    """Record one snapshot per (region, service_type) cell and prune older ones
+
+    A cell whose content hash matches its latest snapshot keeps that
+    snapshot, with only scanned_at moved forward. Snapshot IDs, and the
+    ETags and change feeds built on them, only change when content does.
+    """
+    now = datetime.now()
+    latest = latest_snapshots(cell_resources)
+    saved = {}
+    added = []
+    for (region, service_type), resources in cell_resources.items():
+        serialized = json.dumps(resources, sort_keys=True, default=str)
+        digest = hashlib.sha1(serialized.encode()).hexdigest()
+        snapshot = latest.get((region, service_type))
+        if snapshot is not None and snapshot.content_hash == digest:
+            snapshot.scanned_at = now
+        else:
+            snapshot = ScanSnapshot(
+                region=region,
+                service_type=service_type,
+                resources=serialized,
+                resource_count=len(resources),
+                content_hash=digest,
+                state_counts=json.dumps([list(key) + [count] for key, count in state_counts(resources).items()]),
+                scanned_at=now
+            )
+            db.session.add(snapshot)
+            added.append((region, service_type))
+        saved[(region, service_type)] = snapshot
+    db.session.flush()
+
+    for region, service_type in added:
+        stale_ids = [row.id for row in ScanSnapshot.query.with_entities(ScanSnapshot.id).filter_by(
+            region=region, service_type=service_type
+        ).order_by(ScanSnapshot.id.desc()).offset(keep)]
+        if stale_ids:
+            ScanSnapshot.query.filter(ScanSnapshot.id.in_(stale_ids)).delete(synchronize_session=False)
+
+    db.session.commit()
+    return saved
+
+def ensure_snapshot_columns():
+    """Add columns introduced after a database was created, since create_all only creates missing tables"""
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns(ScanSnapshot.__tablename__)}
+    added = {'content_hash': 'VARCHAR(40)', 'state_counts': 'TEXT'}
+    with db.engine.begin() as connection:
+        for name, column_type in added.items():
+            if name not in columns:
+                connection.execute(db.text(f'ALTER TABLE {ScanSnapshot.__tablename__} ADD COLUMN {name} {column_type}'))
+
+def enable_wal(engine):
+    """Open every connection to a SQLite database in WAL mode
+
+    Readers then never block on, or block, the one process writing
+    snapshots, so several worker processes can share the database as their
+    cache. Writers wait up to 30 seconds for each other instead of failing.
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(connection, _):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA busy_timeout=30000')
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+def init_database(attempts=3):
+    """Create missing tables and columns, when several worker processes may be starting at once
+
+    A process that loses the race to create a table or column gets an
+    error and checks again. The engine's connections are closed afterwards,
+    so worker processes forked from this one open their own.
+    """
+    for attempt in range(attempts):
+        try:
+            db.create_all()
+            ensure_snapshot_columns()
+            break
+        except OperationalError as e:
+            if attempt == attempts - 1:
+                raise
+            print(f"Error creating tables, retrying: {str(e.orig)}")
+            time.sleep(0.1)
+    db.engine.dispose()
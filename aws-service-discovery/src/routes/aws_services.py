@@ -1,393 +1,822 @@
-from flask import Blueprint, jsonify, request
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
 import concurrent.futures
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 import json
+import logging
+import click
+import threading
+import time
+from src.models.history import GRANULARITIES, query_rollups
+from src.models.lease import acquire_leases, leased_cells, release_leases
+from src.models.snapshot import latest_snapshots, save_snapshots, snapshots_as_of, state_counts
+from src.models.user import db
+from src.discovery.clients import client_pool, no_credentials_error
+from src.discovery.details import detail_fetcher
+from src.discovery.registry import SERVICE_SPECS, describe_resource, scan_service
+from src.discovery.query import FILTER_PARAMS, PAGE_PARAMS, has_filters, inventory_index, parse_query, split_param, wants_page
+from src.discovery.export import encode_csv, encode_ndjson, export_columns, flatten_tags, parse_tag_columns
+from src.discovery.topology import MAX_DEPTH, node_key, topology_index
+from src.discovery.changes import diff_resources, resource_hashes, resource_key
+from src.discovery.singleflight import SingleFlight
+from src.discovery.metrics import metrics
+from src.discovery.refresher import refresher
+from src.discovery.pruning import blocked_error_code, pruner
+from src.discovery.ratelimit import rate_limiters
+from src.discovery.wire import compress_head, encode_columnar, finish_body, negotiate_encoding, payload_cache
+from src.discovery.aggregates import count_aggregates
+from src.discovery.history import history_recorder
+from src.discovery.accounts import account_scanner, cell_scope, split_scope
+from src.discovery.bulk import ENGINE_SERVICE_TYPES, discover_by_config, discover_region_by_tags
+from src.discovery.scheduler import ScanScheduler, parse_service_limits
 
 aws_bp = Blueprint('aws', __name__)
+logger = logging.getLogger(__name__)
+
+# Seconds between checks on cells another process is rescanning
+SHARED_POLL_SECONDS = 0.2
+
+# S3 is a global service; its snapshot cell is stored under this pseudo-region.
+# With AWS_ACCOUNT_ROLE_ARNS, the region part of every cell is 'account_id:region'.
+GLOBAL_REGION = 'global'
+
+def describe_regions():
+    ec2 = client_pool.get_client('ec2', 'us-east-1')
+    return ec2.describe_regions(AllRegions=True)['Regions']
 
 def get_all_regions():
-    """Get all available AWS regions"""
+    """Get all enabled AWS regions, cached, without regions the account is blocked from"""
     try:
-        ec2 = boto3.client('ec2', region_name='us-east-1')
-        response = ec2.describe_regions()
-        return [region['RegionName'] for region in response['Regions']]
+        return pruner.get_regions(describe_regions)
     except Exception as e:
         print(f"Error getting regions: {str(e)}")
         return []
 
-def scan_ec2_instances(region):
-    """Scan EC2 instances in a specific region"""
-    resources = []
-    try:
-        ec2 = boto3.client('ec2', region_name=region)
-        response = ec2.describe_instances()
-        
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                name = 'N/A'
-                if 'Tags' in instance:
-                    for tag in instance['Tags']:
-                        if tag['Key'] == 'Name':
-                            name = tag['Value']
-                            break
-                
-                resources.append({
-                    'service_type': 'EC2',
-                    'resource_type': 'Instance',
-                    'resource_id': instance['InstanceId'],
-                    'name': name,
-                    'state': instance['State']['Name'],
-                    'region': region,
-                    'availability_zone': instance.get('Placement', {}).get('AvailabilityZone', 'N/A'),
-                    'instance_type': instance.get('InstanceType', 'N/A'),
-                    'launch_time': instance.get('LaunchTime', '').isoformat() if instance.get('LaunchTime') else 'N/A',
-                    'tags': instance.get('Tags', [])
-                })
-    except Exception as e:
-        print(f"Error scanning EC2 in {region}: {str(e)}")
-    
-    return resources
+# Regional service types, in registry order; S3 is scanned once under GLOBAL_REGION
+REGIONAL_SERVICE_TYPES = [service_type for service_type, spec in SERVICE_SPECS.items() if not spec.global_service]
 
-def scan_rds_instances(region):
-    """Scan RDS instances in a specific region"""
-    resources = []
-    try:
-        rds = boto3.client('rds', region_name=region)
-        response = rds.describe_db_instances()
-        
-        for db_instance in response['DBInstances']:
-            resources.append({
-                'service_type': 'RDS',
-                'resource_type': 'DB Instance',
-                'resource_id': db_instance['DBInstanceIdentifier'],
-                'name': db_instance['DBInstanceIdentifier'],
-                'state': db_instance['DBInstanceStatus'],
-                'region': region,
-                'availability_zone': db_instance.get('AvailabilityZone', 'N/A'),
-                'instance_type': db_instance.get('DBInstanceClass', 'N/A'),
-                'engine': db_instance.get('Engine', 'N/A'),
-                'created_time': db_instance.get('InstanceCreateTime', '').isoformat() if db_instance.get('InstanceCreateTime') else 'N/A',
-                'tags': []
-            })
-    except Exception as e:
-        print(f"Error scanning RDS in {region}: {str(e)}")
-    
-    return resources
+_scheduler = None
+_scheduler_lock = threading.Lock()
 
-def scan_lambda_functions(region):
-    """Scan Lambda functions in a specific region"""
-    resources = []
-    try:
-        lambda_client = boto3.client('lambda', region_name=region)
-        response = lambda_client.list_functions()
-        
-        for function in response['Functions']:
-            resources.append({
-                'service_type': 'Lambda',
-                'resource_type': 'Function',
-                'resource_id': function['FunctionName'],
-                'name': function['FunctionName'],
-                'state': function.get('State', 'N/A'),
-                'region': region,
-                'availability_zone': 'N/A',
-                'runtime': function.get('Runtime', 'N/A'),
-                'memory_size': function.get('MemorySize', 'N/A'),
-                'last_modified': function.get('LastModified', 'N/A'),
-                'tags': []
-            })
-    except Exception as e:
-        print(f"Error scanning Lambda in {region}: {str(e)}")
-    
-    return resources
+def get_scheduler():
+    """Get the process-wide scan scheduler, creating it from the app config on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            service_limits = parse_service_limits(current_app.config.get('SCAN_SERVICE_LIMITS'))
+            # Account tasks wait on the account scanner's processes, so run as many as there are processes
+            if account_scanner.processes:
+                service_limits.setdefault('account', account_scanner.processes)
+            _scheduler = ScanScheduler(
+                max_workers=current_app.config.get('SCAN_MAX_WORKERS', 32),
+                default_service_limit=current_app.config.get('SCAN_SERVICE_CONCURRENCY', 8),
+                service_limits=service_limits
+            )
+            metrics.add_collector(collect_scheduler_metrics)
+            metrics.add_collector(collect_pruner_metrics)
+            metrics.add_collector(collect_rate_limit_metrics)
+        return _scheduler
 
-def scan_s3_buckets():
-    """Scan S3 buckets (global service)"""
-    resources = []
-    try:
-        s3 = boto3.client('s3')
-        response = s3.list_buckets()
-        
-        for bucket in response['Buckets']:
-            # Get bucket region
-            try:
-                location_response = s3.get_bucket_location(Bucket=bucket['Name'])
-                region = location_response['LocationConstraint'] or 'us-east-1'
-            except:
-                region = 'unknown'
-            
-            resources.append({
-                'service_type': 'S3',
-                'resource_type': 'Bucket',
-                'resource_id': bucket['Name'],
-                'name': bucket['Name'],
-                'state': 'Active',
-                'region': region,
-                'availability_zone': 'N/A',
-                'created_date': bucket.get('CreationDate', '').isoformat() if bucket.get('CreationDate') else 'N/A',
-                'tags': []
-            })
-    except Exception as e:
-        print(f"Error scanning S3: {str(e)}")
-    
-    return resources
+def shutdown_scheduler(wait=True):
+    """Stop the scan scheduler, if it was started, letting refresh tasks it has queued finish when wait is set"""
+    with _scheduler_lock:
+        scheduler = _scheduler
+    if scheduler is not None:
+        scheduler.shutdown(wait=wait)
 
-def scan_vpcs(region):
-    """Scan VPCs in a specific region"""
-    resources = []
-    try:
-        ec2 = boto3.client('ec2', region_name=region)
-        response = ec2.describe_vpcs()
-        
-        for vpc in response['Vpcs']:
-            name = 'N/A'
-            if 'Tags' in vpc:
-                for tag in vpc['Tags']:
-                    if tag['Key'] == 'Name':
-                        name = tag['Value']
-                        break
-            
-            resources.append({
-                'service_type': 'VPC',
-                'resource_type': 'VPC',
-                'resource_id': vpc['VpcId'],
-                'name': name,
-                'state': vpc['State'],
-                'region': region,
-                'availability_zone': 'N/A',
-                'cidr_block': vpc.get('CidrBlock', 'N/A'),
-                'is_default': vpc.get('IsDefault', False),
-                'tags': vpc.get('Tags', [])
-            })
-    except Exception as e:
-        print(f"Error scanning VPCs in {region}: {str(e)}")
-    
-    return resources
+def collect_scheduler_metrics():
+    stats = _scheduler.stats()
+    for state in ('running', 'pending'):
+        for service_type, count in stats[state].items():
+            metrics.scheduler_tasks.set(service_type, state, value=count)
 
-def scan_elb_load_balancers(region):
-    """Scan ELB Load Balancers in a specific region"""
-    resources = []
+def scan_cell(region, service_type):
+    """Scan a single (region, service_type) cell"""
+    started = time.perf_counter()
     try:
-        # Application and Network Load Balancers
-        elbv2 = boto3.client('elbv2', region_name=region)
-        response = elbv2.describe_load_balancers()
-        for lb in response['LoadBalancers']:
-            resources.append({
-                'service_type': 'ELB',
-                'resource_type': f"{lb['Type'].title()} Load Balancer",
-                'resource_id': lb['LoadBalancerName'],
-                'name': lb['LoadBalancerName'],
-                'state': lb['State']['Code'],
-                'region': region,
-                'availability_zone': ', '.join([az['ZoneName'] for az in lb.get('AvailabilityZones', [])]),
-                'scheme': lb.get('Scheme', 'N/A'),
-                'vpc_id': lb.get('VpcId', 'N/A'),
-                'created_time': lb.get('CreatedTime', '').isoformat() if lb.get('CreatedTime') else 'N/A',
-                'tags': []
-            })
+        resources = list(scan_service(SERVICE_SPECS[service_type], region))
     except Exception as e:
-        print(f"Error scanning ELBv2 in {region}: {str(e)}")
+        metrics.scan_errors.inc(service_type, region)
+        code = blocked_error_code(e)
+        if code is not None:
+            pruner.block_region(region, code)
+        raise
+    metrics.observe_scan(service_type, region, time.perf_counter() - started, len(resources))
     return resources
 
-def scan_cloudformation_stacks(region):
-    """Scan CloudFormation stacks in a specific region"""
-    resources = []
+def scan_single_cell(cell):
+    return {cell: scan_cell(*cell)}
+
+def scan_region_by_tags(region, service_types):
+    """Discover a region's bulk-capable services with the Resource Groups Tagging API"""
+    started = time.perf_counter()
     try:
-        cf = boto3.client('cloudformation', region_name=region)
-        response = cf.describe_stacks()
-        
-        for stack in response['Stacks']:
-            resources.append({
-                'service_type': 'CloudFormation',
-                'resource_type': 'Stack',
-                'resource_id': stack['StackName'],
-                'name': stack['StackName'],
-                'state': stack['StackStatus'],
-                'region': region,
-                'availability_zone': 'N/A',
-                'creation_time': stack.get('CreationTime', '').isoformat() if stack.get('CreationTime') else 'N/A',
-                'template_description': stack.get('Description', 'N/A'),
-                'tags': stack.get('Tags', [])
-            })
+        by_service = discover_region_by_tags(region, service_types)
     except Exception as e:
-        print(f"Error scanning CloudFormation in {region}: {str(e)}")
-    
-    return resources
+        metrics.scan_errors.inc('tagging', region)
+        code = blocked_error_code(e)
+        if code is not None:
+            pruner.block_region(region, code)
+        raise
+    metrics.observe_scan('tagging', region, time.perf_counter() - started, sum(len(resources) for resources in by_service.values()))
+    return {(region, service_type): resources for service_type, resources in by_service.items()}
 
-def scan_ecs_clusters(region):
-    """Scan ECS clusters in a specific region"""
-    resources = []
+def scan_by_config(aggregator_name, home_region, regions, service_types):
+    """Discover bulk-capable services across regions with one AWS Config aggregator query"""
+    started = time.perf_counter()
     try:
-        ecs = boto3.client('ecs', region_name=region)
-        
-        # List clusters
-        cluster_response = ecs.list_clusters()
-        if cluster_response['clusterArns']:
-            # Describe clusters
-            describe_response = ecs.describe_clusters(clusters=cluster_response['clusterArns'])
-            
-            for cluster in describe_response['clusters']:
-                resources.append({
-                    'service_type': 'ECS',
-                    'resource_type': 'Cluster',
-                    'resource_id': cluster['clusterName'],
-                    'name': cluster['clusterName'],
-                    'state': cluster['status'],
-                    'region': region,
-                    'availability_zone': 'N/A',
-                    'running_tasks': cluster.get('runningTasksCount', 0),
-                    'pending_tasks': cluster.get('pendingTasksCount', 0),
-                    'active_services': cluster.get('activeServicesCount', 0),
-                    'tags': cluster.get('tags', [])
-                })
-    except Exception as e:
-        print(f"Error scanning ECS in {region}: {str(e)}")
-    
-    return resources
+        results = discover_by_config(aggregator_name, regions, service_types, home_region)
+    except Exception:
+        metrics.scan_errors.inc('config', home_region)
+        raise
+    metrics.observe_scan('config', home_region, time.perf_counter() - started, sum(len(resources) for resources in results.values()))
+    return results
 
-def scan_sns_topics(region):
-    """Scan SNS topics in a specific region"""
-    resources = []
+def scan_account(account_id, role_arn, cells):
+    """Scan cells of one account on the account scanner's worker processes"""
+    started = time.perf_counter()
     try:
-        sns = boto3.client('sns', region_name=region)
-        response = sns.list_topics()
-        
-        for topic in response['Topics']:
-            topic_arn = topic['TopicArn']
-            topic_name = topic_arn.split(':')[-1]
-            
-            # Get topic attributes
-            try:
-                attrs_response = sns.get_topic_attributes(TopicArn=topic_arn)
-                attributes = attrs_response['Attributes']
-                
-                resources.append({
-                    'service_type': 'SNS',
-                    'resource_type': 'Topic',
-                    'resource_id': topic_name,
-                    'name': topic_name,
-                    'state': 'Active',
-                    'region': region,
-                    'availability_zone': 'N/A',
-                    'subscriptions_confirmed': attributes.get('SubscriptionsConfirmed', '0'),
-                    'subscriptions_pending': attributes.get('SubscriptionsPending', '0'),
-                    'display_name': attributes.get('DisplayName', 'N/A'),
-                    'tags': []
-                })
-            except Exception as e:
-                print(f"Error getting SNS topic attributes for {topic_name}: {str(e)}")
-                
-    except Exception as e:
-        print(f"Error scanning SNS in {region}: {str(e)}")
-    
-    return resources
+        results, blocked = account_scanner.scan(account_id, role_arn, cells)
+    except Exception:
+        metrics.scan_errors.inc('account', account_id)
+        raise
+    for scope, code in blocked:
+        pruner.block_region(scope, code)
+    metrics.observe_scan('account', account_id, time.perf_counter() - started, sum(len(resources) for resources in results.values()))
+    return results
+
+def plan_refresh(cells):
+    """Group expired cells into refresh tasks for the configured discovery engine
+
+    Returns a list of (key, label, scan_fn, args, cells) tuples where
+    scan_fn(*args) returns {cell: resources} covering at least those cells.
+    The per-service scanners give one task per cell. The 'tagging' engine
+    gives one task per region and the 'config' engine one task for every
+    region, for the services in ENGINE_SERVICE_TYPES; other services, and
+    those in BULK_FALLBACK_SERVICES, use the per-service scanners. With
+    AWS_ACCOUNT_ROLE_ARNS, each account's cells are one task for the
+    account scanner, whatever the engine.
+    """
+    if account_scanner.accounts:
+        role_arns = dict(account_scanner.accounts)
+        account_cells = {}
+        for cell in cells:
+            account_cells.setdefault(split_scope(cell[0])[0], []).append(cell)
+        return [
+            (('account', account_id) + tuple(sorted(task_cells)), 'account', scan_account, (account_id, role_arns[account_id], tuple(task_cells)), task_cells)
+            for account_id, task_cells in account_cells.items()
+        ]
+
+    engine = current_app.config.get('DISCOVERY_ENGINE', 'scanners')
+    fallback = set(split_param(current_app.config.get('BULK_FALLBACK_SERVICES')) or ())
+    bulk_service_types = tuple(service_type for service_type in ENGINE_SERVICE_TYPES.get(engine, ()) if service_type not in fallback)
+
+    tasks = []
+    bulk_cells = {}
+    for cell in cells:
+        region, service_type = cell
+        if engine == 'scanners' or service_type not in bulk_service_types:
+            tasks.append((cell, service_type, scan_single_cell, (cell,), [cell]))
+        else:
+            bulk_cells.setdefault(region, []).append(cell)
+
+    if engine == 'tagging':
+        for region, region_cells in bulk_cells.items():
+            tasks.append(((region, 'tagging'), 'tagging', scan_region_by_tags, (region, bulk_service_types), region_cells))
+    elif engine == 'config' and bulk_cells:
+        regions = tuple(sorted(bulk_cells))
+        args = (
+            current_app.config.get('CONFIG_AGGREGATOR_NAME'),
+            current_app.config.get('CONFIG_AGGREGATOR_REGION', 'us-east-1'),
+            regions,
+            bulk_service_types
+        )
+        task_cells = [cell for region in regions for cell in bulk_cells[region]]
+        tasks.append((('config',) + regions, 'config', scan_by_config, args, task_cells))
+    return tasks
 
-def scan_sqs_queues(region):
-    """Scan SQS queues in a specific region"""
-    resources = []
+def refresh_task(app, scan_fn, args, cells=()):
+    """Run a refresh task, then save and index every cell it returned as its newest snapshot
+
+    Returns {cell: (snapshot_id, resources)}. A cell whose content did not
+    change keeps its snapshot ID, its existing index and its counts. Every
+    returned cell's counts are recorded in the history. This process's
+    leases on cells are released once the snapshots are saved, or the scan
+    has failed.
+    """
+    started = time.perf_counter()
     try:
-        sqs = boto3.client('sqs', region_name=region)
-        response = sqs.list_queues()
-        
-        if 'QueueUrls' in response:
-            for queue_url in response['QueueUrls']:
-                queue_name = queue_url.split('/')[-1]
-                
-                # Get queue attributes
+        results = scan_fn(*args)
+        seconds = (time.perf_counter() - started) / max(len(results), 1)
+        with app.app_context():
+            saved = save_snapshots(results)
+            snapshots = {cell: (snapshot.id, snapshot.content_hash) for cell, snapshot in saved.items()}
+    finally:
+        if cells and app.config.get('SCAN_LEASE_SECONDS', 120):
+            with app.app_context():
+                release_leases(cells)
+
+    indexed = {}
+    cell_counts = {}
+    for cell, resources in results.items():
+        version, digest = snapshots[cell]
+        # The pruner first, so the refresher schedules the cell with its new empty streak
+        pruner.observe(cell, resources)
+        refresher.observe(cell, digest, seconds)
+        indexed_resources = inventory_index.get_resources(cell, version)
+        if indexed_resources is None:
+            indexed_resources = inventory_index.load(cell, version, resources)
+            topology_index.update(cell, version, resources)
+        cell_counts[cell] = count_aggregates.counts_for(cell, version, resources)
+        indexed[cell] = (version, indexed_resources)
+    with app.app_context():
+        history_recorder.record(cell_counts)
+    return indexed
+
+# Refresh tasks running right now, shared by every request that needs their cells
+_inflight_tasks = SingleFlight()
+
+def submit_refresh(key, label, scan_fn, args, cells=()):
+    """Start a refresh task, or attach to the identical one already in flight
+
+    cells are the cells this process leased for the task. Returns (future, started).
+    """
+    app = current_app._get_current_object()
+    return _inflight_tasks.submit(key, lambda: get_scheduler().submit(label, refresh_task, app, scan_fn, args, cells))
+
+def claim_cells(cells):
+    """Split cells due a rescan into (cells to rescan here, cells another process is rescanning)
+
+    Workers sharing the database lease each cell before rescanning it, for
+    SCAN_LEASE_SECONDS, so a cell is scanned by one of them and the others
+    read the snapshot it saves. A lease whose holder died expires. With
+    SCAN_LEASE_SECONDS=0 every cell is rescanned here.
+    """
+    seconds = current_app.config.get('SCAN_LEASE_SECONDS', 120)
+    if not seconds or not cells:
+        return list(cells), []
+    held = acquire_leases(cells, seconds)
+    return [cell for cell in cells if cell in held], [cell for cell in cells if cell not in held]
+
+def revalidate_cells(cells):
+    """Refresh cells in the background without waiting for them
+
+    While the background refresher runs the cells are queued on it, so they
+    are rescanned within its rate limit; otherwise their refresh tasks are
+    started right away.
+    """
+    if refresher.running:
+        refresher.request(cells)
+        return
+    cells, _ = claim_cells(cells)
+    for key, label, scan_fn, args, task_cells in plan_refresh(cells):
+        submit_refresh(key, label, scan_fn, args, task_cells)
+
+def run_background_refresh(app):
+    """Start refresh tasks for the cells the refresher finds due, within its rate limit"""
+    with app.app_context():
+        due = refresher.due()
+        if not due:
+            return
+        for key, label, scan_fn, args, task_cells in plan_refresh(due):
+            if not refresher.bucket.try_acquire():
+                break
+            # Cells another process is refreshing are checked again an interval from now
+            refresher.started(task_cells)
+            claimed, _ = claim_cells(task_cells)
+            if claimed:
+                submit_refresh(key, label, scan_fn, args, claimed)
+
+def seed_background_refresh(app):
+    """Track every cell, due one interval after its latest snapshot or now if it has none"""
+    with app.app_context():
+        cells = inventory_cells(get_all_regions())
+        snapshots = latest_snapshots(cells)
+        for cell in cells:
+            snapshot = snapshots.get(cell)
+            refresher.seed(cell, snapshot.scanned_at.timestamp() if snapshot is not None else None)
+
+def start_background_refresh(app):
+    """Start the background refresher thread for an app"""
+    metrics.add_collector(collect_refresher_metrics)
+    refresher.start(lambda: seed_background_refresh(app), lambda: run_background_refresh(app))
+
+def collect_pruner_metrics():
+    stats = pruner.stats()
+    metrics.pruned.set('empty_cells', value=stats['empty_cells'])
+    metrics.pruned.set('blocked_regions', value=stats['blocked_regions'])
+
+def collect_rate_limit_metrics():
+    for entry in rate_limiters.stats():
+        account = entry['role_arn'].split(':')[4] if 'role_arn' in entry else ''
+        metrics.rate_limit.set(entry['service'], entry['region'], account, value=entry['rate'])
+        metrics.rate_limit_wait.set(entry['service'], entry['region'], account, value=entry['wait_seconds'])
+
+def collect_refresher_metrics():
+    stats = refresher.stats()
+    metrics.refresher_cells.set('tracked', value=stats['tracked'])
+    metrics.refresher_cells.set('due', value=stats['due'])
+
+def get_cache_ttl():
+    """Seconds a snapshot is served before its cell is rescanned"""
+    if request.args.get('refresh', '').lower() in ('1', 'true', 'yes'):
+        return 0
+    return current_app.config.get('SCAN_CACHE_TTL', 300)
+
+def get_deadline():
+    """Monotonic time by which a request must answer, from ?deadline_ms= or SCAN_DEADLINE_MS, or None"""
+    deadline_ms = request.args.get('deadline_ms', type=int) or current_app.config.get('SCAN_DEADLINE_MS')
+    if not deadline_ms or deadline_ms <= 0:
+        return None
+    return time.monotonic() + deadline_ms / 1000.0
+
+def inventory_cells(regions, service_types=None):
+    """List the (region, service_type) cells covering the given regions and services
+
+    With AWS_ACCOUNT_ROLE_ARNS, every account gets its own cells, except in
+    regions it is blocked from.
+    """
+    account_ids = [account_id for account_id, _ in account_scanner.accounts] or [None]
+    blocked = pruner.blocked_regions() if account_scanner.accounts else set()
+    cells = [
+        (cell_scope(account_id, region), service_type)
+        for account_id in account_ids
+        for region in regions
+        if cell_scope(account_id, region) not in blocked
+        for service_type in REGIONAL_SERVICE_TYPES
+        if service_types is None or service_type in service_types
+    ]
+    for account_id in account_ids:
+        for service_type, spec in SERVICE_SPECS.items():
+            if spec.global_service and (service_types is None or service_type in service_types):
+                cells.append((cell_scope(account_id, GLOBAL_REGION), service_type))
+    return cells
+
+def cell_info(cell):
+    """Describe a cell as {'region', 'service_type'}, plus 'account_id' in multi-account mode"""
+    account_id, region = split_scope(cell[0])
+    info = {'region': region, 'service_type': cell[1]}
+    if account_id:
+        info['account_id'] = account_id
+    return info
+
+def stale_cell_info(cell, snapshot, reason, now):
+    """Describe a cell served from an out-of-date snapshot, with why and how old it is"""
+    return dict(cell_info(cell), reason=reason, scanned_at=snapshot.scanned_at.isoformat(), age_seconds=round(snapshot.age_seconds(now), 1))
+
+def load_snapshot(cell, snapshot):
+    """Get a snapshot's resources from the in-memory index, parsing it only on first use"""
+    resources = inventory_index.get_resources(cell, snapshot.id)
+    if resources is not None:
+        metrics.cache_hit('index')
+        return resources
+    metrics.cache_miss('index')
+    resources = snapshot.get_resources()
+    topology_index.update(cell, snapshot.id, resources)
+    return inventory_index.load(cell, snapshot.id, resources)
+
+def iter_inventory(regions, max_age, cache_info=None, service_types=None, timing=None, deadline=None, versions=None):
+    """Yield ((region, service_type), resources) for each cell as soon as it is available, filling in cache_info at the end"""
+    cells = inventory_cells(regions, service_types)
+    started = time.perf_counter()
+
+    def record(cell, source):
+        if timing is not None:
+            timing.append(dict(
+                cell_info(cell),
+                source=source,
+                ready_ms=round((time.perf_counter() - started) * 1000, 2)
+            ))
+
+    now = datetime.now()
+    snapshots = latest_snapshots(cells)
+    # Snapshots saved from here on get higher IDs, so this is a safe ?since= cursor for /services/changes
+    cursor = max((snapshot.id for snapshot in snapshots.values()), default=0)
+    revalidate = max_age > 0 and current_app.config.get('SCAN_STALE_WHILE_REVALIDATE', False)
+    expired = []
+    revalidating = []
+    served = []
+    pruned = 0
+    stale_cells = []
+    missing_cells = []
+    if versions is None:
+        versions = {}
+
+    def fall_back(cell, reason):
+        """Serve the last known snapshot of a cell that could not be rescanned"""
+        snapshot = snapshots.get(cell)
+        if snapshot is None:
+            missing_cells.append(dict(cell_info(cell), reason=reason))
+            record(cell, 'missing')
+            return
+        served.append(snapshot.scanned_at)
+        stale_cells.append(stale_cell_info(cell, snapshot, reason, now))
+        record(cell, 'stale')
+        versions[cell] = snapshot.id
+        yield cell, load_snapshot(cell, snapshot)
+    for cell in cells:
+        snapshot = snapshots.get(cell)
+        if snapshot is not None and snapshot.age_seconds(now) <= pruner.max_age(cell, max_age):
+            if snapshot.age_seconds(now) > max_age:
+                pruned += 1
+            metrics.cache_hit('snapshot')
+            served.append(snapshot.scanned_at)
+            record(cell, 'snapshot')
+            versions[cell] = snapshot.id
+            yield cell, load_snapshot(cell, snapshot)
+        elif snapshot is not None and revalidate:
+            metrics.cache_requests.inc('snapshot', 'stale')
+            served.append(snapshot.scanned_at)
+            revalidating.append(cell)
+            stale_cells.append(stale_cell_info(cell, snapshot, 'revalidating', now))
+            record(cell, 'revalidate')
+            versions[cell] = snapshot.id
+            yield cell, load_snapshot(cell, snapshot)
+        else:
+            metrics.cache_miss('snapshot')
+            expired.append(cell)
+
+    if revalidating:
+        revalidate_cells(revalidating)
+
+    scanned = 0
+    coalesced = 0
+    shared = []
+    if expired:
+        expired, shared = claim_cells(expired)
+    if expired:
+        # Each refresh task runs on its own, so a scan takes roughly as long as its slowest task.
+        # Concurrent requests attach to an in-flight task instead of starting another.
+        future_to_cells = {}
+        coalesced_cells = set()
+        for key, label, scan_fn, args, task_cells in plan_refresh(expired):
+            future, is_new = submit_refresh(key, label, scan_fn, args, task_cells)
+            future_to_cells.setdefault(future, []).extend(task_cells)
+            if not is_new:
+                coalesced += len(task_cells)
+                coalesced_cells.update(task_cells)
+
+        timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        try:
+            for future in concurrent.futures.as_completed(list(future_to_cells), timeout=timeout):
+                task_cells = future_to_cells.pop(future)
                 try:
-                    attrs_response = sqs.get_queue_attributes(
-                        QueueUrl=queue_url,
-                        AttributeNames=['All']
-                    )
-                    attributes = attrs_response['Attributes']
-                    
-                    resources.append({
-                        'service_type': 'SQS',
-                        'resource_type': 'Queue',
-                        'resource_id': queue_name,
-                        'name': queue_name,
-                        'state': 'Active',
-                        'region': region,
-                        'availability_zone': 'N/A',
-                        'messages_available': attributes.get('ApproximateNumberOfMessages', '0'),
-                        'messages_in_flight': attributes.get('ApproximateNumberOfMessagesNotVisible', '0'),
-                        'created_timestamp': attributes.get('CreatedTimestamp', 'N/A'),
-                        'tags': []
-                    })
+                    results = future.result()
                 except Exception as e:
-                    print(f"Error getting SQS queue attributes for {queue_name}: {str(e)}")
-                    
-    except Exception as e:
-        print(f"Error scanning SQS in {region}: {str(e)}")
-    
-    return resources
+                    logger.warning("Error scanning %s: %s", ', '.join(f'{service_type} in {region}' for region, service_type in task_cells), e)
+                    results = {}
+
+                for cell in task_cells:
+                    if cell not in results:
+                        yield from fall_back(cell, 'failed')
+                        continue
+
+                    scanned += 1
+                    record(cell, 'coalesced' if cell in coalesced_cells else 'scan')
+                    versions[cell], resources = results[cell]
+                    yield cell, resources
+        except concurrent.futures.TimeoutError:
+            # Abandon the rescans still running; they keep going and refresh the cache when done
+            for task_cells in future_to_cells.values():
+                for cell in task_cells:
+                    yield from fall_back(cell, 'deadline')
+
+    # Cells another process is rescanning are read from the snapshots it saves once it releases them
+    waiting = {cell: snapshots[cell].scanned_at if cell in snapshots else None for cell in shared}
+    while waiting:
+        # End the read transaction, so snapshots committed by other processes are visible
+        db.session.rollback()
+        leased = leased_cells(waiting)
+        released = [cell for cell in waiting if cell not in leased]
+        latest = latest_snapshots(released)
+        for cell in released:
+            previous = waiting.pop(cell)
+            snapshot = latest.get(cell)
+            if snapshot is None or (previous is not None and snapshot.scanned_at <= previous):
+                yield from fall_back(cell, 'failed')
+                continue
+            scanned += 1
+            record(cell, 'shared')
+            versions[cell] = snapshot.id
+            yield cell, load_snapshot(cell, snapshot)
+        if waiting and deadline is not None and time.monotonic() >= deadline:
+            for cell in list(waiting):
+                del waiting[cell]
+                yield from fall_back(cell, 'deadline')
+        if waiting:
+            time.sleep(SHARED_POLL_SECONDS)
+
+    if cache_info is not None:
+        cache_info.update({
+            'ttl_seconds': max_age,
+            'snapshot_id': cursor,
+            'cached_cells': len(served),
+            'scanned_cells': scanned,
+            'coalesced_cells': coalesced,
+            'shared_cells': len(shared),
+            'oldest_snapshot': min(served).isoformat() if served else now.isoformat(),
+            'max_age_seconds': round((now - min(served)).total_seconds(), 1) if served else 0,
+            'revalidating_cells': len(revalidating),
+            'pruned_cells': pruned,
+            'partial': bool(stale_cells or missing_cells),
+            'stale_cells': stale_cells,
+            'missing_cells': missing_cells
+        })
+
+def summarize_inventory(regions, max_age, service_types=None, versions=None):
+    """Get resource counts by (region, service_type, state) without reading resources or waiting for scans
+
+    Counts come from count_aggregates, or from the counts stored with each
+    cell's latest snapshot. Expired cells, and cells never scanned, are
+    rescanned in the background and counted once they are saved; until
+    then expired cells count from their last snapshot and cells never
+    scanned are reported in missing_cells. Returns (counts, cache_info).
+    """
+    cells = inventory_cells(regions, service_types)
+    now = datetime.now()
+    snapshots = latest_snapshots(cells)
+    if versions is None:
+        versions = {}
+    counts = {}
+    served = []
+    expired = []
+    pruned = 0
+    stale_cells = []
+    missing_cells = []
+    for cell in cells:
+        snapshot = snapshots.get(cell)
+        if snapshot is None:
+            missing_cells.append(dict(cell_info(cell), reason='pending'))
+            expired.append(cell)
+            continue
+        if snapshot.age_seconds(now) > pruner.max_age(cell, max_age):
+            expired.append(cell)
+            stale_cells.append(stale_cell_info(cell, snapshot, 'revalidating', now))
+        elif snapshot.age_seconds(now) > max_age:
+            pruned += 1
+
+        cell_counts = count_aggregates.get(cell, snapshot.id)
+        if cell_counts is None:
+            cell_counts = snapshot.get_state_counts()
+            if cell_counts is None:
+                # Snapshots saved before counts were stored are counted once from their resources
+                cell_counts = state_counts(load_snapshot(cell, snapshot))
+            count_aggregates.put(cell, snapshot.id, cell_counts)
+        for (region, state), count in cell_counts.items():
+            key = (region, cell[1], state)
+            counts[key] = counts.get(key, 0) + count
+        served.append(snapshot.scanned_at)
+        versions[cell] = snapshot.id
+
+    if expired:
+        revalidate_cells(expired)
+
+    cache_info = {
+        'ttl_seconds': max_age,
+        'snapshot_id': max((snapshot.id for snapshot in snapshots.values()), default=0),
+        'cached_cells': len(served),
+        'scanned_cells': 0,
+        'coalesced_cells': 0,
+        'oldest_snapshot': min(served).isoformat() if served else now.isoformat(),
+        'max_age_seconds': round((now - min(served)).total_seconds(), 1) if served else 0,
+        'revalidating_cells': len(stale_cells),
+        'pruned_cells': pruned,
+        'partial': bool(stale_cells or missing_cells),
+        'stale_cells': stale_cells,
+        'missing_cells': missing_cells
+    }
+    return counts, cache_info
+
+def get_inventory(regions, max_age, timing=None, service_types=None, deadline=None, versions=None):
+    """Get resources per (region, service_type) cell, rescanning only expired cells
+
+    Returns a tuple of (cell_resources, cache_info).
+    """
+    cache_info = {}
+    cell_resources = dict(iter_inventory(regions, max_age, cache_info, service_types, timing, deadline, versions))
+    return cell_resources, cache_info
+
+# Parameters that change how a response is produced but not what it contains
+ETAG_IGNORED_PARAMS = {'deadline_ms'}
+
+def inventory_etag(versions, partial=False):
+    """ETag of a response built from the given {cell: snapshot_id} and the request's parameters"""
+    params = sorted((key, value) for key, value in request.args.items(multi=True) if key not in ETAG_IGNORED_PARAMS)
+    cells = sorted([region, service_type, version] for (region, service_type), version in versions.items())
+    return hashlib.sha1(json.dumps([request.path, params, cells, partial]).encode()).hexdigest()
+
+def get_format():
+    """Response format from ?format=: 'json' (the default) or 'columnar'"""
+    response_format = request.args.get('format', 'json').lower()
+    if response_format not in ('json', 'columnar'):
+        raise ValueError(f"Unknown format: {response_format}")
+    return response_format
+
+def conditional_response(versions, cache_info, build, cacheable=True, request_fields=None):
+    """Respond with build()'s body as JSON under a weak ETag for the snapshot versions it came from
+
+    Returns 304 Not Modified if the client's If-None-Match has the ETag.
+    Snapshot IDs only change with content, so an unchanged inventory skips
+    building and sending the body. build() returns only what the snapshots
+    determine; cache_info as 'cache', a 'timestamp' and any request_fields
+    are added to the body as it is sent. Bodies are compressed with gzip
+    when the client accepts it, and cacheable bodies are kept in
+    payload_cache without those fields, so repeated requests serve
+    pre-built bytes.
+    """
+    etag = inventory_etag(versions, cache_info.get('partial', False))
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        key = (etag, negotiate_encoding(request.accept_encodings))
+        payload = payload_cache.get(key) if cacheable else None
+        if payload is not None:
+            metrics.cache_hit('payload')
+        else:
+            metrics.cache_miss('payload')
+            # The closing brace is left off, for the per-request fields to follow
+            payload = compress_head(current_app.json.dumps(build()).encode()[:-1], key[1])
+            if cacheable:
+                payload_cache.put(key, *payload)
+        head, encoding = payload
+        fields = dict(request_fields or {}, cache=cache_info, timestamp=datetime.now().isoformat())
+        tail = b',' + current_app.json.dumps(fields).encode()[1:]
+        response = Response(finish_body(head, tail, encoding), mimetype='application/json')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def parse_selection(args, regions):
+    """Narrow a scan to ?services= and ?regions=
+
+    Returns (regions, service_types, selected_regions); service_types and
+    selected_regions are None when not given. Raises ValueError for unknown
+    services or regions.
+    """
+    service_types = split_param(args.get('services'))
+    if service_types:
+        unknown = sorted(service_types - set(SERVICE_SPECS))
+        if unknown:
+            raise ValueError(f"Unknown services: {', '.join(unknown)}")
+
+    selected_regions = split_param(args.get('regions'))
+    if selected_regions:
+        unknown = sorted(selected_regions - set(regions))
+        if unknown:
+            raise ValueError(f"Unknown regions: {', '.join(unknown)}")
+        regions = [region for region in regions if region in selected_regions]
+    return regions, service_types, selected_regions
+
+def count_services(cell_resources, versions, selected_regions=None):
+    """Count resources per service type from each cell's counts, keeping global cells' resources in selected_regions"""
+    service_summary = {}
+    for cell, resources in cell_resources.items():
+        for (region, _), count in count_aggregates.counts_for(cell, versions[cell], resources).items():
+            if selected_regions is None or region in selected_regions:
+                service_summary[cell[1]] = service_summary.get(cell[1], 0) + count
+    return service_summary
+
+def select_resources(cell, resources, selected_regions):
+    """Keep only the resources of a global cell (S3) located in the selected regions"""
+    if selected_regions is None or split_scope(cell[0])[1] != GLOBAL_REGION:
+        return resources
+    return [resource for resource in resources if resource['region'] in selected_regions]
+
+def stream_inventory(regions, max_age, stream_format, service_types=None, selected_regions=None, deadline=None):
+    """Stream each (region, service_type) batch as NDJSON or SSE, ending with a summary record"""
+    def encode(record_type, record):
+        if stream_format == 'sse':
+            return f"event: {record_type}\ndata: {json.dumps(record, default=str)}\n\n"
+        return json.dumps(dict(record, type=record_type), default=str) + '\n'
+
+    def generate():
+        cache_info = {}
+        service_summary = {}
+        total_count = 0
+        for cell, resources in iter_inventory(regions, max_age, cache_info, service_types, deadline=deadline):
+            resources = list(select_resources(cell, resources, selected_regions))
+            if resources:
+                service_summary[cell[1]] = service_summary.get(cell[1], 0) + len(resources)
+                total_count += len(resources)
+            yield encode('batch', dict(cell_info(cell), resources=resources, count=len(resources)))
+
+        yield encode('summary', {
+            'total_count': total_count,
+            'service_summary': service_summary,
+            'regions_scanned': len(regions),
+            'cache': cache_info,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-def scan_dynamodb_tables(region):
-    """Scan DynamoDB tables in a specific region"""
-    resources = []
+def query_inventory(regions, query, deadline=None):
+    """Answer a filtered, cursor-paginated query from the indexed inventory, over regions already narrowed to ?regions="""
+    cache_info = {}
+    versions = {}
+    cells = []
+    for cell, _ in iter_inventory(regions, get_cache_ttl(), cache_info, query['services'], deadline=deadline, versions=versions):
+        cells.append(cell)
+    
     try:
-        dynamodb = boto3.client('dynamodb', region_name=region)
-        response = dynamodb.list_tables()
-        
-        for table_name in response['TableNames']:
-            # Get table details
-            try:
-                table_response = dynamodb.describe_table(TableName=table_name)
-                table = table_response['Table']
-                
-                resources.append({
-                    'service_type': 'DynamoDB',
-                    'resource_type': 'Table',
-                    'resource_id': table_name,
-                    'name': table_name,
-                    'state': table['TableStatus'],
-                    'region': region,
-                    'availability_zone': 'N/A',
-                    'item_count': table.get('ItemCount', 0),
-                    'table_size_bytes': table.get('TableSizeBytes', 0),
-                    'billing_mode': table.get('BillingModeSummary', {}).get('BillingMode', 'N/A'),
-                    'created_time': table.get('CreationDateTime', '').isoformat() if table.get('CreationDateTime') else 'N/A',
-                    'tags': []
-                })
-            except Exception as e:
-                print(f"Error getting DynamoDB table details for {table_name}: {str(e)}")
-                
-    except Exception as e:
-        print(f"Error scanning DynamoDB in {region}: {str(e)}")
+        page, next_cursor, total = inventory_index.query(cells, query)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return resources
+    return conditional_response(versions, cache_info, lambda: {
+        'resources': page,
+        'count': len(page),
+        'total_count': total,
+        'next_cursor': next_cursor
+    })
 
-def scan_region(region):
-    """Scan all services in a specific region"""
-    all_resources = []
-    
-    # Scan regional services
-    all_resources.extend(scan_ec2_instances(region))
-    all_resources.extend(scan_rds_instances(region))
-    all_resources.extend(scan_lambda_functions(region))
-    all_resources.extend(scan_vpcs(region))
-    all_resources.extend(scan_elb_load_balancers(region))
-    all_resources.extend(scan_cloudformation_stacks(region))
-    all_resources.extend(scan_ecs_clusters(region))
-    all_resources.extend(scan_sns_topics(region))
-    all_resources.extend(scan_sqs_queues(region))
-    all_resources.extend(scan_dynamodb_tables(region))
+# Longest ranges answered from hourly and daily rollups by default; longer ones use weekly rollups
+HISTORY_DEFAULT_GRANULARITY = ((timedelta(days=2), 'hour'), (timedelta(days=90), 'day'))
+HISTORY_GROUP_COLUMNS = {'account': 'scope', 'region': 'region', 'service': 'service_type', 'state': 'state'}
+
+def parse_time(value):
+    """Parse an ISO 8601 time into a naive local datetime, like the ones stored, or None when absent"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def history_series(rows, group_by):
+    """Gather rollup rows, ordered by series and bucket, into series of points, merging the scopes of one account
+
+    Like query_rollups, merged points keep their summed last count and mean
+    but no min, max or samples.
+    """
+    scope_at = group_by.index('scope') if 'scope' in group_by else None
+    series = {}
+    for values, bucket, last, low, high, mean, samples in rows:
+        if scope_at is not None:
+            values = values[:scope_at] + (split_scope(values[scope_at])[0],) + values[scope_at + 1:]
+        points = series.get(values)
+        if points is None:
+            points = series[values] = {}
+        point = points.get(bucket)
+        if point is None:
+            points[bucket] = [last, low, high, mean, samples]
+        else:
+            points[bucket] = [point[0] + last, None, None, point[3] + mean, None]
     
-    return all_resources
+    names = ['account_id' if column == 'scope' else column for column in group_by]
+    return [
+        dict(zip(names, values), points=[
+            {'time': bucket.isoformat(), 'count': last, 'min': low, 'max': high, 'mean': round(mean, 2), 'samples': samples}
+            for bucket, (last, low, high, mean, samples) in sorted(points.items())
+        ])
+        for values, points in series.items()
+    ]
+
+def export_rows(regions, max_age, tag_keys, service_types=None, selected_regions=None, query=None, deadline=None, cache_info=None):
+    """Yield every exported resource, cell by cell as the inventory is loaded, with its tag columns flattened
+
+    With a query (see parse_query), only resources matching its filters are
+    exported; its cursor and limit are ignored.
+    """
+    for cell, resources in iter_inventory(regions, max_age, cache_info, service_types, deadline=deadline):
+        if query is not None:
+            resources = inventory_index.select(cell, query)
+        for resource in select_resources(cell, resources, selected_regions):
+            yield flatten_tags(resource, tag_keys)
+
+def export_chunks(export_format, rows, service_types=None, tag_keys=()):
+    """Encode exported rows as 'csv' or 'ndjson' text chunks"""
+    if export_format == 'ndjson':
+        return encode_ndjson(rows)
+    specs = [spec for service_type, spec in SERVICE_SPECS.items() if service_types is None or service_type in service_types]
+    return encode_csv(rows, export_columns(specs, tag_keys, account_column=bool(account_scanner.accounts)))
 
 @aws_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@aws_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Scan, AWS API and cache metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@aws_bp.route('/ratelimits', methods=['GET'])
+def get_rate_limits():
+    """Current state of the adaptive rate limiter of every AWS API endpoint called so far"""
+    return jsonify({'settings': rate_limiters.settings, 'limiters': rate_limiters.stats(), 'timestamp': datetime.now().isoformat()})
+
 @aws_bp.route('/regions', methods=['GET'])
 def get_regions():
     """Get all available AWS regions"""
     try:
         regions = get_all_regions()
         return jsonify({'regions': regions, 'count': len(regions)})
-    except NoCredentialsError:
+    except no_credentials_error():
         return jsonify({'error': 'AWS credentials not configured'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -396,44 +825,62 @@ def get_regions():
 def get_all_services():
     """Get all services across all regions"""
     try:
+        started = time.perf_counter()
+        deadline = get_deadline()
         regions = get_all_regions()
         if not regions:
             return jsonify({'error': 'No regions available'}), 500
+        regions_ms = (time.perf_counter() - started) * 1000
         
-        all_resources = []
+        try:
+            regions, service_types, selected_regions = parse_selection(request.args, regions)
+            response_format = get_format()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Add S3 buckets (global service)
-        all_resources.extend(scan_s3_buckets())
+        if wants_page(request.args):
+            return query_inventory(regions, parse_query(request.args), deadline)
+        paged_only = [param for param in FILTER_PARAMS + PAGE_PARAMS if param in request.args]
+        if paged_only:
+            return jsonify({'error': f"{', '.join(paged_only)} only apply with paginate=true"}), 400
         
-        # Scan all regions in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_region = {executor.submit(scan_region, region): region for region in regions}
-            
-            for future in concurrent.futures.as_completed(future_to_region):
-                region = future_to_region[future]
-                try:
-                    region_resources = future.result()
-                    all_resources.extend(region_resources)
-                except Exception as e:
-                    print(f"Error scanning region {region}: {str(e)}")
+        stream_format = request.args.get('stream', '').lower()
+        if stream_format in ('ndjson', 'sse'):
+            return stream_inventory(regions, get_cache_ttl(), stream_format, service_types, selected_regions, deadline)
         
-        # Group by service type for summary
-        service_summary = {}
-        for resource in all_resources:
-            service_type = resource['service_type']
-            if service_type not in service_summary:
-                service_summary[service_type] = 0
-            service_summary[service_type] += 1
+        include_timing = request.args.get('timing', '').lower() in ('1', 'true', 'yes')
+        cell_timing = [] if include_timing else None
+        versions = {}
+        inventory_started = time.perf_counter()
+        cell_resources, cache_info = get_inventory(regions, get_cache_ttl(), cell_timing, service_types, deadline, versions)
+        inventory_ms = (time.perf_counter() - inventory_started) * 1000
         
-        return jsonify({
-            'resources': all_resources,
-            'total_count': len(all_resources),
-            'service_summary': service_summary,
-            'regions_scanned': len(regions),
-            'timestamp': datetime.now().isoformat()
-        })
+        def build():
+            all_resources = []
+            for cell, resources in cell_resources.items():
+                all_resources.extend(select_resources(cell, resources, selected_regions))
+            
+            response = {
+                'resources': all_resources,
+                'total_count': len(all_resources),
+                'service_summary': count_services(cell_resources, versions, selected_regions),
+                'regions_scanned': len(regions)
+            }
+            if response_format == 'columnar':
+                response['format'] = 'columnar'
+                response['resources'] = encode_columnar(all_resources)
+            if include_timing:
+                response['timing'] = {
+                    'regions_ms': round(regions_ms, 2),
+                    'inventory_ms': round(inventory_ms, 2),
+                    'total_ms': round((time.perf_counter() - started) * 1000, 2),
+                    'cells': cell_timing
+                }
+            return response
         
-    except NoCredentialsError:
+        return conditional_response(versions, cache_info, build, cacheable=not include_timing)
+        
+    except no_credentials_error():
         return jsonify({'error': 'AWS credentials not configured'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -442,29 +889,243 @@ def get_all_services():
 def get_services_by_region(region):
     """Get all services in a specific region"""
     try:
-        resources = scan_region(region)
+        deadline = get_deadline()
+        regions = get_all_regions()
+        if not regions:
+            return jsonify({'error': 'No regions available'}), 500
+        if region not in regions:
+            return jsonify({'error': f'Unknown region: {region}'}), 404
+
+        try:
+            _, service_types, _ = parse_selection(request.args, [region])
+            response_format = get_format()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Add S3 buckets for the specific region
-        s3_buckets = scan_s3_buckets()
-        region_s3_buckets = [bucket for bucket in s3_buckets if bucket['region'] == region]
-        resources.extend(region_s3_buckets)
+        versions = {}
+        cell_resources, cache_info = get_inventory([region], get_cache_ttl(), service_types=service_types, deadline=deadline, versions=versions)
         
-        service_summary = {}
-        for resource in resources:
-            service_type = resource['service_type']
-            if service_type not in service_summary:
-                service_summary[service_type] = 0
-            service_summary[service_type] += 1
+        def build():
+            resources = []
+            for (scope, service_type), cell in cell_resources.items():
+                if split_scope(scope)[1] == region:
+                    resources.extend(cell)
+            
+            # Add S3 buckets for the specific region
+            for (scope, service_type), cell in cell_resources.items():
+                if split_scope(scope)[1] == GLOBAL_REGION:
+                    resources.extend(bucket for bucket in cell if bucket['region'] == region)
+            
+            response = {
+                'region': region,
+                'resources': resources,
+                'total_count': len(resources),
+                'service_summary': count_services(cell_resources, versions, {region})
+            }
+            if response_format == 'columnar':
+                response['format'] = 'columnar'
+                response['resources'] = encode_columnar(resources)
+            return response
         
-        return jsonify({
-            'region': region,
-            'resources': resources,
-            'total_count': len(resources),
-            'service_summary': service_summary,
-            'timestamp': datetime.now().isoformat()
+        return conditional_response(versions, cache_info, build)
+        
+    except no_credentials_error():
+        return jsonify({'error': 'AWS credentials not configured'}), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@aws_bp.route('/export', methods=['GET'])
+def export_inventory():
+    """Stream the whole inventory as CSV (the default) or NDJSON"""
+    try:
+        deadline = get_deadline()
+        regions = get_all_regions()
+        if not regions:
+            return jsonify({'error': 'No regions available'}), 500
+        
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in ('csv', 'ndjson'):
+            return jsonify({'error': f'Unknown export format: {export_format}'}), 400
+        try:
+            regions, service_types, selected_regions = parse_selection(request.args, regions)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        query = parse_query(request.args) if has_filters(request.args) else None
+        tag_keys = parse_tag_columns(request.args.get('tag_columns', current_app.config.get('EXPORT_TAG_COLUMNS', 'Name')))
+        
+        rows = export_rows(regions, get_cache_ttl(), tag_keys, service_types, selected_regions, query, deadline)
+        chunks = export_chunks(export_format, rows, service_types, tag_keys)
+        filename = f"inventory-{datetime.now().strftime('%Y%m%dT%H%M%S')}.{export_format}"
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
         })
         
-    except NoCredentialsError:
+    except no_credentials_error():
+        return jsonify({'error': 'AWS credentials not configured'}), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@aws_bp.cli.command('export')
+@click.option('--format', 'export_format', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-', help='File to write, or - for stdout')
+@click.option('--regions', default=None, help='Comma-separated regions (default: all)')
+@click.option('--services', default=None, help='Comma-separated service types (default: all)')
+@click.option('--tag-columns', default=None, help='Comma-separated tag keys to export as columns (default: EXPORT_TAG_COLUMNS)')
+@click.option('--max-age', type=int, default=None, help='Seconds a snapshot is exported before it is rescanned (default: SCAN_CACHE_TTL)')
+def export_command(export_format, output, regions, services, tag_columns, max_age):
+    """Write the whole inventory to a CSV or NDJSON file, streaming it cell by cell"""
+    all_regions = get_all_regions()
+    if not all_regions:
+        raise click.ClickException('No regions available')
+    try:
+        all_regions, service_types, selected_regions = parse_selection({'regions': regions, 'services': services}, all_regions)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if max_age is None:
+        max_age = current_app.config.get('SCAN_CACHE_TTL', 300)
+    tag_keys = parse_tag_columns(tag_columns if tag_columns is not None else current_app.config.get('EXPORT_TAG_COLUMNS', 'Name'))
+    
+    cache_info = {}
+    exported = 0
+    
+    def counted(rows):
+        nonlocal exported
+        for row in rows:
+            exported += 1
+            yield row
+    
+    rows = counted(export_rows(all_regions, max_age, tag_keys, service_types, selected_regions, cache_info=cache_info))
+    with click.open_file(output, 'wb') as f:
+        for chunk in export_chunks(export_format, rows, service_types, tag_keys):
+            f.write(chunk.encode('utf-8'))
+    
+    click.echo(f"Exported {exported} resources from {cache_info.get('cached_cells', 0) + cache_info.get('scanned_cells', 0)} cells", err=True)
+    for cell in cache_info.get('stale_cells', []) + cache_info.get('missing_cells', []):
+        click.echo(f"Warning: {cell['service_type']} in {cell['region']} is {cell['reason']}", err=True)
+
+def lookup_sns_topic(region, resource_id, role_arn=None):
+    """Describe a single SNS topic by name or ARN"""
+    topic_arn = resource_id
+    if not topic_arn.startswith('arn:'):
+        account_id = detail_fetcher.cached(('STS', role_arn, 'account_id'), lambda: client_pool.get_client('sts', region, role_arn=role_arn).get_caller_identity()['Account'])
+        partition = 'aws-cn' if region.startswith('cn-') else 'aws-us-gov' if region.startswith('us-gov-') else 'aws'
+        topic_arn = f"arn:{partition}:sns:{region}:{account_id}:{resource_id}"
+    spec = SERVICE_SPECS['SNS']
+    return describe_resource(spec, spec.get_client(region, role_arn), {'TopicArn': topic_arn}, region, role_arn)
+
+def lookup_sqs_queue(region, resource_id, role_arn=None):
+    """Describe a single SQS queue by name or URL"""
+    spec = SERVICE_SPECS['SQS']
+    sqs = spec.get_client(region, role_arn)
+    queue_url = resource_id
+    if not queue_url.startswith('https://'):
+        queue_url = sqs.get_queue_url(QueueName=resource_id)['QueueUrl']
+    return describe_resource(spec, sqs, {'QueueUrl': queue_url}, region, role_arn)
+
+def lookup_dynamodb_table(region, resource_id, role_arn=None):
+    """Describe a single DynamoDB table by name"""
+    spec = SERVICE_SPECS['DynamoDB']
+    return describe_resource(spec, spec.get_client(region, role_arn), {'TableName': resource_id}, region, role_arn)
+
+# On-demand detail lookups for resources whose details list-only scans defer
+DETAIL_LOOKUPS = {
+    'SNS': lookup_sns_topic,
+    'SQS': lookup_sqs_queue,
+    'DynamoDB': lookup_dynamodb_table
+}
+
+def topology_node(node, depth):
+    """Describe a topology node, with the resource's type, name and state when it is inventoried"""
+    cell, resource_id = node
+    resource = inventory_index.find(cell, resource_id)
+    info = dict(cell_info(cell), key=node_key(node), resource_id=resource_id, depth=depth, inventoried=resource is not None)
+    if resource is not None:
+        info.update({
+            'region': resource.get('region', info['region']),
+            'resource_type': resource.get('resource_type'),
+            'name': resource.get('name'),
+            'state': resource.get('state')
+        })
+    return info
+
+@aws_bp.route('/topology/<path:resource_id>', methods=['GET'])
+def get_topology(resource_id):
+    """Get the resources linked to a resource, up to ?depth= hops away (default 1)"""
+    try:
+        deadline = get_deadline()
+        regions = get_all_regions()
+        if not regions:
+            return jsonify({'error': 'No regions available'}), 500
+        
+        try:
+            regions, service_types, _ = parse_selection(request.args, regions)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        depth = max(0, min(request.args.get('depth', 1, type=int), MAX_DEPTH))
+        
+        cache_info = {}
+        versions = {}
+        cells = [cell for cell, _ in iter_inventory(regions, get_cache_ttl(), cache_info, deadline=deadline, versions=versions)]
+        
+        started = time.perf_counter()
+        roots = {(cell, resource_id) for cell in cells if (service_types is None or cell[1] in service_types) and inventory_index.find(cell, resource_id) is not None}
+        if service_types is None:
+            # Linked resources that are not inventoried themselves, such as subnets
+            roots.update(node for node in topology_index.nodes_with_id(resource_id) if split_scope(node[0][0])[1] in regions)
+        if not roots:
+            return jsonify({'error': f'Resource {resource_id} not found'}), 404
+        levels, edges, truncated = topology_index.traverse(roots, depth)
+        traversal_ms = (time.perf_counter() - started) * 1000
+        
+        return conditional_response(versions, cache_info, lambda: {
+            'resource_id': resource_id,
+            'depth': depth,
+            'nodes': [topology_node(node, level) for node, level in sorted(levels.items(), key=lambda item: (item[1], node_key(item[0])))],
+            'edges': [
+                {'source': node_key(source), 'relation': relation, 'target': node_key(target)}
+                for source, relation, target in sorted(edges, key=lambda edge: (node_key(edge[0]), edge[1], node_key(edge[2])))
+            ],
+            'truncated': truncated
+        }, request_fields={'traversal_ms': round(traversal_ms, 3)})
+        
+    except no_credentials_error():
+        return jsonify({'error': 'AWS credentials not configured'}), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@aws_bp.route('/resources/<service_type>/<path:resource_id>', methods=['GET'])
+def get_resource_details(service_type, resource_id):
+    """Get the full details of a single resource"""
+    try:
+        lookup = DETAIL_LOOKUPS.get(service_type)
+        if lookup is None:
+            return jsonify({'error': f'Detail lookup not supported for {service_type}'}), 404
+        
+        region = request.args.get('region')
+        if not region:
+            return jsonify({'error': 'region query parameter is required'}), 400
+        
+        # In multi-account mode, ?account_id= picks the account's role
+        role_arn = None
+        account_id = request.args.get('account_id')
+        if account_id:
+            role_arn = dict(account_scanner.accounts).get(account_id)
+            if role_arn is None:
+                return jsonify({'error': f'Unknown account: {account_id}'}), 400
+        
+        resource = lookup(region, resource_id, role_arn)
+        if resource is None:
+            return jsonify({'error': f'{service_type} resource {resource_id} not found in {region}'}), 404
+        if account_id:
+            resource['account_id'] = account_id
+        
+        return jsonify({'resource': resource, 'timestamp': datetime.now().isoformat()})
+        
+    except no_credentials_error():
         return jsonify({'error': 'AWS credentials not configured'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -477,60 +1138,142 @@ def get_services_summary():
         if not regions:
             return jsonify({'error': 'No regions available'}), 500
         
-        region_summary = {}
+        try:
+            regions, service_types, _ = parse_selection(request.args, regions)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        versions = {}
+        counts, cache_info = summarize_inventory(regions, get_cache_ttl(), service_types, versions)
+        
+        region_summary = {
+            region: {'total_resources': 0, 'service_counts': {}, 'state_counts': {}}
+            for region in regions
+        }
+        for (region, service_type, state), count in counts.items():
+            summary = region_summary.get(region)
+            if summary is None:
+                continue
+            summary['total_resources'] += count
+            summary['service_counts'][service_type] = summary['service_counts'].get(service_type, 0) + count
+            service_states = summary['state_counts'].setdefault(service_type, {})
+            service_states[state] = service_states.get(state, 0) + count
+        
+        return conditional_response(versions, cache_info, lambda: {
+            'region_summary': region_summary,
+            'total_regions': len(regions)
+        })
+        
+    except no_credentials_error():
+        return jsonify({'error': 'AWS credentials not configured'}), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@aws_bp.route('/services/changes', methods=['GET'])
+def get_service_changes():
+    """Get the resources added, removed or modified since a snapshot ID"""
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'error': 'since query parameter is required'}), 400
+        
+        deadline = get_deadline()
+        regions = get_all_regions()
+        if not regions:
+            return jsonify({'error': 'No regions available'}), 500
+        
+        try:
+            regions, service_types, selected_regions = parse_selection(request.args, regions)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        versions = {}
+        cell_resources, cache_info = get_inventory(regions, get_cache_ttl(), service_types=service_types, deadline=deadline, versions=versions)
+        changed = sorted(cell for cell, version in versions.items() if version > since)
+        baselines = snapshots_as_of(changed, since)
         
-        # Scan all regions in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_region = {executor.submit(scan_region, region): region for region in regions}
+        added = []
+        removed = []
+        modified = []
+        resync_cells = []
+        for cell in changed:
+            resources = cell_resources[cell]
+            hashes = inventory_index.get_hashes(cell, versions[cell]) or resource_hashes(resources)
+            baseline = baselines.get(cell)
+            if baseline is None:
+                resync_cells.append(cell_info(cell))
+            old_resources = baseline.get_resources() if baseline is not None else []
             
-            for future in concurrent.futures.as_completed(future_to_region):
-                region = future_to_region[future]
-                try:
-                    region_resources = future.result()
-                    
-                    service_counts = {}
-                    for resource in region_resources:
-                        service_type = resource['service_type']
-                        if service_type not in service_counts:
-                            service_counts[service_type] = 0
-                        service_counts[service_type] += 1
-                    
-                    region_summary[region] = {
-                        'total_resources': len(region_resources),
-                        'service_counts': service_counts
-                    }
-                except Exception as e:
-                    print(f"Error scanning region {region}: {str(e)}")
-                    region_summary[region] = {
-                        'total_resources': 0,
-                        'service_counts': {},
-                        'error': str(e)
-                    }
-        
-        # Add S3 summary (global)
-        s3_buckets = scan_s3_buckets()
-        s3_by_region = {}
-        for bucket in s3_buckets:
-            region = bucket['region']
-            if region not in s3_by_region:
-                s3_by_region[region] = 0
-            s3_by_region[region] += 1
-        
-        # Add S3 counts to region summary
-        for region, count in s3_by_region.items():
-            if region in region_summary:
-                if 'S3' not in region_summary[region]['service_counts']:
-                    region_summary[region]['service_counts']['S3'] = 0
-                region_summary[region]['service_counts']['S3'] += count
-                region_summary[region]['total_resources'] += count
+            cell_added, cell_removed, cell_modified = diff_resources(old_resources, resources, hashes)
+            added.extend(dict(resource, content_hash=hashes[resource_key(resource)])
+                         for resource in select_resources(cell, cell_added, selected_regions))
+            modified.extend(dict(resource, content_hash=hashes[resource_key(resource)])
+                            for resource in select_resources(cell, cell_modified, selected_regions))
+            removed.extend({
+                key: resource[key]
+                for key in ('account_id', 'region', 'service_type', 'resource_type', 'resource_id')
+                if key in resource
+            } for resource in select_resources(cell, cell_removed, selected_regions))
+        
+        return conditional_response(versions, cache_info, lambda: {
+            'since': since,
+            'added': added,
+            'removed': removed,
+            'modified': modified,
+            'resync_cells': resync_cells,
+            'changed_cells': len(changed)
+        }, request_fields={'snapshot_id': max(since, cache_info['snapshot_id'])})
+        
+    except no_credentials_error():
+        return jsonify({'error': 'AWS credentials not configured'}), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@aws_bp.route('/history', methods=['GET'])
+def get_history():
+    """Get resource counts per (region, service, state) over time from the history rollups"""
+    try:
+        try:
+            end = parse_time(request.args.get('end')) or datetime.now()
+            start = parse_time(request.args.get('start')) or end - timedelta(days=7)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time: {str(e)}'}), 400
+        if start >= end:
+            return jsonify({'error': 'start must be before end'}), 400
+        
+        granularity = request.args.get('granularity', '').lower()
+        if not granularity:
+            granularity = next((name for span, name in HISTORY_DEFAULT_GRANULARITY if end - start <= span), 'week')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f'Unknown granularity: {granularity}'}), 400
+        
+        service_types = split_param(request.args.get('services'))
+        if service_types:
+            unknown = sorted(service_types - set(SERVICE_SPECS))
+            if unknown:
+                return jsonify({'error': f"Unknown services: {', '.join(unknown)}"}), 400
+        
+        group_by = split_param(request.args.get('group_by')) or {'region', 'service', 'state'}
+        unknown = sorted(group_by - set(HISTORY_GROUP_COLUMNS))
+        if unknown:
+            return jsonify({'error': f"Unknown group_by: {', '.join(unknown)}"}), 400
+        columns = [column for name, column in HISTORY_GROUP_COLUMNS.items() if name in group_by]
+        
+        started = time.perf_counter()
+        rows = query_rollups(granularity, start, end, columns, service_types,
+                             split_param(request.args.get('regions')), split_param(request.args.get('states')))
+        series = history_series(rows, columns)
+        query_ms = (time.perf_counter() - started) * 1000
         
         return jsonify({
-            'region_summary': region_summary,
-            'total_regions': len(regions),
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'series': series,
+            'retention_days': history_recorder.retention_days,
+            'query_ms': round(query_ms, 2),
             'timestamp': datetime.now().isoformat()
         })
         
-    except NoCredentialsError:
-        return jsonify({'error': 'AWS credentials not configured'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
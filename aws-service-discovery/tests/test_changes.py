@@ -0,0 +1,64 @@
+"""Change feed cursors against the synthetic account from benchmarks/fake_aws.py"""
+import gzip
+import json
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pytest
+from flask import Flask
+from src.models.snapshot import init_database
+from src.models.user import db
+from src.routes.aws_services import aws_bp
+from src.discovery.clients import client_pool
+from src.discovery.pruning import pruner
+from src.discovery.wire import payload_cache
+from benchmarks.fake_aws import SyntheticAccount
+
+@pytest.fixture
+def client(tmp_path):
+    uninstall = SyntheticAccount(region_count=2, resources_per_cell=3).install(client_pool)
+    pruner.clear()
+    payload_cache.clear()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SCAN_CACHE_TTL'] = 3600
+    app.register_blueprint(aws_bp, url_prefix='/api')
+    db.init_app(app)
+    client_pool.init_app(app)
+    with app.app_context():
+        init_database()
+    yield app.test_client()
+    uninstall()
+
+def get_json(client, url, encoding=''):
+    response = client.get(url, headers={'Accept-Encoding': encoding})
+    body = response.get_data()
+    if response.headers.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+@pytest.mark.parametrize('encoding', ['', 'gzip'])
+def test_cursor_after_refresh_sees_no_changes(client, encoding):
+    get_json(client, '/api/services?refresh=true', encoding)
+    cursor = get_json(client, '/api/services', encoding)['cache']['snapshot_id']
+    assert cursor > 0
+
+    changes = get_json(client, f'/api/services/changes?since={cursor}', encoding)
+    assert changes['added'] == []
+    assert changes['removed'] == []
+    assert changes['modified'] == []
+    assert changes['changed_cells'] == 0
+    assert changes['snapshot_id'] == cursor
+
+def test_cached_body_gets_fresh_cache_block(client):
+    cold = client.get('/api/services?refresh=true').get_json()['cache']
+    first = client.get('/api/services').get_json()['cache']
+    second = client.get('/api/services').get_json()['cache']
+    assert cold['scanned_cells'] > 0
+    assert first['scanned_cells'] == second['scanned_cells'] == 0
+    assert first['cached_cells'] == second['cached_cells'] == cold['scanned_cells']